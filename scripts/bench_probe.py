@@ -0,0 +1,88 @@
+"""
+bench_probe.py
+
+Times decode_probe() against the decoder it replaced and checks that both produce the same Ffprobe.
+
+The old decoder lowercased the keys of the parsed JSON with rename_keys_to_lower() and built the dataclasses
+with from_union(), which raised and caught an AssertionError for every absent optional field. It is loaded
+from the git history, so the benchmark runs from any checkout that has that commit.
+
+The fixture probe.json is ffprobe's output for a 27 stream mkv: HEVC with HDR side data, 6 audio and 20
+subtitle tracks, all with mkvmerge statistics tags in mixed case.
+
+Usage:
+    python scripts/bench_probe.py [--probe FILE] [--baseline REV] [--number N]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import timeit
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from recode.modules.ffmpeg_utils import decode_probe  # noqa: E402
+
+# Last commit with the from_union() decoder
+BASELINE = "3da48f0"
+
+
+def rename_keys_to_lower(iterable):
+    # The baseline's key rewrite, as it was in ffmpeg_utils.py
+    if isinstance(iterable, dict):
+        for key in list(iterable.keys()):
+            iterable[key.lower()] = iterable.pop(key)
+            if isinstance(iterable[key.lower()], dict) or isinstance(iterable[key.lower()], list):
+                iterable[key.lower()] = rename_keys_to_lower(iterable[key.lower()])
+    elif isinstance(iterable, list):
+        for item in iterable:
+            item = rename_keys_to_lower(item)
+    return iterable
+
+
+def load_baseline(rev: str) -> types.ModuleType:
+    source = subprocess.run(
+        ["git", "-C", ROOT, "show", f"{rev}:src/recode/modules/datatypes.py"], capture_output=True, text=True, check=True
+    ).stdout
+    module = types.ModuleType("baseline_datatypes")
+    sys.modules[module.__name__] = module
+    exec(compile(source, f"{rev}:datatypes.py", "exec"), module.__dict__)
+    return module
+
+
+def best_time(decode, data: bytes, number: int) -> float:
+    return min(timeit.repeat(lambda: decode(data), number=number, repeat=5)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ffprobe JSON decoder")
+    parser.add_argument("--probe", default=os.path.join(ROOT, "scripts", "probe.json"), help="ffprobe -of json output to decode")
+    parser.add_argument("--baseline", default=BASELINE, help="git revision of the old decoder")
+    parser.add_argument("--number", type=int, default=2000, help="decodes per round, the best of 5 rounds counts")
+    args = parser.parse_args()
+
+    with open(args.probe, "rb") as f:
+        data = f.read()
+    baseline = load_baseline(args.baseline)
+
+    def decode_baseline(data: bytes):
+        return baseline.Ffprobe.from_dict(rename_keys_to_lower(json.loads(data)))
+
+    old = json.dumps(decode_baseline(data).to_dict(), default=str, sort_keys=True)
+    new = json.dumps(decode_probe(data).to_dict(), default=str, sort_keys=True)
+    if old != new:
+        sys.exit("to_dict() differs between the baseline and decode_probe()")
+
+    before = best_time(decode_baseline, data, args.number)
+    after = best_time(decode_probe, data, args.number)
+    print(f"{os.path.basename(args.probe)}: {len(data) / 1024:.0f} kB, to_dict() identical")
+    print(f"baseline:     {before * 1e3:.2f} ms per probe")
+    print(f"decode_probe: {after * 1e3:.2f} ms per probe ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
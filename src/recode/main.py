@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 
+import datetime
+import json
 import os
 import re
-import shutil
 import sys
-import tempfile
+import time
 
 from colorama import Fore as Color
 from colorama import Style
@@ -15,19 +16,36 @@ from recode.modules.api import (
     api_login,
     change_episode_number,
     change_season_type,
+    enable_subtitle_cache,
+    enable_tvdb_cache,
     get_episode,
-    get_movie_name,
     get_series_from_tvdb,
-    get_subtitles_from_ost,
     logout,
 )
 from recode.modules.audio import audio, recode_audio
+from recode.modules.chunked import ffrecode_chunked
+from recode.modules.crop import detect_crop, enable_crop_cache
 from recode.modules.datatypes import Dispositions, Stream, StreamTags
-from recode.modules.ffmpeg_utils import ffrecode, probe
+from recode.modules.encode_plan import EncodePlan
+from recode.modules.ffmpeg_utils import enable_probe_cache, ffrecode, probe
+from recode.modules.FileOperations import enable_hash_cache
+from recode.modules.fingerprints import open_fingerprint_index, record_fingerprint, report_duplicates, scan_fingerprints, skip_encoded_twins
+from recode.modules.httpclient import set_api_concurrency
+from recode.modules.inventory import INVENTORY_DB, query_inventory, scan_inventory
 from recode.modules.logger import logger
+from recode.modules.matroska import can_edit_in_place, edit_in_place
 from recode.modules.parse_arguments import parse_args
+from recode.modules.planner import Plan, plan_film, plan_series, resolve_film
+from recode.modules.processed import is_processed, open_processed_store, record_processed, settings_hash
+from recode.modules.progress import expect_jobs, format_timedelta, set_progress_mode, set_stage, tracked
+from recode.modules.quality import enable_quality_cache, tune_quality
+from recode.modules.scheduler import console_lock, print_summary, run_jobs
+from recode.modules.staging import staged, staged_source, start_staging, stop_staging
+from recode.modules.subprefetch import prefetched_subtitles, start_subtitle_prefetch, stop_subtitle_prefetch
 from recode.modules.subs import subtitles
-from recode.modules.video import video
+from recode.modules.tempfiles import discard, move_file, publish, recover_orphans, temp_output
+from recode.modules.throughput import batch_duration, longest_first, open_throughput_model, predict_jobs, record_encode
+from recode.modules.video import video, video_encoder
 
 colorama_init()
 
@@ -39,93 +57,6 @@ else:
     HWACC = None
 
 
-def recode_series(
-    folder: str,
-    apitokens: APITokens | None,
-    lang: str,
-    infolang: str,
-    sublang: str,
-    *,
-    subdir: str = "",
-    codec: str = "h265",
-    bit: int = 10,
-    output: str = "",
-    copy: bool = False,
-    searchstring: str | None = None,
-    omit_cover: bool = False,
-    subselector: str | None = None,
-    copy_streams: bool = False,
-    dump_command: bool = False,
-):
-    logger.info("Starting series recode process", extra={"folder": folder})
-    if apitokens is None:
-        logger.info("No API tokens provided")
-        apitokens = APITokens(thetvdb=None, opensub={"api_key": None, "token": None})
-    series = os.path.basename(folder)
-    parentfolder = output if output != "" else os.path.realpath(folder).removesuffix(f"/{series}")
-    logger.info("Series info", extra={"series": series, "parent_folder": parentfolder})
-    seriesobj, seriesname, year = get_series_from_tvdb(series, apitokens["thetvdb"], lang=infolang, searchstring=searchstring)
-    if seriesobj is None:
-        logger.error("Failed to retrieve series info", extra={"series": series})
-        return
-    if year != "":
-        series = f"{seriesname} ({year})"
-    else:
-        series = seriesname
-    logger.info("Processing series", extra={"series": series})
-    for dire in sorted(os.listdir(folder)):
-        if os.path.isdir(os.path.join(folder, dire)):
-            for file in sorted(os.listdir(os.path.realpath(os.path.join(folder, dire)))):
-                logger.info("Processing file", extra={"file": file})
-                season, name, metadata = get_episode(series, file, seriesobj)
-                if name is not None and season is not None:
-                    if not os.path.exists(os.path.join(parentfolder, series, season)):
-                        logger.info("Creating directory", extra={"path": os.path.join(parentfolder, series, season)})
-                        os.makedirs(os.path.join(parentfolder, series, season))
-                    logger.info("Recoding episode", extra={"episode": name})
-                    recode(
-                        file=os.path.join(folder, dire, file),
-                        path=os.path.join(parentfolder, series, season, name),
-                        metadata=metadata,
-                        lang=lang,
-                        infolang=infolang,
-                        sublang=sublang,
-                        apitokens=apitokens,
-                        subdir=subdir,
-                        codec=codec,
-                        bit=bit,
-                        output=output,
-                        copy=copy,
-                        omit_cover=omit_cover,
-                        subselector=subselector,
-                        copy_streams=copy_streams,
-                        dump_command=dump_command,
-                    )
-        else:
-            season, name, metadata = get_episode(series, dire, seriesobj)
-            if name is not None and season is not None:
-                if not os.path.exists(os.path.join(parentfolder, series, season)):
-                    os.makedirs(os.path.join(parentfolder, series, season))
-                recode(
-                    file=os.path.join(os.path.realpath(folder), dire),
-                    path=os.path.join(parentfolder, series, season, name),
-                    metadata=metadata,
-                    lang=lang,
-                    infolang=infolang,
-                    sublang=sublang,
-                    apitokens=apitokens,
-                    subdir=subdir,
-                    codec=codec,
-                    bit=bit,
-                    output=output,
-                    copy=copy,
-                    omit_cover=omit_cover,
-                    subselector=subselector,
-                    copy_streams=copy_streams,
-                    dump_command=dump_command,
-                )
-
-
 def recode(
     file: str,
     lang: str,
@@ -146,7 +77,14 @@ def recode(
     subselector: str | None = None,
     copy_streams: bool = False,
     dump_command: bool = False,
-):
+    chunk_workers: int = 0,
+    chunk_length: int = 120,
+    scratch: str | None = None,
+    dry_run: bool = False,
+    crop: bool = False,
+    target_quality: float | None = None,
+    quality_metric: str = "vmaf",
+) -> str:
     logger.info("Recode parameters", extra={"codec": codec, "bit": bit, "type": stype, "copy": copy, "omit_cover": omit_cover})
     prelines = []
     midlines = []
@@ -184,20 +122,40 @@ def recode(
     changemetadata = False
 
     subfile = ""
+    ostfile = None
     pix_fmt = ""
 
     if apitokens is None:
         logger.debug("No API tokens provided, using None tokens")
         apitokens = APITokens(thetvdb=None, opensub={"api_key": None, "token": None})
 
+    settings = settings_hash(
+        {
+            "codec": codec,
+            "bit": bit,
+            "lang": lang,
+            "infolang": infolang,
+            "sublang": sublang,
+            "subselector": subselector,
+            "omit_cover": omit_cover,
+            "copy": copy,
+            "copy_streams": copy_streams,
+            "crop": crop,
+            "target_quality": target_quality,
+            "quality_metric": quality_metric,
+        }
+    )
+    if output == "" and is_processed(file, settings):
+        logger.info("File already processed", extra={"file": file})
+        print(f"{Color.BLUE}Already processed: {Color.GREEN}{file}{Style.RESET_ALL}")
+        return "unchanged"
+
     if path is None:
         logger.info("Getting movie name", extra={"file": file})
-        output_file, metadata = get_movie_name(file, apitokens["thetvdb"], lang=infolang, stype=stype, searchstring=searchstring)
+        output_file, metadata = resolve_film(file, apitokens["thetvdb"], infolang, stype=stype, searchstring=searchstring, output=output)
         if output_file is None:
             logger.warning("Could not determine output filename", extra={"file": file})
-            return
-        output_dir = output if output != "" else os.path.realpath(file).removesuffix(file)
-        output_file = os.path.join(output_dir, output_file)
+            return "skipped"
     else:
         output_file = path
 
@@ -213,12 +171,14 @@ def recode(
         f"{Color.RED}Recoding{Style.RESET_ALL} {Color.YELLOW}{os.path.realpath(file)}{Style.RESET_ALL} to {Color.MAGENTA}{os.path.realpath(output_file)}{Style.RESET_ALL}"
     )
 
+    set_stage("probe")
     ffprobe = probe(os.path.realpath(file))
+    set_stage("plan")
 
     if ffprobe.streams is None:
         logger.error("File has no streams", extra={"file": file})
         print(f"Error: {file} has no streams")
-        return
+        return "error"
 
     logger.info("Probing file", extra={"ffprobe": ffprobe.to_dict()})
 
@@ -257,6 +217,13 @@ def recode(
             vrecoding, vindex, pix_fmt = video(
                 stream, ffmpeg_mapping, ffmpeg_recoding, vrecoding, vindex, printlines, dispositions, HWACC, codec, bit, copy
             )
+            if crop and video_encoder(stream, HWACC, codec, bit, copy) is not None:
+                area = detect_crop(os.path.realpath(file), ffprobe, stream)
+                if area is not None:
+                    ffmpeg_recoding.extend([f"-filter:v:{vindex - 1}", area.filter()])
+                    printlines.append(
+                        f"Cropping {Color.GREEN}video{Style.RESET_ALL} stream {Color.BLUE}0:{stream.index}{Style.RESET_ALL} from {Color.YELLOW}{stream.width}x{stream.height}{Style.RESET_ALL} to {Color.YELLOW}{area.width}x{area.height}{Style.RESET_ALL}"
+                    )
 
     for stream in audiostreams:
         if stream.tags is None:
@@ -321,9 +288,9 @@ def recode(
         elif subdir != "" and os.path.isfile(subdir):
             subfile = [subdir]
         else:
-            subfil = get_subtitles_from_ost(token=apitokens["opensub"], metadata=metadata, lang=sublang, file=file)
-            if subfil is not None:
-                subfile = [subfil]
+            ostfile = prefetched_subtitles(token=apitokens["opensub"], metadata=metadata, lang=sublang, file=file)
+            if ostfile is not None:
+                subfile = [ostfile]
         try:
             for fil in subfile:
                 sub = probe(os.path.realpath(fil))
@@ -503,26 +470,8 @@ def recode(
     ):
         logger.info("No changes needed", extra={"file": file})
         print(f"{Color.RED}No changes to make: {Color.GREEN}{file} {Color.BLUE}Continuing...{Style.RESET_ALL}")
-        return
-    if (
-        os.path.realpath(file) != os.path.realpath(output_file)
-        and not vrecoding
-        and not arecoding
-        and not changedefault
-        and not changemetadata
-    ):
-        logger.info("Moving file", extra={"from": file, "to": os.path.realpath(output_file)})
-        print(
-            f"{Color.RED}Moving{Style.RESET_ALL} {Color.YELLOW}{file}{Style.RESET_ALL} to {Color.MAGENTA}{os.path.realpath(output_file)}{Style.RESET_ALL}"
-        )
-        shutil.move(os.path.realpath(file), os.path.realpath(output_file))
-        return
-
-    if changemetadata:
-        printlines.append(f"{Color.LIGHTBLACK_EX}|------------------------------------------------------------------{Style.RESET_ALL}")
-
-    _, tmpfile = tempfile.mkstemp(suffix=".mkv")
-    logger.info("Created temporary file", extra={"tmpfile": tmpfile})
+        record_processed(file, settings, "unchanged")
+        return "unchanged"
 
     if vrecoding:
         logger.info("Setting up video recoding parameters")
@@ -565,49 +514,122 @@ def recode(
                     ffmpeg_recoding.extend([f"-b:a:{idx}", "256k", f"-filter:a:{idx}", "channelmap=channel_layout=5.1"])
                 elif chn == 8:
                     ffmpeg_recoding.extend([f"-b:a:{idx}", "450k", f"-filter:a:{idx}", "channelmap=channel_layout=7.1"])
-    for line in prelines:
-        print(line)
-    for line in midlines:
-        print(line)
-    for line in printlines:
-        print(line)
+    plan = EncodePlan.from_args(ffprobe, ffmpeg_mapping, ffmpeg_recoding, ffmpeg_dispositions, ffmpeg_metadata, additional_files)
+    logger.info("Encode plan", extra={"plan": plan.to_dict(), "digest": plan.digest()})
+    if dry_run:
+        with console_lock:
+            for line in prelines + midlines + printlines:
+                print(line)
+            print(json.dumps({"file": os.path.realpath(file), "output": os.path.realpath(output_file), "plan": plan.to_dict()}))
+        return "planned"
 
-    try:
-        completed = ffrecode(
-            os.path.realpath(file),
-            tmpfile,
-            ffmpeg_mapping,
-            ffmpeg_recoding,
-            ffmpeg_dispositions,
-            ffmpeg_metadata,
-            additional_files,
-            dump_command,
+    os.makedirs(os.path.dirname(os.path.realpath(output_file)), exist_ok=True)
+
+    if (
+        os.path.realpath(file) != os.path.realpath(output_file)
+        and not vrecoding
+        and not arecoding
+        and not changedefault
+        and not changemetadata
+    ):
+        logger.info("Moving file", extra={"from": file, "to": os.path.realpath(output_file)})
+        set_stage("move")
+        print(
+            f"{Color.RED}Moving{Style.RESET_ALL} {Color.YELLOW}{file}{Style.RESET_ALL} to {Color.MAGENTA}{os.path.realpath(output_file)}{Style.RESET_ALL}"
         )
+        move_file(os.path.realpath(file), os.path.realpath(output_file))
+        record_processed(output_file, settings, "moved")
+        return "moved"
+
+    if changemetadata:
+        printlines.append(f"{Color.LIGHTBLACK_EX}|------------------------------------------------------------------{Style.RESET_ALL}")
+
+    if copy_streams and output == "" and not vrecoding and not arecoding and can_edit_in_place(ffprobe, plan):
+        with console_lock:
+            for line in prelines + midlines + printlines:
+                print(line)
+        if edit_in_place(os.path.realpath(file), ffprobe, plan):
+            print(f"{Color.GREEN}Edited header in place{Style.RESET_ALL}")
+            if os.path.realpath(file) != os.path.realpath(output_file):
+                set_stage("move")
+                print(
+                    f"{Color.RED}Moving{Style.RESET_ALL} {Color.YELLOW}{file}{Style.RESET_ALL} to {Color.MAGENTA}{output_file}{Style.RESET_ALL}"
+                )
+                move_file(os.path.realpath(file), os.path.realpath(output_file))
+            record_processed(output_file, settings, "done")
+            print(f"{Color.GREEN}Done!{Style.RESET_ALL}")
+            return "done"
+        print(f"{Color.YELLOW}Header does not fit, remuxing{Style.RESET_ALL}")
+        prelines, midlines, printlines = [], [], []
+
+    recodedvideo = plan.encoded("v")
+    if target_quality is not None and len(recodedvideo) == 1 and recodedvideo[0].input == 0:
+        set_stage("tune")
+        logger.info("Searching quality", extra={"target": target_quality, "metric": quality_metric})
+        tuned = tune_quality(os.path.realpath(file), ffprobe, plan, recodedvideo[0], target_quality, quality_metric, scratch)
+        for line in plan.diff(tuned):
+            printlines.append(
+                f"Quality search for {Color.GREEN}{quality_metric.upper()} {target_quality}{Style.RESET_ALL}: {Color.YELLOW}{line}{Style.RESET_ALL}"
+            )
+        plan = tuned
+
+    recover_orphans(scratch or os.path.dirname(os.path.realpath(output_file)))
+    tmpfile = temp_output(output_file, scratch)
+
+    with console_lock:
+        for line in prelines:
+            print(line)
+        for line in midlines:
+            print(line)
+        for line in printlines:
+            print(line)
+
+    set_stage("stage")
+    source = staged_source(file)
+    set_stage("encode")
+    duration = float(ffprobe.format.duration) if ffprobe.format.duration is not None else None
+    try:
+        if chunk_workers > 1 and len(recodedvideo) == 1:
+            logger.info("Using chunked recoding", extra={"workers": chunk_workers, "length": chunk_length})
+            completed = ffrecode_chunked(
+                source,
+                tmpfile,
+                plan,
+                recodedvideo[0],
+                workers=chunk_workers,
+                length=chunk_length,
+                scratch=scratch,
+                dump_command=dump_command,
+                duration=duration,
+                source_file=os.path.realpath(file),
+            )
+        else:
+            start = time.monotonic()
+            completed = ffrecode(source, tmpfile, plan, dump_command, duration=duration)
+            if completed and len(recodedvideo) == 1 and recodedvideo[0].input == 0 and recodedvideo[0].codec is not None:
+                record_encode(ffprobe, recodedvideo[0].index, recodedvideo[0].codec, codec, bit, time.monotonic() - start)
         if not completed:
             print(f"{Color.RED}Recoding failed, skipping moving file.{Style.RESET_ALL}")
-            if os.path.exists(tmpfile):
-                os.remove(tmpfile)
-            return
+            return "failed"
 
+        set_stage("move")
         if output == "":
             # Rename old file
-            shutil.move(os.path.realpath(file), os.path.realpath(file) + ".old")
+            move_file(os.path.realpath(file), os.path.realpath(file) + ".old")
 
         # Move tempfile to output_file
         print(
             f"{Color.RED}Moving{Style.RESET_ALL} {Color.YELLOW}tempfile{Style.RESET_ALL} to {Color.MAGENTA}{output_file}{Style.RESET_ALL}"
         )
-        try:
-            shutil.move(tmpfile, output_file)
-            os.chmod(output_file, 0o644)
-        finally:
-            if os.path.exists(tmpfile):
-                os.remove(tmpfile)
+        publish(tmpfile, output_file)
+        record_processed(output_file, settings, "done")
+        record_fingerprint(output_file)
     finally:
-        if isinstance(subfile, str):
-            if os.path.exists(subfile):
-                os.remove(subfile)
+        discard(tmpfile)
+        if ostfile is not None:
+            discard(ostfile)
     print(f"{Color.GREEN}Done!{Style.RESET_ALL}")
+    return "done"
 
 
 def main():
@@ -631,6 +653,41 @@ def main():
         logger.info("Hardware acceleration disabled")
         HWACC = None
 
+    enable_probe_cache(not args.noprobecache)
+    enable_crop_cache(not args.nocropcache)
+    enable_quality_cache()
+    enable_hash_cache()
+    set_api_concurrency(args.apiconcurrency)
+    set_progress_mode(args.progress)
+    enable_tvdb_cache(not args.notvdbcache)
+    enable_subtitle_cache(not args.nosubtitlecache)
+
+    if args.contentype == "inventory":
+        db = args.inventorydb or INVENTORY_DB
+        workers = args.jobs if args.jobs > 1 else os.cpu_count() or 4
+        if args.inputdir:
+            if not os.path.isdir(args.inputdir):
+                logger.error("Input directory not found", extra={"directory": args.inputdir})
+                raise FileNotFoundError(f'Directory "{args.inputdir}" does not exist')
+            scan_inventory(args.inputdir, db, workers=workers)
+        elif args.where is None:
+            scan_inventory(os.getcwd(), db, workers=workers)
+        if args.where is not None:
+            query_inventory(args.where, db)
+        logger.info("Completed universal-ffmpeg-recoder")
+        return
+
+    if args.contentype == "duplicates":
+        root = args.inputdir or os.getcwd()
+        if not os.path.isdir(root):
+            logger.error("Input directory not found", extra={"directory": root})
+            raise FileNotFoundError(f'Directory "{root}" does not exist')
+        open_fingerprint_index()
+        scan_fingerprints(root, workers=args.jobs if args.jobs > 1 else os.cpu_count() or 4)
+        report_duplicates(root, args.codec)
+        logger.info("Completed universal-ffmpeg-recoder")
+        return
+
     if not args.apis:
         logger.info("Logging in to APIs")
         apitokens = api_login(configpath)
@@ -653,55 +710,71 @@ def main():
     if args.onlymetadata:
         args.copy = True
 
-    if args.contentype == "film":
+    options = {
+        "lang": args.lang,
+        "infolang": infolang,
+        "sublang": sublang,
+        "subdir": args.subdir,
+        "codec": args.codec,
+        "bit": int(args.bit),
+        "output": args.output,
+        "copy": args.copy,
+        "omit_cover": args.omitcover,
+        "subselector": args.subselector,
+        "copy_streams": args.onlymetadata,
+        "dump_command": args.dumpcommand,
+        "chunk_workers": args.chunkworkers,
+        "chunk_length": args.chunklength,
+        "scratch": args.scratch,
+        "dry_run": args.dryrun,
+        "crop": args.crop,
+        "target_quality": args.targetquality,
+        "quality_metric": args.qualitymetric,
+    }
+    plan = None
+    open_processed_store(rescan=args.rescan)
+    open_throughput_model()
+    if args.skiptwins:
+        open_fingerprint_index()
+    settings = settings_hash(options)
+
+    if args.loadplan:
+        plan = Plan.load(args.loadplan)
+    elif args.contentype is None:
+        error = "type required unless a plan is loaded"
+        logger.error(error)
+        print("error: type required unless a plan is loaded")
+        sys.exit()
+    elif args.contentype == "film":
         logger.info("Processing film content")
+        plan = Plan(options=options)
         if args.inputfile:
             if os.path.isfile(args.inputfile):
-                logger.info("Recoding single film file", extra={"file": args.inputfile})
-                recode(
-                    file=args.inputfile,
-                    apitokens=apitokens,
-                    lang=args.lang,
-                    infolang=infolang,
-                    sublang=sublang,
-                    subdir=args.subdir,
-                    codec=args.codec,
-                    bit=int(args.bit),
-                    stype="single",
-                    output=args.output,
-                    copy=args.copy,
-                    searchstring=args.searchstring,
-                    omit_cover=args.omitcover,
-                    subselector=args.subselector,
-                    copy_streams=args.onlymetadata,
-                    dump_command=args.dumpcommand,
+                logger.info("Planning single film file", extra={"file": args.inputfile})
+                job = plan_film(
+                    args.inputfile, apitokens["thetvdb"], infolang, output=args.output, searchstring=args.searchstring, settings=settings
                 )
+                if job is not None:
+                    plan.jobs.append(job)
             else:
                 error = f'File "{args.inputfile}" does not exist or is a directory.'
                 logger.error("File not found", extra={"file": args.inputfile})
                 raise FileNotFoundError(error)
         elif args.inputdir:
             if os.path.isdir(args.inputdir):
-                logger.info("Recoding multiple film files", extra={"directory": args.inputdir})
-                for subdir in os.listdir(args.inputdir):
-                    recode(
-                        file=subdir,
-                        apitokens=apitokens,
-                        lang=args.lang,
-                        infolang=infolang,
-                        sublang=sublang,
-                        subdir=args.subdir,
-                        codec=args.codec,
-                        bit=int(args.bit),
-                        stype="multi",
+                logger.info("Planning multiple film files", extra={"directory": args.inputdir})
+                for film in sorted(os.listdir(args.inputdir)):
+                    job = plan_film(
+                        os.path.join(args.inputdir, film),
+                        apitokens["thetvdb"],
+                        infolang,
                         output=args.output,
-                        copy=args.copy,
+                        stype="multi",
                         searchstring=args.searchstring,
-                        omit_cover=args.omitcover,
-                        subselector=args.subselector,
-                        copy_streams=args.onlymetadata,
-                        dump_command=args.dumpcommand,
+                        settings=settings,
                     )
+                    if job is not None:
+                        plan.jobs.append(job)
             else:
                 error = f'Directory "{args.inputdir}" does not exist'
                 logger.error("Input directory not found", extra={"directory": args.inputdir})
@@ -713,26 +786,20 @@ def main():
             sys.exit()
     elif args.contentype == "seriesdir":
         logger.info("Processing series directory")
+        plan = Plan(options=options)
         if args.inputdir:
             if os.path.isdir(args.inputdir):
-                logger.info("Recoding series from directory", extra={"directory": args.inputdir})
+                logger.info("Planning series from directory", extra={"directory": args.inputdir})
                 for subdir in sorted(os.listdir(args.inputdir)):
-                    recode_series(
-                        os.path.join(os.path.realpath(args.inputdir), subdir),
-                        apitokens=apitokens,
-                        lang=args.lang,
-                        infolang=infolang,
-                        sublang=sublang,
-                        subdir=args.subdir,
-                        codec=args.codec,
-                        bit=int(args.bit),
-                        output=args.output,
-                        copy=args.copy,
-                        searchstring=args.searchstring,
-                        omit_cover=args.omitcover,
-                        subselector=args.subselector,
-                        copy_streams=args.onlymetadata,
-                        dump_command=args.dumpcommand,
+                    plan.jobs.extend(
+                        plan_series(
+                            os.path.join(os.path.realpath(args.inputdir), subdir),
+                            apitokens["thetvdb"],
+                            infolang,
+                            output=args.output,
+                            searchstring=args.searchstring,
+                            settings=settings,
+                        )
                     )
             else:
                 error = f'Directory "{args.inputdir}" does not exist'
@@ -745,48 +812,25 @@ def main():
             sys.exit()
     elif args.contentype == "series":
         logger.info("Processing series content")
+        plan = Plan(options=options)
         if args.inputdir:
             if os.path.isdir(args.inputdir):
-                logger.info("Recoding series from directory", extra={"directory": args.inputdir})
-                recode_series(
-                    args.inputdir,
-                    apitokens=apitokens,
-                    lang=args.lang,
-                    infolang=infolang,
-                    sublang=sublang,
-                    subdir=args.subdir,
-                    codec=args.codec,
-                    bit=int(args.bit),
-                    output=args.output,
-                    copy=args.copy,
-                    searchstring=args.searchstring,
-                    omit_cover=args.omitcover,
-                    subselector=args.subselector,
-                    copy_streams=args.onlymetadata,
-                    dump_command=args.dumpcommand,
+                logger.info("Planning series from directory", extra={"directory": args.inputdir})
+                plan.jobs.extend(
+                    plan_series(
+                        args.inputdir, apitokens["thetvdb"], infolang, output=args.output, searchstring=args.searchstring, settings=settings
+                    )
                 )
             else:
                 error = f'Directory "{args.inputdir}" does not exist'
                 logger.error("Input directory not found", extra={"directory": args.inputdir})
                 raise FileNotFoundError(error)
         else:
-            logger.info("Recoding series from current directory")
-            recode_series(
-                os.getcwd(),
-                apitokens=apitokens,
-                lang=args.lang,
-                infolang=infolang,
-                sublang=sublang,
-                subdir=args.subdir,
-                codec=args.codec,
-                bit=int(args.bit),
-                output=args.output,
-                copy=args.copy,
-                searchstring=args.searchstring,
-                omit_cover=args.omitcover,
-                subselector=args.subselector,
-                copy_streams=args.onlymetadata,
-                dump_command=args.dumpcommand,
+            logger.info("Planning series from current directory")
+            plan.jobs.extend(
+                plan_series(
+                    os.getcwd(), apitokens["thetvdb"], infolang, output=args.output, searchstring=args.searchstring, settings=settings
+                )
             )
     elif args.contentype == "rename":
         logger.info("Processing rename operation")
@@ -813,7 +857,7 @@ def main():
                         )
                         if old != new:
                             print(f"Moving {Color.YELLOW}{old}{Style.RESET_ALL} to {Color.MAGENTA}{new}{Style.RESET_ALL}")
-                            shutil.move(old, new)
+                            move_file(old, new)
             else:
                 season, name, _ = get_episode(series, dire, seriesobj)
                 if name is not None and season is not None:
@@ -823,7 +867,7 @@ def main():
                     new = os.path.splitext(os.path.join(parentfolder, series, season, name))[0] + os.path.splitext(dire)[1].replace("?", "")
                     if old != new:
                         print(f"Moving {Color.YELLOW}{old}{Style.RESET_ALL} to {Color.MAGENTA}{new}{Style.RESET_ALL}")
-                        shutil.move(old, new)
+                        move_file(old, new)
     elif args.contentype == "changeSeasonType":
         if apitokens["thetvdb"] is None:
             logger.error("TheTVDB API token required for changing season type")
@@ -851,7 +895,7 @@ def main():
                         new = os.path.splitext(os.path.join(parentfolder, series, season, name))[0] + os.path.splitext(subdir)[1]
                         if old != new:
                             print(f"Moving {Color.YELLOW}{old}{Style.RESET_ALL} to {Color.MAGENTA}{new}{Style.RESET_ALL}")
-                            shutil.move(old, new)
+                            move_file(old, new)
             else:
                 season, name = change_episode_number(series, dire, currseriesobj, destseriesobj)
                 if name is not None and season is not None:
@@ -861,9 +905,41 @@ def main():
                     new = os.path.splitext(os.path.join(parentfolder, series, season, name))[0] + os.path.splitext(dire)[1]
                     if old != new:
                         print(f"Moving {Color.YELLOW}{old}{Style.RESET_ALL} to {Color.MAGENTA}{new}{Style.RESET_ALL}")
-                        shutil.move(old, new)
+                        move_file(old, new)
 
-    if not args.apis:
+    if plan is not None:
+        if args.saveplan:
+            plan.save(args.saveplan)
+            print(f"Saved plan with {Color.GREEN}{len(plan.jobs)}{Style.RESET_ALL} jobs to {Color.MAGENTA}{args.saveplan}{Style.RESET_ALL}")
+        else:
+            logger.info("Executing plan", extra={"jobs": len(plan.jobs), "workers": args.jobs})
+            jobs = plan.recode_kwargs(apitokens)
+            if args.skiptwins:
+                jobs = skip_encoded_twins(jobs, workers=max(args.jobs, 4))
+            if not args.dryrun and len(jobs) > 1:
+                predictions = predict_jobs(jobs, HWACC, workers=max(args.jobs, 4))
+                if args.order == "longest":
+                    jobs, predictions = longest_first(jobs, predictions)
+                predicted = [seconds for seconds in predictions if seconds is not None]
+                eta = batch_duration(predictions, args.jobs)
+                logger.info("Predicted batch", extra={"jobs": len(jobs), "predicted": len(predicted), "seconds": round(eta, 1)})
+                if predicted:
+                    print(
+                        f"Estimated encode time {Color.GREEN}{format_timedelta(datetime.timedelta(seconds=eta))}{Style.RESET_ALL} "
+                        f"for {Color.BLUE}{len(predicted)}{Style.RESET_ALL} of {Color.BLUE}{len(jobs)}{Style.RESET_ALL} jobs "
+                        f"on {args.jobs} worker{'s' if args.jobs > 1 else ''}"
+                    )
+            if args.stagedir:
+                start_staging([job["file"] for job in jobs], args.stagedir, args.stagebudget, ahead=args.stageahead)
+            start_subtitle_prefetch(jobs, workers=args.apiconcurrency)
+            try:
+                expect_jobs(len(jobs))
+                print_summary(run_jobs(tracked(staged(recode)), jobs, workers=args.jobs))
+            finally:
+                stop_subtitle_prefetch()
+                stop_staging()
+
+    if args.logout and not args.apis:
         logger.info("Logging out of APIs")
         logout(apitokens["opensub"])
 
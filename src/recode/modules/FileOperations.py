@@ -1,11 +1,17 @@
 import base64
+import errno
 import hashlib
 import os
+import shutil
 import struct
 import zlib
+from concurrent.futures import ThreadPoolExecutor
 from platform import python_version_tuple
 from warnings import warn
 
+from recode.modules.cache import SqliteCache, file_identity
+from recode.modules.logger import logger
+
 try:
     if int(python_version_tuple()[0]) < 3:
         raise ImportError
@@ -55,10 +61,197 @@ def get_gzip_base64_encoded(file_path):
     return base64.b64encode(zlib.compress(handler)).decode("utf-8")
 
 
+# ioctl request of the Linux FICLONE call: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+# Bytes per copy_file_range call, large chunks keep the number of syscalls low on multi-GB files
+COPY_CHUNK = 1 << 30
+BUFFER_SIZE = 8 << 20
+# errno values meaning "this copy method is not available here", everything else is a real error
+UNSUPPORTED = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF, errno.EPERM}
+
+
+def clone(src_fd: int, dst_fd: int) -> bool:
+    """Shares the extents of src with dst (reflink) on filesystems that support it, like btrfs and xfs."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except OSError as e:
+        if e.errno in UNSUPPORTED:
+            return False
+        raise
+    return True
+
+
+def copy_range(src_fd: int, dst_fd: int, size: int, offset: int) -> int:
+    """Copies with copy_file_range, which stays in the kernel and may be offloaded by the filesystem. Returns the new offset."""
+    if not hasattr(os, "copy_file_range"):
+        return offset
+    while offset < size:
+        try:
+            copied = os.copy_file_range(src_fd, dst_fd, min(COPY_CHUNK, size - offset), offset, offset)
+        except OSError as e:
+            if e.errno in UNSUPPORTED:
+                break
+            raise
+        if copied == 0:
+            break
+        offset += copied
+    return offset
+
+
+def copy_buffered(src_fd: int, dst_fd: int, size: int, offset: int) -> int:
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    while offset < size:
+        chunk = memoryview(os.read(src_fd, BUFFER_SIZE))
+        if not chunk:
+            break
+        written = 0
+        while written < len(chunk):
+            written += os.write(dst_fd, chunk[written:])
+        offset += len(chunk)
+    return offset
+
+
+def copy_file(src: str, dst: str) -> str:
+    """
+    Copies the content and metadata of a file, using the cheapest method the filesystems allow:
+    reflink clone, copy_file_range, then a buffered copy. The size of the copy is verified.
+
+    Returns:
+        str: The method that copied the data ("reflink", "copy_file_range" or "buffered").
+    """
+    size = os.path.getsize(src)
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+        if size > 0 and clone(src_fd, dst_fd):
+            method = "reflink"
+        else:
+            offset = copy_range(src_fd, dst_fd, size, 0)
+            method = "copy_file_range"
+            if offset < size:
+                method = "copy_file_range+buffered" if offset > 0 else "buffered"
+                copy_buffered(src_fd, dst_fd, size, offset)
+        os.fsync(dst_fd)
+        copied = os.fstat(dst_fd).st_size
+    if copied != size:
+        raise OSError(errno.EIO, f"Size mismatch after {method} copy: {copied} of {size} bytes", dst)
+    shutil.copystat(src, dst)
+    return method
+
+
+# The moviehash sums the first and the last 64 KiB as little-endian 64-bit integers
+HASH_BLOCK = 65536
+HASH_FORMAT = struct.Struct(f"<{HASH_BLOCK // 8}q")
+HASH_CACHE_SIZE = 32 * 1024 * 1024
+
+hash_cache: SqliteCache | None = None
+
+
+def enable_hash_cache(enabled: bool = True):
+    """
+    Enables or disables the persistent cache of file hashes.
+    """
+    global hash_cache
+    if enabled and hash_cache is None:
+        hash_cache = SqliteCache("hashes.sqlite3", max_bytes=HASH_CACHE_SIZE)
+    elif not enabled:
+        hash_cache = None
+
+
+def read_at(fd: int, size: int, offset: int) -> bytes:
+    if hasattr(os, "pread"):
+        data = os.pread(fd, size, offset)
+    else:
+        os.lseek(fd, offset, os.SEEK_SET)
+        data = os.read(fd, size)
+    if len(data) != size:
+        raise OSError(errno.EIO, f"Short read of {len(data)} of {size} bytes at {offset}")
+    return data
+
+
+def compute_moviehash(path: str) -> str:
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        size = os.fstat(fd).st_size
+        if size < HASH_BLOCK * 2:
+            raise ValueError(f"{path} is smaller than {HASH_BLOCK * 2} bytes")
+        head = read_at(fd, HASH_BLOCK, 0)
+        tail = read_at(fd, HASH_BLOCK, size - HASH_BLOCK)
+    finally:
+        os.close(fd)
+    # One unpack per block, the sum is taken modulo 2^64 once at the end
+    value = (size + sum(HASH_FORMAT.unpack(head)) + sum(HASH_FORMAT.unpack(tail))) & 0xFFFFFFFFFFFFFFFF
+    return f"{value:016x}"
+
+
+def compute_digest(path: str, algorithm: str) -> str:
+    digest = hashlib.new(algorithm)
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb") as f:
+        while read := f.readinto(buffer):
+            digest.update(view[:read])
+    return digest.hexdigest()
+
+
+def cached_hash(path: str, algorithm: str) -> str:
+    """
+    Hashes a file, reusing the result of an earlier run as long as the file is unchanged.
+    """
+    key = None
+    if hash_cache is not None:
+        key = f"{algorithm}:{file_identity(path)}"
+        cached = hash_cache.get(key)
+        if cached is not None:
+            return cached.decode()
+    value = compute_moviehash(path) if algorithm == "moviehash" else compute_digest(path, algorithm)
+    if key is not None:
+        hash_cache.set(key, value.encode())  # type: ignore
+    return value
+
+
+def moviehash(path: str) -> str:
+    """
+    The OpenSubtitles hash of a file: its size plus the 64-bit sums of its first and last 64 KiB.
+
+    Raises:
+        OSError: If the file can't be read.
+        ValueError: If the file is smaller than two blocks.
+    """
+    return cached_hash(path, "moviehash")
+
+
+def file_digest(path: str, algorithm: str = "blake2b") -> str:
+    """
+    A digest of the whole content of a file, read in fixed-size chunks. `algorithm` is any hashlib name.
+    """
+    return cached_hash(path, algorithm)
+
+
+def hash_files(paths: list[str], algorithm: str = "moviehash", workers: int = 8) -> dict[str, str | None]:
+    """
+    Hashes many files concurrently. The reads release the GIL, so a sweep is bound by I/O, not by the
+    interpreter. Files that can't be hashed map to None.
+    """
+
+    def run(path: str) -> str | None:
+        try:
+            return cached_hash(path, algorithm)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not hash file", extra={"file": path, "algorithm": algorithm, "error": str(e)})
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="recode-hash") as pool:
+        return dict(zip(paths, pool.map(run, paths), strict=True))
+
+
 def get_md5(file_path):
     """Return the md5 of a file."""
-    with open(file_path, "rb") as f:
-        return hashlib.md5(f.read()).hexdigest()
+    return file_digest(file_path, "md5")
 
 
 class File:
@@ -67,33 +260,10 @@ class File:
         self.size = str(os.path.getsize(path))
 
     def get_hash(self):
-        """Original from: http://goo.gl/qqfM0"""
-        longlongformat = "q"  # long long
-        bytesize = struct.calcsize(longlongformat)
-
+        """OpenSubtitles moviehash, "IOError" if the file can't be read and "SizeError" if it is too small."""
         try:
-            f = open(self.path, "rb")
+            return moviehash(self.path)
         except OSError:
             return "IOError"
-
-        hash = int(self.size)
-
-        if int(self.size) < 65536 * 2:
+        except ValueError:
             return "SizeError"
-
-        for _ in range(65536 // bytesize):
-            buffer = f.read(bytesize)
-            (l_value,) = struct.unpack(longlongformat, buffer)
-            hash += l_value
-            hash = hash & 0xFFFFFFFFFFFFFFFF  # to remain as 64bit number
-
-        f.seek(max(0, int(self.size) - 65536), 0)
-        for _ in range(65536 // bytesize):
-            buffer = f.read(bytesize)
-            (l_value,) = struct.unpack(longlongformat, buffer)
-            hash += l_value
-            hash = hash & 0xFFFFFFFFFFFFFFFF
-
-        f.close()
-        returnedhash = f"{hash:016x}"
-        return str(returnedhash)
@@ -1,8 +1,12 @@
 import configparser
+import json
 import os
 import re
 import tempfile
+import threading
+import time
 import urllib.parse
+from datetime import datetime
 from functools import cache
 from typing import Any, TypedDict
 
@@ -11,8 +15,11 @@ import requests
 from colorama import Fore as Color
 from colorama import Style
 
+from recode.modules.cache import SqliteCache
 from recode.modules.FileOperations import File
+from recode.modules.httpclient import opensubtitles, thetvdb
 from recode.modules.logger import logger
+from recode.modules.tokens import cached_token, credentials_key, forget_token, open_token_store, refresh_token, renewed
 
 # fmt: off
 VIDEO_CONTAINERS = [
@@ -33,8 +40,130 @@ class APITokens(TypedDict):
     opensub: OpenSubtitlesToken
 
 
+class EpisodeIndex(list):
+    """
+    The episode list of a series, indexed by (season number, episode number) and by episode id.
+
+    The index is built once when the list is created; the first episode wins if TheTVDB lists duplicates.
+    """
+
+    def __init__(self, episodes=()):
+        super().__init__(episodes)
+        self.numbers: dict[tuple[int, int], dict] = {}
+        self.ids: dict[int, dict] = {}
+        for epi in self:
+            self.numbers.setdefault((epi["seasonNumber"], epi["number"]), epi)
+            self.ids.setdefault(epi["id"], epi)
+
+    def by_number(self, season: int, number: int) -> dict | None:
+        return self.numbers.get((season, number))
+
+    def by_id(self, episodeid: int) -> dict | None:
+        return self.ids.get(episodeid)
+
+
+def episode_index(seriesobj: list) -> EpisodeIndex:
+    return seriesobj if isinstance(seriesobj, EpisodeIndex) else EpisodeIndex(seriesobj)
+
+
 questionary_style = questionary.Style([("highlighted", "fg:#00bcdc")])
 
+# (path pattern, seconds an answer is fresh, seconds a stale answer may still be served while it is refreshed)
+TVDB_TTLS = [
+    (re.compile(r"/v4/search"), 24 * 3600, 7 * 24 * 3600),
+    (re.compile(r"/v4/series/\d+/extended"), 24 * 3600, 7 * 24 * 3600),
+    (re.compile(r"/v4/series/\d+/episodes/"), 12 * 3600, 7 * 24 * 3600),
+    (re.compile(r"/v4/series/\d+/translations/"), 7 * 24 * 3600, 30 * 24 * 3600),
+]
+TVDB_DEFAULT_TTL = (3600, 24 * 3600)
+TVDB_CACHE_SIZE = 128 * 1024 * 1024
+
+SUBTITLE_CACHE_SIZE = 64 * 1024 * 1024
+# Seconds a search without result is remembered, new subtitles are uploaded all the time
+SUBTITLE_MISS_TTL = 24 * 3600
+
+tvdb_cache: SqliteCache | None = None
+subtitle_cache: SqliteCache | None = None
+tvdb_revalidating: set[str] = set()
+tvdb_revalidating_lock = threading.Lock()
+
+
+def enable_tvdb_cache(enabled: bool = True):
+    global tvdb_cache
+    if enabled and tvdb_cache is None:
+        tvdb_cache = SqliteCache("thetvdb.sqlite3", max_bytes=TVDB_CACHE_SIZE)
+    elif not enabled:
+        tvdb_cache = None
+
+
+def enable_subtitle_cache(enabled: bool = True):
+    global subtitle_cache
+    if enabled and subtitle_cache is None:
+        subtitle_cache = SqliteCache("subtitles.sqlite3", max_bytes=SUBTITLE_CACHE_SIZE)
+        download_quota.load(subtitle_cache)
+    elif not enabled:
+        subtitle_cache = None
+
+
+def tvdb_ttl(url: str) -> tuple[int, int]:
+    path = urllib.parse.urlparse(url).path
+    for pattern, ttl, stale in TVDB_TTLS:
+        if pattern.search(path):
+            return ttl, stale
+    return TVDB_DEFAULT_TTL
+
+
+def tvdb_fetch(url: str, token: str | None) -> tuple[int, Any]:
+    token = renewed(token)
+    response = thetvdb.get(url, headers={"Authorization": f"Bearer {token}"})
+    if response.status_code == 401 and token is not None:
+        token = refresh_token("thetvdb", token)
+        if token is not None:
+            response = thetvdb.get(url, headers={"Authorization": f"Bearer {token}"})
+    if response.status_code == 200 and tvdb_cache is not None:
+        tvdb_cache.set(url, response.content)
+    try:
+        return response.status_code, response.json()
+    except requests.JSONDecodeError:
+        return response.status_code, None
+
+
+def tvdb_revalidate(url: str, token: str | None):
+    try:
+        logger.info("Revalidating cached theTVDB response", extra={"url": url})
+        tvdb_fetch(url, token)
+    except requests.RequestException as e:
+        logger.warning("Revalidating cached theTVDB response failed", extra={"url": url, "error": str(e)})
+    finally:
+        with tvdb_revalidating_lock:
+            tvdb_revalidating.discard(url)
+
+
+def tvdb_get(url: str, token: str | None) -> tuple[int, Any]:
+    """
+    GETs a theTVDB API url, answering from the response cache where possible.
+
+    Fresh cached answers are returned without a request. Stale answers within the endpoint's grace period
+    are returned immediately and refreshed in the background for the next run.
+
+    Returns:
+        tuple: The HTTP status code and the decoded JSON body.
+    """
+    if tvdb_cache is not None:
+        entry = tvdb_cache.lookup(url)
+        if entry is not None:
+            ttl, stale = tvdb_ttl(url)
+            age = time.time() - entry.created
+            if age < ttl + stale:
+                if age >= ttl:
+                    with tvdb_revalidating_lock:
+                        if url not in tvdb_revalidating:
+                            tvdb_revalidating.add(url)
+                            threading.Thread(target=tvdb_revalidate, args=(url, token), daemon=True).start()
+                logger.debug("theTVDB cache hit", extra={"url": url, "age": int(age)})
+                return 200, json.loads(entry.value)
+    return tvdb_fetch(url, token)
+
 
 def api_login(config: str) -> APITokens:
     logger.info("Starting API login")
@@ -68,52 +197,68 @@ def api_login(config: str) -> APITokens:
         conf.write(configfile)
 
     logger.info("Authenticating with theTVDB")
-    response = requests.post(
+    open_token_store(config)
+    tvdbkey = conf.get("thetvdb", "apikey")
+    thetvdbtoken = cached_token("thetvdb", credentials_key(tvdbkey), lambda: tvdb_login(tvdbkey))
+
+    logger.info("Authenticating with OpenSubtitles")
+    ostkey, ostuser, ostpassword = (conf.get("opensubtitles", option) for option in ("apikey", "user", "password"))
+    opensubtitlestoken = cached_token(
+        "opensubtitles", credentials_key(ostkey, ostuser, ostpassword), lambda: ost_login(ostkey, ostuser, ostpassword)
+    )
+
+    logger.info("API login completed")
+    tokens = APITokens({"thetvdb": thetvdbtoken, "opensub": {"token": opensubtitlestoken, "api_key": ostkey}})
+    return tokens
+
+
+def tvdb_login(apikey: str) -> tuple[str | None, float | None]:
+    logger.info("Logging in to theTVDB")
+    response = thetvdb.post(
         "https://api4.thetvdb.com/v4/login",
-        json={"apikey": conf.get("thetvdb", "apikey")},
-        timeout=10,
+        json={"apikey": apikey},
         headers={"Content-Type": "application/json"},
     )
-    thetvdbtoken = response.json()["data"]["token"]
+    return response.json()["data"]["token"], None
 
-    logger.info("Authenticating with OpenSubtitles")
+
+def ost_login(apikey: str, user: str, password: str) -> tuple[str | None, float | None]:
+    logger.info("Logging in to OpenSubtitles")
     try:
-        response = requests.post(
+        response = opensubtitles.post(
             "https://api.opensubtitles.com/api/v1/login",
-            json={"username": conf.get("opensubtitles", "user"), "password": conf.get("opensubtitles", "password")},
-            timeout=10,
-            headers={"Content-Type": "application/json", "Api-Key": conf.get("opensubtitles", "apikey"), "User-Agent": "recoder v1.0.0"},
+            json={"username": user, "password": password},
+            headers={"Content-Type": "application/json", "Api-Key": apikey, "User-Agent": "recoder v1.0.0"},
         )
-        opensubtitlestoken = response.json()["token"]
+        return response.json()["token"], None
     except requests.Timeout:
         logger.warning("OpenSubtitles API timeout")
-        opensubtitlestoken = None
     except requests.JSONDecodeError:
         logger.warning("OpenSubtitles API JSON decode error")
-        opensubtitlestoken = None
     except KeyError:
         logger.warning("OpenSubtitles API token key not found")
-        opensubtitlestoken = None
     except requests.exceptions.SSLError:
         logger.warning("OpenSubtitles API SSL error")
-        opensubtitlestoken = None
-
-    logger.info("API login completed")
-    tokens = APITokens({"thetvdb": thetvdbtoken, "opensub": {"token": opensubtitlestoken, "api_key": conf.get("opensubtitles", "apikey")}})
-    return tokens
+    except requests.RequestException as e:
+        logger.warning("OpenSubtitles API unavailable", extra={"error": str(e)})
+    return None, None
 
 
 def logout(token):
+    """
+    Ends the OpenSubtitles session and removes its stored token, later runs log in again.
+    """
     logger.info("Logging out from OpenSubtitles API")
-    requests.delete(
+    opensubtitles.delete(
         "https://api.opensubtitles.com/api/v1/logout",
         headers={
             "Content-Type": "application/json",
             "Api-Key": token["api_key"],
             "User-Agent": "recoder v1.0.0",
-            "Authorization": f"Bearer {token['token']}",
+            "Authorization": f"Bearer {renewed(token['token'])}",
         },
     )
+    forget_token("opensubtitles")
 
 
 def build_choice_list(option_list: list[dict[str, str | dict[str, str]]], lang: str) -> list[str]:
@@ -198,31 +343,18 @@ def get_movie_name(
             found = False
             while not found:
                 logger.info("Searching for movie", extra={"search": movie_name, "year": year, "language": lang})
-                succ = False
-                while not succ:
-                    try:
-                        response = requests.get(
-                            f"https://api4.thetvdb.com/v4/search?query={movie_name}&type=movie&year={year}&language={lang}",
-                            timeout=10,
-                            headers={"Authorization": f"Bearer {token}"},
-                        )
-                        succ = True
-                    except requests.exceptions.ReadTimeout:
-                        succ = False
-                if response.status_code != 200:  # type: ignore
-                    succ = False
-                    while not succ:
-                        try:
-                            response = requests.get(
-                                f"https://api4.thetvdb.com/v4/search?query={movie_name}&type=movie&year={year}",
-                                timeout=10,
-                                headers={"Authorization": f"Bearer {token}"},
-                            )
-                            succ = True
-                        except requests.exceptions.ReadTimeout:
-                            succ = False
                 try:
-                    ret = response.json()["data"]  # type: ignore
+                    status, body = tvdb_get(
+                        f"https://api4.thetvdb.com/v4/search?query={movie_name}&type=movie&year={year}&language={lang}", token
+                    )
+                    if status != 200:
+                        status, body = tvdb_get(f"https://api4.thetvdb.com/v4/search?query={movie_name}&type=movie&year={year}", token)
+                except requests.RequestException as e:
+                    logger.error("Movie search failed", extra={"search": movie_name, "error": str(e)})
+                    print(f"{Color.RED}err: {Style.RESET_ALL}Movie search failed for {Color.BLUE}{movie_name}{Style.RESET_ALL}: {e}")
+                    return None, None
+                try:
+                    ret = body["data"]  # type: ignore
                     if len(ret) > 1 and stype == "single":
                         choices = build_choice_list(ret, lang)
                         choice = questionary.select("Select Movie:\n  ", choices=choices, style=questionary_style).ask()
@@ -286,7 +418,6 @@ def split_string_at_whitespace(text: str, n: int) -> list[str]:
 def find_series_id(series: str, token: str, lang: str, searchstring: str | None = None) -> str | None:
     logger.info("Finding series ID", extra={"series": series, "language": lang})
     res = []
-    headers = {"Authorization": f"Bearer {token}"}
     while res == []:
         if searchstring is not None:
             match = re.search(r"\((\d{4})\)", searchstring)
@@ -310,23 +441,17 @@ def find_series_id(series: str, token: str, lang: str, searchstring: str | None
                     .strip()
                 )  # type: ignore
         logger.info("Searching for series", extra={"query": queryseries, "year": seriesyear})
-        response = requests.get(
-            f"https://api4.thetvdb.com/v4/search?query={queryseries}&type=series&year={seriesyear}&language={lang}",
-            timeout=10,
-            headers=headers,
+        status, body = tvdb_get(
+            f"https://api4.thetvdb.com/v4/search?query={queryseries}&type=series&year={seriesyear}&language={lang}", token
         )
-        if response.status_code != 200:
-            response = requests.get(
-                f"https://api4.thetvdb.com/v4/search?query={queryseries}&type=series&year={seriesyear}", timeout=10, headers=headers
-            )
-        res = response.json()["data"]
+        if status != 200:
+            status, body = tvdb_get(f"https://api4.thetvdb.com/v4/search?query={queryseries}&type=series&year={seriesyear}", token)
+        res = body["data"]
         if res == []:
-            response = requests.get(
-                f"https://api4.thetvdb.com/v4/search?query={queryseries}&type=series&language={lang}", timeout=10, headers=headers
-            )
-            if response.status_code != 200:
-                response = requests.get(f"https://api4.thetvdb.com/v4/search?query={queryseries}&type=series", timeout=10, headers=headers)
-            res = response.json()["data"]
+            status, body = tvdb_get(f"https://api4.thetvdb.com/v4/search?query={queryseries}&type=series&language={lang}", token)
+            if status != 200:
+                status, body = tvdb_get(f"https://api4.thetvdb.com/v4/search?query={queryseries}&type=series", token)
+            res = body["data"]
         # choices = [f"{serie['slug'].ljust(30)[:30]} {serie.get('year')}: {serie.get('overviews', {}).get(lang, serie.get('overview', ''))[:180]}" for serie in res]
         if res == []:
             searchstring = input("Not found! Enter search string: ")
@@ -341,9 +466,8 @@ def find_series_id(series: str, token: str, lang: str, searchstring: str | None
 
 @cache
 def get_extended_series(seriesid: str, token: str) -> dict:
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(f"https://api4.thetvdb.com/v4/series/{seriesid}/extended", timeout=10, headers=headers)
-    return response.json()["data"]
+    _, body = tvdb_get(f"https://api4.thetvdb.com/v4/series/{seriesid}/extended", token)
+    return body["data"]
 
 
 def get_season_type(seriesid: str, token: str, specifier: str = "") -> str:
@@ -364,31 +488,25 @@ def get_season_type(seriesid: str, token: str, specifier: str = "") -> str:
 
 
 @cache
-def get_episodelist(seriesid: str, seasonType: str, lang: str, token: str) -> tuple[list[dict[str, str | dict[str, str]]], str, str]:
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(
-        f"https://api4.thetvdb.com/v4/series/{seriesid}/episodes/{seasonType}/{lang}?page=0", timeout=10, headers=headers
-    )
-    data = response.json()["data"]
+def get_episodelist(seriesid: str, seasonType: str, lang: str, token: str) -> tuple[EpisodeIndex, str, str]:
+    _, body = tvdb_get(f"https://api4.thetvdb.com/v4/series/{seriesid}/episodes/{seasonType}/{lang}?page=0", token)
+    data = body["data"]
     returnlst: list = data["episodes"]
     if lang in data["nameTranslations"]:
-        translationres = requests.get(f"https://api4.thetvdb.com/v4/series/{seriesid}/translations/{lang}", timeout=10, headers=headers)
-        translation = translationres.json()["data"]
-        name = translation["name"]
+        _, translation = tvdb_get(f"https://api4.thetvdb.com/v4/series/{seriesid}/translations/{lang}", token)
+        name = translation["data"]["name"]
     else:
         name = data["name"]
     year = data.get("year", "")
 
-    while response.json()["links"]["next"] is not None:
-        response = requests.get(response.json()["links"]["next"], timeout=10, headers=headers)
-        returnlst.extend(response.json()["data"]["episodes"])
-    return returnlst, name, year
+    while body["links"]["next"] is not None:
+        _, body = tvdb_get(body["links"]["next"], token)
+        returnlst.extend(body["data"]["episodes"])
+    return EpisodeIndex(returnlst), name, year
 
 
 @cache
-def get_series_from_tvdb(
-    series: str, token: str, lang: str, searchstring: str | None = None
-) -> tuple[list[dict[str, str | dict[str, str]]] | None, str, str]:
+def get_series_from_tvdb(series: str, token: str, lang: str, searchstring: str | None = None) -> tuple[EpisodeIndex | None, str, str]:
     if token is None:
         return None, "", ""
     seriesid = find_series_id(series, token, lang, searchstring)
@@ -400,7 +518,7 @@ def get_series_from_tvdb(
 
 def change_season_type(
     series: str, token: str, lang: str, searchstring: str | None = None
-) -> tuple[list[dict[str, str | dict[str, str]]] | None, list[dict[str, str | dict[str, str]]] | None, str, str]:
+) -> tuple[EpisodeIndex | None, EpisodeIndex | None, str, str]:
     if token is None:
         return None, "", ""
     seriesid = find_series_id(series, token, lang, searchstring)
@@ -428,27 +546,27 @@ def change_episode_number(series: str, file: str, seriesobj: list, destobj: list
                 episodes.remove("")
             else:
                 return None, None
+        seriesobj = episode_index(seriesobj)
+        destobj = episode_index(destobj)
         episodeIDs: list[str] = []
         titles: list[str] = []
         for episode in episodes:
-            for epi in seriesobj:
-                if epi["seasonNumber"] == int(seasonnum) and epi["number"] == int(episode):
-                    episodeIDs.append(epi["id"])
-                    break
+            epi = seriesobj.by_number(int(seasonnum), int(episode))
+            if epi is not None:
+                episodeIDs.append(epi["id"])
 
         seasonnum = ""
         ep = ""
 
         for eid in episodeIDs:
-            for epi in destobj:
-                if epi["id"] == eid:
-                    if isinstance(epi["name"], str):
-                        titles.append(epi["name"])
-                    else:
-                        titles.append("")
-                    seasonnum = epi["seasonNumber"]
-                    ep = ep + f"E{epi['number']:02d}"
-                    break
+            epi = destobj.by_id(eid)
+            if epi is not None:
+                if isinstance(epi["name"], str):
+                    titles.append(epi["name"])
+                else:
+                    titles.append("")
+                seasonnum = epi["seasonNumber"]
+                ep = ep + f"E{epi['number']:02d}"
 
         if seasonnum == "":
             return "Uncategorized", file
@@ -484,22 +602,22 @@ def get_episode(
                 episodes.remove("")
             else:
                 return None, None, None
+        seriesobj = episode_index(seriesobj)
         ep = ""
         titles: list[str] = []
         comments: list[str] = []
         date = None
         for episode in episodes:
             ep = ep + "E" + episode.rjust(2, "0")
-            for epi in seriesobj:
-                if epi["seasonNumber"] == int(seasonnum) and epi["number"] == int(episode):
-                    if isinstance(epi["name"], str):
-                        titles.append(epi["name"])
-                    else:
-                        titles.append("")
-                    if isinstance(epi["overview"], str):
-                        comments.append(epi["overview"].replace("\n", "").strip())
-                    date = epi["aired"]
-                    break
+            epi = seriesobj.by_number(int(seasonnum), int(episode))
+            if epi is not None:
+                if isinstance(epi["name"], str):
+                    titles.append(epi["name"])
+                else:
+                    titles.append("")
+                if isinstance(epi["overview"], str):
+                    comments.append(epi["overview"].replace("\n", "").strip())
+                date = epi["aired"]
         if len(titles) == 2 and re.sub(r"\(\d+\)", "", titles[0]).strip() == re.sub(r"\(\d+\)", "", titles[1]).strip():
             title = re.sub(r"\(\d+\)", "", titles[0]).strip()
         else:
@@ -525,44 +643,189 @@ def get_episode(
     return None, None, None
 
 
-def get_subtitles_from_ost(token: OpenSubtitlesToken, metadata: dict, lang: str, file: str) -> str | None:
-    if token.get("token", None) is None:
-        return None
-    headers = {
+class DownloadQuota:
+    """
+    The daily download quota of the OpenSubtitles account, as reported by the download endpoint. Every
+    download takes a slot before it is sent, so concurrent downloads never exceed the quota. The state is
+    kept in the subtitle cache, a later run knows an exhausted quota without asking.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.remaining: int | None = None
+        self.reset_at: float | None = None
+
+    def load(self, cache: SqliteCache):
+        data = cache.get("quota")
+        if data is not None:
+            state = json.loads(data)
+            with self.lock:
+                self.remaining, self.reset_at = state["remaining"], state["reset_at"]
+
+    def acquire(self) -> bool:
+        with self.lock:
+            if self.reset_at is not None and time.time() >= self.reset_at:
+                self.remaining, self.reset_at = None, None
+            if self.remaining is not None and self.remaining <= 0:
+                return False
+            if self.remaining is not None:
+                self.remaining -= 1
+            return True
+
+    def release(self):
+        """Returns the slot of a download that did not count against the quota."""
+        with self.lock:
+            if self.remaining is not None:
+                self.remaining += 1
+
+    def update(self, answer: dict):
+        if "remaining" not in answer:
+            return
+        reset_at = None
+        if answer.get("reset_time_utc"):
+            try:
+                reset_at = datetime.fromisoformat(answer["reset_time_utc"].replace("Z", "+00:00")).timestamp()
+            except ValueError:
+                reset_at = None
+        with self.lock:
+            self.remaining, self.reset_at = int(answer["remaining"]), reset_at
+            state = {"remaining": self.remaining, "reset_at": self.reset_at}
+        logger.info("OpenSubtitles download quota", extra=state)
+        if subtitle_cache is not None:
+            subtitle_cache.set("quota", json.dumps(state).encode())
+
+
+download_quota = DownloadQuota()
+
+
+def ost_headers(token: OpenSubtitlesToken) -> dict[str, str]:
+    return {
         "Content-Type": "application/json",
-        "Api-Key": token["api_key"],
+        "Api-Key": token["api_key"] or "",
         "User-Agent": "recoder v1.0.1",
-        "Authorization": f"Bearer {token['token']}",
+        "Authorization": f"Bearer {renewed(token['token'])}",
     }
+
+
+def ost_request(method: str, url: str, token: OpenSubtitlesToken, **kwargs) -> requests.Response:
+    """
+    Sends an authenticated OpenSubtitles request, refreshing the login once if the token is rejected.
+    """
+    current = renewed(token["token"])
+    response = opensubtitles.request(method, url, headers=ost_headers(token), **kwargs)
+    if response.status_code == 401 and current is not None and refresh_token("opensubtitles", current) is not None:
+        response = opensubtitles.request(method, url, headers=ost_headers(token), **kwargs)
+    return response
+
+
+def search_subtitle(token: OpenSubtitlesToken, metadata: dict, lang: str, moviehash: str) -> int | None:
+    """
+    Returns the file id of the best rated subtitle, None if there is none. Results are cached per
+    moviehash and language, searches without result for SUBTITLE_MISS_TTL seconds. Without a login
+    only cached results are returned.
+    """
+    key = f"match:{moviehash}:{lang}"
+    entry = subtitle_cache.lookup(key) if subtitle_cache is not None else None
+    if entry is not None and (entry.value or time.time() - entry.created < SUBTITLE_MISS_TTL):
+        return int(entry.value) if entry.value else None
+    if token.get("token", None) is None:
+        return None
     if metadata.get("show", False):
         match = re.findall(r"([\w\s]+)\s\((\d{4})\)", metadata["show"])[0]
         name = f"{match[0]} ({match[1]}) - {metadata['title']}"
     else:
         name = metadata["title"]
-    response = requests.get(f"https://api.opensubtitles.com/api/v1/utilities/guessit?filename={name}", headers=headers)
+    response = ost_request("GET", f"https://api.opensubtitles.com/api/v1/utilities/guessit?filename={name}", token)
     params = response.json()
-    params["language"] = lang[:2]
+    params["language"] = lang
     params["page"] = 0
-    params["moviehash"] = File(file).get_hash()
+    params["moviehash"] = moviehash
     params["order_by"] = "ratings"
-
-    response = requests.get("https://api.opensubtitles.com/api/v1/subtitles", params=urllib.parse.urlencode(params), headers=headers)
+    response = ost_request("GET", "https://api.opensubtitles.com/api/v1/subtitles", token, params=urllib.parse.urlencode(params))
+    try:
+        results = response.json()["data"] if response.status_code == 200 else None
+    except (KeyError, TypeError, requests.JSONDecodeError):
+        results = None
     try:
-        subtitle = response.json()["data"][0]["attributes"]
-    except IndexError:
+        file_id = int(results[0]["attributes"]["files"][0]["file_id"]) if results else None
+    except (IndexError, KeyError, TypeError, ValueError):
+        file_id = None
+    if file_id is None and results != []:
+        # Errors and unexpected answers are no miss, the next run searches again
+        logger.warning("OpenSubtitles search failed", extra={"moviehash": moviehash, "status": response.status_code})
+        return None
+    if subtitle_cache is not None:
+        subtitle_cache.set(key, str(file_id).encode() if file_id is not None else b"")
+    return file_id
+
+
+def download_subtitle(token: OpenSubtitlesToken, moviehash: str, lang: str, file_id: int) -> tuple[str, bytes] | None:
+    """
+    Returns the file name and content of a subtitle file, from the cache or downloaded within the quota.
+    """
+    key = f"subtitle:{moviehash}:{lang}:{file_id}"
+    data = subtitle_cache.get(key) if subtitle_cache is not None else None
+    if data is not None:
+        filename, _, content = data.partition(b"\0")
+        logger.info("Subtitle cache hit", extra={"file_id": file_id})
+        return filename.decode(), content
+    if token.get("token", None) is None:
         return None
+    if not download_quota.acquire():
+        logger.warning("OpenSubtitles download quota exhausted, skipping download", extra={"file_id": file_id})
+        return None
+    try:
+        response = ost_request("POST", "https://api.opensubtitles.com/api/v1/download", token, json={"file_id": file_id})
+    except requests.RequestException:
+        download_quota.release()
+        raise
+    try:
+        answer = response.json()
     except requests.JSONDecodeError:
+        answer = {}
+    if response.status_code >= 500 and "remaining" not in answer:
+        # The server failed before counting the download
+        download_quota.release()
+    download_quota.update(answer)
+    if "link" not in answer:
+        logger.warning("OpenSubtitles download refused", extra={"file_id": file_id, "status": response.status_code})
         return None
-    response = requests.post(
-        "https://api.opensubtitles.com/api/v1/download", headers=headers, json={"file_id": subtitle["files"][0]["file_id"]}
-    )
-    link = response.json()["link"]
-    filename = response.json()["file_name"]
-    response = requests.get(link, headers=headers)
-    content = response.text
-    if content == "":
+    filename = answer["file_name"]
+    content = opensubtitles.get(answer["link"], headers=ost_headers(token)).content
+    if content == b"":
+        return None
+    if subtitle_cache is not None:
+        subtitle_cache.set(key, filename.encode() + b"\0" + content)
+    logger.info("Downloaded subtitle", extra={"file_id": file_id, "remaining": answer.get("remaining")})
+    return filename, content
+
+
+def fetch_subtitle(token: OpenSubtitlesToken, metadata: dict, lang: str, file: str) -> tuple[str, bytes] | None:
+    """
+    Finds the subtitle of a video file on OpenSubtitles. Repeated calls for the same file are answered
+    from the subtitle cache without any request. Safe to call from several threads at once.
+    """
+    moviehash = File(file).get_hash()
+    if moviehash in ("IOError", "SizeError"):
+        logger.warning("Cannot hash file for OpenSubtitles", extra={"file": file, "error": moviehash})
+        return None
+    lang = lang[:2]
+    try:
+        file_id = search_subtitle(token, metadata, lang, moviehash)
+        if file_id is None:
+            return None
+        return download_subtitle(token, moviehash, lang, file_id)
+    except requests.RequestException as e:
+        logger.warning("Fetching subtitles from OpenSubtitles failed", extra={"file": file, "error": str(e)})
+        return None
+
+
+def get_subtitles_from_ost(token: OpenSubtitlesToken, metadata: dict, lang: str, file: str) -> str | None:
+    subtitle = fetch_subtitle(token, metadata, lang, file)
+    if subtitle is None:
         return None
-    _, tmpfile = tempfile.mkstemp(suffix=os.path.splitext(filename)[1])
-    with open(tmpfile, "w") as f:
+    filename, content = subtitle
+    fd, tmpfile = tempfile.mkstemp(suffix=os.path.splitext(filename)[1])
+    with os.fdopen(fd, "wb") as f:
         f.write(content)
     return tmpfile
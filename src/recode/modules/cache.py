@@ -0,0 +1,117 @@
+"""
+cache.py
+
+Small persistent key-value caches backed by SQLite.
+
+Each cache lives in its own database file in CACHE_DIR, tracks when every entry was created and last used
+and evicts the least recently used entries once the stored values exceed a size budget. The caches can be
+shared between threads and between concurrently running recode processes.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import NamedTuple
+
+from recode.modules.logger import logger
+
+if "LOCALAPPDATA" in os.environ:
+    CACHE_HOME = os.environ["LOCALAPPDATA"]
+elif "XDG_CACHE_HOME" in os.environ:
+    CACHE_HOME = os.environ["XDG_CACHE_HOME"]
+else:
+    CACHE_HOME = os.path.join(os.path.expanduser("~"), ".cache")
+CACHE_DIR = os.path.join(CACHE_HOME, "universal-ffmpeg-recoder")
+
+# Number of writes between two checks of the size budget
+EVICT_INTERVAL = 100
+
+
+class CacheEntry(NamedTuple):
+    value: bytes
+    created: float
+
+
+def file_identity(path: str) -> str:
+    """
+    Returns a key that changes whenever the file is replaced or modified.
+    """
+    stat = os.stat(path)
+    return f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class SqliteCache:
+    """
+    A size-bounded LRU cache of compressed byte values.
+
+    Args:
+        name (str): Name of the database file in CACHE_DIR, or an absolute path.
+        max_bytes (int): Budget for the stored (compressed) values.
+    """
+
+    def __init__(self, name: str, max_bytes: int = 256 * 1024 * 1024):
+        self.path = name if os.path.isabs(name) else os.path.join(CACHE_DIR, name)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.writes = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        logger.info("Opened cache", extra={"path": self.path, "max_bytes": max_bytes})
+
+    def lookup(self, key: str) -> CacheEntry | None:
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (time.time(), key))
+        return CacheEntry(zlib.decompress(row[0]), row[1])
+
+    def get(self, key: str) -> bytes | None:
+        entry = self.lookup(key)
+        return entry.value if entry is not None else None
+
+    def set(self, key: str, value: bytes, created: float | None = None):
+        data = zlib.compress(value)
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), created if created is not None else now, now),
+            )
+            self.writes += 1
+            if self.writes % EVICT_INTERVAL == 0:
+                self._evict()
+
+    def delete(self, key: str):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def evict(self):
+        with self.lock, self.conn:
+            self._evict()
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        logger.info("Evicting cache entries", extra={"path": self.path, "size": total, "max_bytes": self.max_bytes})
+        excess = total - self.max_bytes
+        for key, size in self.conn.execute("SELECT key, size FROM cache ORDER BY accessed").fetchall():
+            self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            excess -= size
+            if excess <= 0:
+                break
+
+    def close(self):
+        self.evict()
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,345 @@
+"""
+chunked.py
+
+Segment-parallel encoding of a single video stream.
+
+The recoded video stream is split losslessly at keyframes, the segments are encoded by several ffmpeg
+processes at once, concatenated again and finally muxed together with all other streams of the source,
+using the same encode plan recode() built for a regular ffrecode() run.
+
+Encoded segments are kept in a work directory derived from the source file and the encoder settings,
+so an interrupted run resumes from the last finished segment.
+
+The -progress output of the segment encodes is summed up into the progress of the job, so the status
+line and the dashboard show one encode with its percentage, ETA and size like a regular ffrecode() run.
+"""
+
+import dataclasses
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+from colorama import Fore as Color
+from colorama import Style
+from ffmpeg import FFmpeg, errors
+
+from recode.modules.cache import file_identity
+from recode.modules.encode_plan import EncodePlan, StreamAction
+from recode.modules.logger import job_context, logger
+from recode.modules.progress import JobProgress, renderer
+
+SEGMENT_MANIFEST = "segments.json"
+
+
+def keyframe_times(file_path: str, stream_index: int) -> list[float]:
+    """
+    Returns the presentation times of all keyframes of a video stream in seconds.
+    """
+    logger.info("Probing keyframes", extra={"file": file_path, "stream": stream_index})
+    ffprobe = FFmpeg(executable="ffprobe").input(
+        file_path,
+        select_streams=str(stream_index),
+        skip_frame="nokey",
+        show_entries="frame=pts_time",
+        print_format="json",
+        v="error",
+    )
+    frames = json.loads(ffprobe.execute()).get("frames", [])
+    return sorted(float(frame["pts_time"]) for frame in frames if frame.get("pts_time") not in (None, "N/A"))
+
+
+def segment_times(keyframes: list[float], length: float) -> list[float]:
+    """
+    Picks split points from a list of keyframe times so that segments are at least `length` seconds long.
+    """
+    times = []
+    last = keyframes[0] if keyframes else 0.0
+    for keyframe in keyframes[1:]:
+        if keyframe - last >= length:
+            times.append(keyframe)
+            last = keyframe
+    return times
+
+
+def workdir_for(source_file: str, output_file: str, encoder_args: dict, scratch: str | None = None) -> str:
+    """
+    Returns a work directory that is stable across runs for the same source file and encoder settings.
+    It holds a copy of the video stream and its encode, so it is placed next to `output_file` unless a
+    scratch root is given, like temp_output(), and not in the system temp dir, which is often a small tmpfs.
+    `source_file` is the original file, a staged copy gets a new path and mtime on every run.
+    """
+    source_file = os.path.realpath(source_file)
+    key = json.dumps([source_file, file_identity(source_file), encoder_args], sort_keys=True)
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    directory = scratch or os.path.dirname(os.path.realpath(output_file))
+    return os.path.join(directory, f".recode-chunks-{digest}")
+
+
+class SegmentProgress:
+    """
+    Sums the progress of the concurrently encoded segments into the JobProgress of the whole encode.
+    Segments encoded by an earlier run count with the average segment length.
+
+    Args:
+        job (JobProgress): The registered progress of the encode.
+        segments (int): Number of segments.
+    """
+
+    def __init__(self, job: JobProgress, segments: int):
+        self.job = job
+        self.lock = threading.Lock()
+        self.segment_length = job.duration / segments if job.duration and segments else 0.0
+        self.done_time = 0.0
+        self.done_size = 0
+        self.running: dict[str, JobProgress] = {}
+
+    def start(self, segment: str) -> Callable[[str], bool]:
+        """Returns the stderr handler of a segment encode, it takes the segment's -progress lines."""
+        state = JobProgress(label=segment)
+        with self.lock:
+            self.running[segment] = state
+
+        def feed(line: str) -> bool:
+            if not state.feed(line):
+                return False
+            if line.startswith("progress="):
+                self.update()
+            return True
+
+        return feed
+
+    def finish(self, segment: str, target: str):
+        with self.lock:
+            state = self.running.pop(segment, None)
+            self.done_time += state.out_time if state is not None and state.out_time else self.segment_length
+            try:
+                self.done_size += os.path.getsize(target)
+            except OSError:
+                pass
+        self.update()
+
+    def update(self):
+        with self.lock:
+            states = list(self.running.values())
+            self.job.out_time = self.done_time + sum(state.out_time for state in states)
+            self.job.size = self.done_size + sum(state.size for state in states)
+            self.job.frame = sum(state.frame for state in states)
+            self.job.fps = sum(state.fps for state in states)
+            # Segments run side by side, together they advance by the sum of their speeds
+            self.job.speed = sum(state.speed or 0.0 for state in states) or None
+
+
+def run_ffmpeg(ffmpeg: FFmpeg, dump_command: bool = False, progress: Callable[[str], bool] | None = None) -> bool:
+    """
+    Runs an ffmpeg command. `progress` gets every stderr line and returns False for lines that are not
+    -progress output, the last of those is reported if ffmpeg fails.
+    """
+    messages: list[str] = []
+
+    @ffmpeg.on("start")
+    def on_start(arguments: list[str]):
+        logger.info("FFmpeg started", extra={"cmd": " ".join(arguments)})
+        if dump_command:
+            print("'" + "' '".join(arguments) + "'")
+
+    @ffmpeg.on("stderr")
+    def on_stderr(line: str):
+        if (progress is None or not progress(line)) and line.strip():
+            messages.append(line.strip())
+
+    try:
+        ffmpeg.execute()
+    except errors.FFmpegError as e:
+        error = messages[-1] if messages else str(e)
+        logger.error("FFmpeg error", extra={"error": error})
+        renderer.clear()
+        print(f"{Color.RED}FFmpeg error:{Style.RESET_ALL} {error}")
+        return False
+    return True
+
+
+def split_video(input_file: str, stream_index: int, workdir: str, length: float, dump_command: bool = False) -> list[str] | None:
+    manifest = os.path.join(workdir, SEGMENT_MANIFEST)
+    if os.path.exists(manifest):
+        with open(manifest, encoding="utf-8") as f:
+            segments = json.load(f)
+        logger.info("Reusing split segments", extra={"workdir": workdir, "segments": len(segments)})
+        return segments
+    times = segment_times(keyframe_times(input_file, stream_index), length)
+    logger.info("Splitting video stream", extra={"input": input_file, "segments": len(times) + 1})
+    ffmpeg = (
+        FFmpeg(executable="ffmpeg")
+        .option("y")
+        .option("v", "error")
+        .input(input_file)
+        .output(
+            os.path.join(workdir, "source_%05d.mkv"),
+            {"c": "copy", "segment_times": ",".join(f"{time:.6f}" for time in times)} if times else {"c": "copy"},
+            map=[f"0:{stream_index}"],
+            f="segment",
+            segment_format="matroska",
+            reset_timestamps=1,
+        )
+    )
+    if not run_ffmpeg(ffmpeg, dump_command):
+        return None
+    segments = sorted(fil for fil in os.listdir(workdir) if fil.startswith("source_") and fil.endswith(".mkv"))
+    with open(manifest, "w", encoding="utf-8") as f:
+        json.dump(segments, f)
+    return segments
+
+
+def encode_segment(workdir: str, segment: str, encoder_args: dict, progress: SegmentProgress, dump_command: bool = False) -> bool:
+    target = os.path.join(workdir, segment.replace("source_", "encoded_"))
+    if os.path.exists(target):
+        logger.info("Segment already encoded", extra={"segment": segment})
+        progress.finish(segment, target)
+        return True
+    partial = target + ".part"
+    ffmpeg = (
+        FFmpeg(executable="ffmpeg")
+        .option("y")
+        .option("hwaccel", "auto")
+        .option("strict", "-2")
+        .option("v", "error")
+        .option("nostats")
+        .option("progress", "pipe:2")
+        .input(os.path.join(workdir, segment))
+        .output(partial, encoder_args, map=["0:v:0"], f="matroska")
+    )
+    if not run_ffmpeg(ffmpeg, dump_command, progress.start(segment)):
+        if os.path.exists(partial):
+            os.remove(partial)
+        return False
+    os.replace(partial, target)
+    progress.finish(segment, target)
+    logger.info("Segment encoded", extra={"segment": segment})
+    return True
+
+
+def segment_args(plan: EncodePlan, stream: StreamAction) -> dict:
+    """
+    Returns the ffmpeg arguments for encoding the segments of a video stream of the plan.
+    """
+    encoder = {key: value for key, value in plan.encoder if ":" not in key}
+    return encoder | {"c:v": stream.codec} | {f"{key}:v": value for key, value in stream.options}
+
+
+def mux_plan(plan: EncodePlan, stream: StreamAction, video_file: str) -> EncodePlan:
+    """
+    Returns the plan of the final mux, where the encoded video stream is copied from `video_file`,
+    which becomes the last input.
+    """
+    mux = plan.replace_stream(stream, input=len(plan.inputs) + 1, index=0, codec="copy", options=())
+    encoder = tuple((key, value) for key, value in plan.encoder if ":" in key)
+    return dataclasses.replace(mux, encoder=encoder, inputs=(*plan.inputs, video_file))
+
+
+def ffrecode_chunked(
+    input_file: str,
+    output_file: str,
+    plan: EncodePlan,
+    stream: StreamAction,
+    workers: int = 4,
+    length: float = 120,
+    scratch: str | None = None,
+    dump_command: bool = False,
+    duration: float | None = None,
+    source_file: str | None = None,
+) -> bool:
+    """
+    Re-encodes a media file like ffrecode(), but encodes the recoded video stream in parallel segments.
+
+    Args:
+        input_file (str): The path to the input media file.
+        output_file (str): The path to the output media file.
+        plan (EncodePlan): Streams, options and metadata of the output.
+        stream (StreamAction): The recoded video stream of the plan that is encoded in segments.
+        workers (int): Number of segments encoded at the same time.
+        length (float): Minimum length of a segment in seconds.
+        scratch (str | None): Directory for the work directory, defaults to the directory of `output_file`.
+        dump_command (bool): Print the ffmpeg commands.
+        duration (float | None): Duration of the input in seconds, used for the ETA.
+        source_file (str | None): The original file if `input_file` is a staged copy of it, identifies the
+            work directory across runs.
+
+    Returns:
+        completed (bool): True if the recoding was completed successfully, False otherwise.
+    """
+    label = job_context.get()
+    prefix = f"{Color.YELLOW}{label}{Style.RESET_ALL} " if label is not None else ""
+    encoder_args = segment_args(plan, stream)
+    workdir = workdir_for(source_file or input_file, output_file, encoder_args, scratch)
+    os.makedirs(workdir, exist_ok=True)
+    logger.info("Starting chunked recoding", extra={"input": input_file, "output": output_file, "workdir": workdir, "workers": workers})
+
+    timestart = datetime.datetime.now()
+    job = renderer.register(label or os.path.basename(input_file), duration)
+    renderer.clear()
+    print(f"{prefix}Chunked recoding started at {Color.GREEN}{timestart.isoformat()}{Style.RESET_ALL}")
+    try:
+        completed = encode_chunked(input_file, output_file, plan, stream, workdir, job, workers, length, dump_command)
+    finally:
+        renderer.unregister(job)
+    if not completed:
+        return False
+
+    timestop = datetime.datetime.now()
+    logger.info("Chunked recoding completed", extra={"duration": str(timestop - timestart)})
+    print(f"{prefix}Recoding finished at {Color.GREEN}{timestop.isoformat()}{Style.RESET_ALL}")
+    print(f"{prefix}Recoding took {Color.GREEN}{timestop - timestart}{Style.RESET_ALL}")
+    shutil.rmtree(workdir, ignore_errors=True)
+    return True
+
+
+def encode_chunked(
+    input_file: str,
+    output_file: str,
+    plan: EncodePlan,
+    stream: StreamAction,
+    workdir: str,
+    job: JobProgress,
+    workers: int,
+    length: float,
+    dump_command: bool,
+) -> bool:
+    encoder_args = segment_args(plan, stream)
+    segments = split_video(input_file, stream.index, workdir, length, dump_command)
+    if segments is None:
+        return False
+
+    progress = SegmentProgress(job, len(segments))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recode-segment") as pool:
+        futures = [pool.submit(encode_segment, workdir, segment, encoder_args, progress, dump_command) for segment in segments]
+        results = [future.result() for future in futures]
+    if not all(results):
+        logger.error("Segment encoding failed, keeping finished segments", extra={"workdir": workdir})
+        return False
+    logger.info("Segments encoded", extra={"segments": len(segments)})
+
+    concatlist = os.path.join(workdir, "concat.txt")
+    with open(concatlist, "w", encoding="utf-8") as f:
+        for segment in segments:
+            f.write(f"file '{segment.replace('source_', 'encoded_')}'\n")
+    video_file = os.path.join(workdir, "video.mkv")
+    ffmpeg = (
+        FFmpeg(executable="ffmpeg")
+        .option("y")
+        .option("v", "error")
+        .input(concatlist, f="concat", safe=0)
+        .output(video_file, c="copy", map=["0:v:0"], f="matroska")
+    )
+    if not run_ffmpeg(ffmpeg, dump_command):
+        return False
+
+    ffmpeg = FFmpeg(executable="ffmpeg").option("y").option("strict", "-2").option("v", "error").input(input_file)
+    mux = mux_plan(plan, stream, video_file)
+    for file in mux.inputs:
+        ffmpeg = ffmpeg.input(file)
+    ffmpeg = ffmpeg.output(output_file, mux.output_args(), f="matroska", map=mux.maps(), metadata=mux.metadata_args())
+    return run_ffmpeg(ffmpeg, dump_command)
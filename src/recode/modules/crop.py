@@ -0,0 +1,155 @@
+"""
+crop.py
+
+Detection of black bars around the picture of a video stream.
+
+A few short slices spread over the duration are decoded with ffmpeg's cropdetect filter. Each slice reports
+the bounding box of everything that is not black, and the crop is the union of these boxes: a dark scene can
+only make the crop smaller, never cut into the picture. Crops that remove almost nothing are dropped, as are
+implausible ones that would remove half of the frame. Results are cached per source file.
+"""
+
+import json
+from typing import NamedTuple
+
+from ffmpeg import FFmpeg, errors
+
+from recode.modules.cache import SqliteCache, file_identity
+from recode.modules.datatypes import Ffprobe, Stream
+from recode.modules.logger import logger
+
+CROP_CACHE_SIZE = 16 * 1024 * 1024
+# Number of slices and seconds decoded per slice
+SAMPLES = 6
+SAMPLE_SECONDS = 2
+# Luma below this fraction of the range counts as black
+LIMIT = 0.09
+# Minimum share of the frame a crop has to remove
+MIN_REDUCTION = 0.02
+
+crop_cache: SqliteCache | None = None
+
+
+class CropArea(NamedTuple):
+    width: int
+    height: int
+    x: int
+    y: int
+
+    def filter(self) -> str:
+        return f"crop={self.width}:{self.height}:{self.x}:{self.y}"
+
+
+def enable_crop_cache(enabled: bool = True):
+    """
+    Enables or disables the persistent cache of detect_crop() results.
+    """
+    global crop_cache
+    if enabled and crop_cache is None:
+        crop_cache = SqliteCache("crop.sqlite3", max_bytes=CROP_CACHE_SIZE)
+    elif not enabled:
+        crop_cache = None
+
+
+def parse_cropdetect(line: str) -> CropArea | None:
+    _, sep, value = line.rpartition("crop=")
+    if not sep:
+        return None
+    try:
+        width, height, x, y = (int(part) for part in value.strip().split(":"))
+    except ValueError:
+        return None
+    # Completely black frames report negative sizes
+    if width <= 0 or height <= 0:
+        return None
+    return CropArea(width, height, x, y)
+
+
+def sample_crop(file_path: str, index: int, start: float) -> CropArea | None:
+    """
+    Runs cropdetect on one slice of a video stream and returns the bounding box of the whole slice.
+    """
+    areas: list[CropArea] = []
+    ffmpeg = (
+        FFmpeg(executable="ffmpeg")
+        .option("hide_banner")
+        .option("nostats")
+        .input(file_path, ss=f"{start:.3f}", t=SAMPLE_SECONDS)
+        .output("-", {"vf": f"cropdetect=limit={LIMIT}:round=2:reset=0"}, f="null", map=f"0:{index}", an=None, sn=None)
+    )
+
+    @ffmpeg.on("stderr")
+    def on_stderr(line: str):
+        area = parse_cropdetect(line)
+        if area is not None:
+            areas.append(area)
+
+    try:
+        ffmpeg.execute()
+    except errors.FFmpegError as e:
+        logger.warning("Crop detection failed", extra={"file": file_path, "start": start, "error": str(e)})
+        return None
+    # Without reset the last report covers the whole slice
+    return areas[-1] if areas else None
+
+
+def union(areas: list[CropArea]) -> CropArea:
+    left = min(area.x for area in areas)
+    top = min(area.y for area in areas)
+    right = max(area.x + area.width for area in areas)
+    bottom = max(area.y + area.height for area in areas)
+    return CropArea(right - left, bottom - top, left, top)
+
+
+def settle_crop(areas: list[CropArea], width: int, height: int) -> CropArea | None:
+    """
+    Combines the boxes of all slices into the crop of the stream, None if the stream should not be cropped.
+    """
+    if not areas:
+        return None
+    area = union(areas)
+    if area.width * area.height > width * height * (1 - MIN_REDUCTION):
+        return None
+    if area.width < width / 2 or area.height < height / 2:
+        logger.warning("Implausible crop ignored", extra={"crop": area.filter(), "width": width, "height": height})
+        return None
+    return area
+
+
+def detect_crop(file_path: str, ffprobe: Ffprobe, stream: Stream) -> CropArea | None:
+    """
+    Detects black bars of a video stream.
+
+    Args:
+        file_path (str): The path to the media file.
+        ffprobe (Ffprobe): Probe result of the file, for its duration.
+        stream (Stream): The video stream to analyse.
+
+    Returns:
+        CropArea | None: The area to keep, None if there is nothing to crop.
+    """
+    if not stream.width or not stream.height:
+        return None
+    key = None
+    if crop_cache is not None:
+        key = f"{file_identity(file_path)}:{stream.index}"
+        cached = crop_cache.get(key)
+        if cached is not None:
+            logger.info("Crop cache hit", extra={"file": file_path})
+            data = json.loads(cached)
+            return CropArea(*data) if data is not None else None
+    try:
+        duration = float(stream.duration or ffprobe.format.duration or 0)
+    except ValueError:
+        duration = 0.0
+    if duration > SAMPLE_SECONDS * SAMPLES:
+        starts = [duration * (idx + 1) / (SAMPLES + 1) for idx in range(SAMPLES)]
+    else:
+        starts = [0.0]
+    logger.info("Detecting crop", extra={"file": file_path, "index": stream.index, "samples": len(starts)})
+    areas = [area for area in (sample_crop(file_path, stream.index, start) for start in starts) if area is not None]
+    crop = settle_crop(areas, stream.width, stream.height)
+    logger.info("Detected crop", extra={"file": file_path, "index": stream.index, "crop": crop.filter() if crop else None})
+    if key is not None:
+        crop_cache.set(key, json.dumps(list(crop) if crop is not None else None).encode())  # type: ignore
+    return crop
@@ -1,6 +1,7 @@
 from collections.abc import Callable
 from dataclasses import dataclass, field
 from datetime import datetime
+from functools import lru_cache
 from typing import Any, TypeVar, cast
 
 import dateutil.parser
@@ -27,9 +28,23 @@ def from_union(fs, x):
     raise AssertionError()
 
 
+def from_optional[T](f: Callable[[Any], T], x: Any) -> T | None:
+    """
+    Same as from_union([f, from_none], x), without raising and catching an AssertionError for every missing field.
+    """
+    if x is None:
+        return None
+    return f(x)
+
+
+@lru_cache(maxsize=4096)
+def parse_datetime(x: str) -> datetime:
+    return dateutil.parser.parse(x)
+
+
 def from_datetime(x: Any) -> datetime:
     assert isinstance(x, str)
-    return dateutil.parser.parse(x)
+    return parse_datetime(x)
 
 
 def from_int(x: Any) -> int:
@@ -55,7 +70,7 @@ def from_list[T](f: Callable[[Any], T], x: Any) -> list[T]:
     return [f(y) for y in x]
 
 
-@dataclass
+@dataclass(slots=True)
 class FormatTags:
     empty: str | None = None
     abj: str | None = None
@@ -132,77 +147,77 @@ class FormatTags:
     @staticmethod
     def from_dict(obj: Any) -> "FormatTags":
         assert isinstance(obj, dict)
-        empty = from_union([from_str, from_none], obj.get(""))
-        abj = from_union([from_str, from_none], obj.get("abj"))
-        actor = from_union([from_str, from_none], obj.get("actor"))
-        artist = from_union([from_str, from_none], obj.get("artist"))
-        audiodelay = from_union([from_str, from_none], obj.get("audiodelay"))
-        bitrate = from_union([from_str, from_none], obj.get("bitrate"))
-        canseektoend = from_union([from_str, from_none], obj.get("canseektoend"))
-        com_android_capture_fps = from_union([from_str, from_none], obj.get("com.android.capture.fps"))
-        com_android_version = from_union([from_str, from_none], obj.get("com.android.version"))
-        com_apple_quicktime_author = from_union([from_str, from_none], obj.get("com.apple.quicktime.author"))
-        com_apple_quicktime_description = from_union([from_str, from_none], obj.get("com.apple.quicktime.description"))
-        com_apple_quicktime_displayname = from_union([from_str, from_none], obj.get("com.apple.quicktime.displayname"))
-        com_apple_quicktime_keywords = from_union([from_str, from_none], obj.get("com.apple.quicktime.keywords"))
-        com_apple_quicktime_title = from_union([from_str, from_none], obj.get("com.apple.quicktime.title"))
-        comment = from_union([from_str, from_none], obj.get("comment"))
-        compatible_brands = from_union([from_str, from_none], obj.get("compatible_brands"))
-        composer = from_union([from_str, from_none], obj.get("composer"))
-        contact = from_union([from_str, from_none], obj.get("contact"))
-        content_type = from_union([from_str, from_none], obj.get("content_type"))
-        copyright = from_union([from_str, from_none], obj.get("copyright"))
-        creation_time = from_union([from_str, from_none], obj.get("creation_time"))
-        creationdate = from_union([from_str, from_none], obj.get("creationdate"))
-        date = from_union([from_str, from_none], obj.get("date"))
-        date_recorded = from_union([from_str, from_none], obj.get("date_recorded"))
-        date_release = from_union([from_str, from_none], obj.get("date_release"))
-        date_released = from_union([from_str, from_none], obj.get("date_released"))
-        description = from_union([from_str, from_none], obj.get("description"))
-        director = from_union([from_str, from_none], obj.get("director"))
-        encoded_by = from_union([from_str, from_none], obj.get("encoded_by"))
-        encoder = from_union([from_str, from_none], obj.get("encoder"))
-        encoder_eng = from_union([from_str, from_none], obj.get("encoder-eng"))
-        episode_id = from_union([from_str, from_none], obj.get("episode_id"))
-        episode_sort = from_union([from_str, from_none], obj.get("episode_sort"))
-        file = from_union([from_str, from_none], obj.get("file"))
-        filters = from_union([from_str, from_none], obj.get("filters"))
-        genre = from_union([from_str, from_none], obj.get("genre"))
-        hd_video = from_union([from_str, from_none], obj.get("hd_video"))
-        hw = from_union([from_str, from_none], obj.get("hw"))
-        imdb = from_union([from_str, from_none], obj.get("imdb"))
-        imdb_eng = from_union([from_str, from_none], obj.get("imdb-eng"))
-        itunmovi = from_union([from_str, from_none], obj.get("itunmovi"))
-        keywords = from_union([from_str, from_none], obj.get("keywords"))
-        location = from_union([from_str, from_none], obj.get("location"))
-        major_brand = from_union([from_str, from_none], obj.get("major_brand"))
-        maxrate = from_union([from_str, from_none], obj.get("maxrate"))
-        media_type = from_union([from_str, from_none], obj.get("media_type"))
-        minor_version = from_union([from_str, from_none], obj.get("minor_version"))
-        modification_time = from_union([from_datetime, from_none], obj.get("modification_time"))
-        movie_comment = from_union([from_str, from_none], obj.get("movie/comment"))
-        movie_encoder = from_union([from_str, from_none], obj.get("movie/encoder"))
-        producer = from_union([from_str, from_none], obj.get("producer"))
-        production_studio = from_union([from_str, from_none], obj.get("production_studio"))
-        publisher = from_union([from_str, from_none], obj.get("publisher"))
-        purl = from_union([from_str, from_none], obj.get("purl"))
-        released_by = from_union([from_str, from_none], obj.get("released by"))
-        scene = from_union([from_str, from_none], obj.get("scene"))
-        screenplay_by = from_union([from_str, from_none], obj.get("screenplay_by"))
-        season_number = from_union([from_str, from_none], obj.get("season_number"))
-        show = from_union([from_str, from_none], obj.get("show"))
-        software = from_union([from_str, from_none], obj.get("software"))
-        synopsis = from_union([from_str, from_none], obj.get("synopsis"))
-        te_is_reencode = from_union([from_str, from_none], obj.get("te_is_reencode"))
-        timecode = from_union([from_str, from_none], obj.get("timecode"))
-        title = from_union([from_str, from_none], obj.get("title"))
-        tmdb = from_union([from_str, from_none], obj.get("tmdb"))
-        tvdb = from_union([from_str, from_none], obj.get("tvdb"))
-        tvdb2 = from_union([from_str, from_none], obj.get("tvdb2"))
-        version = from_union([from_str, from_none], obj.get("version"))
-        version_eng = from_union([from_str, from_none], obj.get("version-eng"))
-        writing_frontend = from_union([from_str, from_none], obj.get("writing frontend"))
-        written_by = from_union([from_str, from_none], obj.get("written_by"))
+        empty = from_optional(from_str, obj.get(""))
+        abj = from_optional(from_str, obj.get("abj"))
+        actor = from_optional(from_str, obj.get("actor"))
+        artist = from_optional(from_str, obj.get("artist"))
+        audiodelay = from_optional(from_str, obj.get("audiodelay"))
+        bitrate = from_optional(from_str, obj.get("bitrate"))
+        canseektoend = from_optional(from_str, obj.get("canseektoend"))
+        com_android_capture_fps = from_optional(from_str, obj.get("com.android.capture.fps"))
+        com_android_version = from_optional(from_str, obj.get("com.android.version"))
+        com_apple_quicktime_author = from_optional(from_str, obj.get("com.apple.quicktime.author"))
+        com_apple_quicktime_description = from_optional(from_str, obj.get("com.apple.quicktime.description"))
+        com_apple_quicktime_displayname = from_optional(from_str, obj.get("com.apple.quicktime.displayname"))
+        com_apple_quicktime_keywords = from_optional(from_str, obj.get("com.apple.quicktime.keywords"))
+        com_apple_quicktime_title = from_optional(from_str, obj.get("com.apple.quicktime.title"))
+        comment = from_optional(from_str, obj.get("comment"))
+        compatible_brands = from_optional(from_str, obj.get("compatible_brands"))
+        composer = from_optional(from_str, obj.get("composer"))
+        contact = from_optional(from_str, obj.get("contact"))
+        content_type = from_optional(from_str, obj.get("content_type"))
+        copyright = from_optional(from_str, obj.get("copyright"))
+        creation_time = from_optional(from_str, obj.get("creation_time"))
+        creationdate = from_optional(from_str, obj.get("creationdate"))
+        date = from_optional(from_str, obj.get("date"))
+        date_recorded = from_optional(from_str, obj.get("date_recorded"))
+        date_release = from_optional(from_str, obj.get("date_release"))
+        date_released = from_optional(from_str, obj.get("date_released"))
+        description = from_optional(from_str, obj.get("description"))
+        director = from_optional(from_str, obj.get("director"))
+        encoded_by = from_optional(from_str, obj.get("encoded_by"))
+        encoder = from_optional(from_str, obj.get("encoder"))
+        encoder_eng = from_optional(from_str, obj.get("encoder-eng"))
+        episode_id = from_optional(from_str, obj.get("episode_id"))
+        episode_sort = from_optional(from_str, obj.get("episode_sort"))
+        file = from_optional(from_str, obj.get("file"))
+        filters = from_optional(from_str, obj.get("filters"))
+        genre = from_optional(from_str, obj.get("genre"))
+        hd_video = from_optional(from_str, obj.get("hd_video"))
+        hw = from_optional(from_str, obj.get("hw"))
+        imdb = from_optional(from_str, obj.get("imdb"))
+        imdb_eng = from_optional(from_str, obj.get("imdb-eng"))
+        itunmovi = from_optional(from_str, obj.get("itunmovi"))
+        keywords = from_optional(from_str, obj.get("keywords"))
+        location = from_optional(from_str, obj.get("location"))
+        major_brand = from_optional(from_str, obj.get("major_brand"))
+        maxrate = from_optional(from_str, obj.get("maxrate"))
+        media_type = from_optional(from_str, obj.get("media_type"))
+        minor_version = from_optional(from_str, obj.get("minor_version"))
+        modification_time = from_optional(from_datetime, obj.get("modification_time"))
+        movie_comment = from_optional(from_str, obj.get("movie/comment"))
+        movie_encoder = from_optional(from_str, obj.get("movie/encoder"))
+        producer = from_optional(from_str, obj.get("producer"))
+        production_studio = from_optional(from_str, obj.get("production_studio"))
+        publisher = from_optional(from_str, obj.get("publisher"))
+        purl = from_optional(from_str, obj.get("purl"))
+        released_by = from_optional(from_str, obj.get("released by"))
+        scene = from_optional(from_str, obj.get("scene"))
+        screenplay_by = from_optional(from_str, obj.get("screenplay_by"))
+        season_number = from_optional(from_str, obj.get("season_number"))
+        show = from_optional(from_str, obj.get("show"))
+        software = from_optional(from_str, obj.get("software"))
+        synopsis = from_optional(from_str, obj.get("synopsis"))
+        te_is_reencode = from_optional(from_str, obj.get("te_is_reencode"))
+        timecode = from_optional(from_str, obj.get("timecode"))
+        title = from_optional(from_str, obj.get("title"))
+        tmdb = from_optional(from_str, obj.get("tmdb"))
+        tvdb = from_optional(from_str, obj.get("tvdb"))
+        tvdb2 = from_optional(from_str, obj.get("tvdb2"))
+        version = from_optional(from_str, obj.get("version"))
+        version_eng = from_optional(from_str, obj.get("version-eng"))
+        writing_frontend = from_optional(from_str, obj.get("writing frontend"))
+        written_by = from_optional(from_str, obj.get("written_by"))
         return FormatTags(
             empty,
             abj,
@@ -280,151 +295,151 @@ class FormatTags:
     def to_dict(self) -> dict:
         result: dict = {}
         if self.empty is not None:
-            result[""] = from_union([from_str, from_none], self.empty)
+            result[""] = from_optional(from_str, self.empty)
         if self.abj is not None:
-            result["abj"] = from_union([from_str, from_none], self.abj)
+            result["abj"] = from_optional(from_str, self.abj)
         if self.actor is not None:
-            result["actor"] = from_union([from_str, from_none], self.actor)
+            result["actor"] = from_optional(from_str, self.actor)
         if self.artist is not None:
-            result["artist"] = from_union([from_str, from_none], self.artist)
+            result["artist"] = from_optional(from_str, self.artist)
         if self.audiodelay is not None:
-            result["audiodelay"] = from_union([from_str, from_none], self.audiodelay)
+            result["audiodelay"] = from_optional(from_str, self.audiodelay)
         if self.bitrate is not None:
-            result["bitrate"] = from_union([from_str, from_none], self.bitrate)
+            result["bitrate"] = from_optional(from_str, self.bitrate)
         if self.canseektoend is not None:
-            result["canseektoend"] = from_union([from_str, from_none], self.canseektoend)
+            result["canseektoend"] = from_optional(from_str, self.canseektoend)
         if self.com_android_capture_fps is not None:
-            result["com.android.capture.fps"] = from_union([from_str, from_none], self.com_android_capture_fps)
+            result["com.android.capture.fps"] = from_optional(from_str, self.com_android_capture_fps)
         if self.com_android_version is not None:
-            result["com.android.version"] = from_union([from_str, from_none], self.com_android_version)
+            result["com.android.version"] = from_optional(from_str, self.com_android_version)
         if self.com_apple_quicktime_author is not None:
-            result["com.apple.quicktime.author"] = from_union([from_str, from_none], self.com_apple_quicktime_author)
+            result["com.apple.quicktime.author"] = from_optional(from_str, self.com_apple_quicktime_author)
         if self.com_apple_quicktime_description is not None:
-            result["com.apple.quicktime.description"] = from_union([from_str, from_none], self.com_apple_quicktime_description)
+            result["com.apple.quicktime.description"] = from_optional(from_str, self.com_apple_quicktime_description)
         if self.com_apple_quicktime_displayname is not None:
-            result["com.apple.quicktime.displayname"] = from_union([from_str, from_none], self.com_apple_quicktime_displayname)
+            result["com.apple.quicktime.displayname"] = from_optional(from_str, self.com_apple_quicktime_displayname)
         if self.com_apple_quicktime_keywords is not None:
-            result["com.apple.quicktime.keywords"] = from_union([from_str, from_none], self.com_apple_quicktime_keywords)
+            result["com.apple.quicktime.keywords"] = from_optional(from_str, self.com_apple_quicktime_keywords)
         if self.com_apple_quicktime_title is not None:
-            result["com.apple.quicktime.title"] = from_union([from_str, from_none], self.com_apple_quicktime_title)
+            result["com.apple.quicktime.title"] = from_optional(from_str, self.com_apple_quicktime_title)
         if self.comment is not None:
-            result["comment"] = from_union([from_str, from_none], self.comment)
+            result["comment"] = from_optional(from_str, self.comment)
         if self.compatible_brands is not None:
-            result["compatible_brands"] = from_union([from_str, from_none], self.compatible_brands)
+            result["compatible_brands"] = from_optional(from_str, self.compatible_brands)
         if self.composer is not None:
-            result["composer"] = from_union([from_str, from_none], self.composer)
+            result["composer"] = from_optional(from_str, self.composer)
         if self.contact is not None:
-            result["contact"] = from_union([from_str, from_none], self.contact)
+            result["contact"] = from_optional(from_str, self.contact)
         if self.content_type is not None:
-            result["content_type"] = from_union([from_str, from_none], self.content_type)
+            result["content_type"] = from_optional(from_str, self.content_type)
         if self.copyright is not None:
-            result["copyright"] = from_union([from_str, from_none], self.copyright)
+            result["copyright"] = from_optional(from_str, self.copyright)
         if self.creation_time is not None:
-            result["creation_time"] = from_union([from_str, from_none], self.creation_time)
+            result["creation_time"] = from_optional(from_str, self.creation_time)
         if self.creationdate is not None:
-            result["creationdate"] = from_union([from_str, from_none], self.creationdate)
+            result["creationdate"] = from_optional(from_str, self.creationdate)
         if self.date is not None:
-            result["date"] = from_union([from_str, from_none], self.date)
+            result["date"] = from_optional(from_str, self.date)
         if self.date_recorded is not None:
-            result["date_recorded"] = from_union([from_str, from_none], self.date_recorded)
+            result["date_recorded"] = from_optional(from_str, self.date_recorded)
         if self.date_release is not None:
-            result["date_release"] = from_union([from_str, from_none], self.date_release)
+            result["date_release"] = from_optional(from_str, self.date_release)
         if self.date_released is not None:
-            result["date_released"] = from_union([from_str, from_none], self.date_released)
+            result["date_released"] = from_optional(from_str, self.date_released)
         if self.description is not None:
-            result["description"] = from_union([from_str, from_none], self.description)
+            result["description"] = from_optional(from_str, self.description)
         if self.director is not None:
-            result["director"] = from_union([from_str, from_none], self.director)
+            result["director"] = from_optional(from_str, self.director)
         if self.encoded_by is not None:
-            result["encoded_by"] = from_union([from_str, from_none], self.encoded_by)
+            result["encoded_by"] = from_optional(from_str, self.encoded_by)
         if self.encoder is not None:
-            result["encoder"] = from_union([from_str, from_none], self.encoder)
+            result["encoder"] = from_optional(from_str, self.encoder)
         if self.encoder_eng is not None:
-            result["encoder-eng"] = from_union([from_str, from_none], self.encoder_eng)
+            result["encoder-eng"] = from_optional(from_str, self.encoder_eng)
         if self.episode_id is not None:
-            result["episode_id"] = from_union([from_str, from_none], self.episode_id)
+            result["episode_id"] = from_optional(from_str, self.episode_id)
         if self.episode_sort is not None:
-            result["episode_sort"] = from_union([from_str, from_none], self.episode_sort)
+            result["episode_sort"] = from_optional(from_str, self.episode_sort)
         if self.file is not None:
-            result["file"] = from_union([from_str, from_none], self.file)
+            result["file"] = from_optional(from_str, self.file)
         if self.filters is not None:
-            result["filters"] = from_union([from_str, from_none], self.filters)
+            result["filters"] = from_optional(from_str, self.filters)
         if self.genre is not None:
-            result["genre"] = from_union([from_str, from_none], self.genre)
+            result["genre"] = from_optional(from_str, self.genre)
         if self.hd_video is not None:
-            result["hd_video"] = from_union([from_str, from_none], self.hd_video)
+            result["hd_video"] = from_optional(from_str, self.hd_video)
         if self.hw is not None:
-            result["hw"] = from_union([from_str, from_none], self.hw)
+            result["hw"] = from_optional(from_str, self.hw)
         if self.imdb is not None:
-            result["imdb"] = from_union([from_str, from_none], self.imdb)
+            result["imdb"] = from_optional(from_str, self.imdb)
         if self.imdb_eng is not None:
-            result["imdb-eng"] = from_union([from_str, from_none], self.imdb_eng)
+            result["imdb-eng"] = from_optional(from_str, self.imdb_eng)
         if self.itunmovi is not None:
-            result["itunmovi"] = from_union([from_str, from_none], self.itunmovi)
+            result["itunmovi"] = from_optional(from_str, self.itunmovi)
         if self.keywords is not None:
-            result["keywords"] = from_union([from_str, from_none], self.keywords)
+            result["keywords"] = from_optional(from_str, self.keywords)
         if self.location is not None:
-            result["location"] = from_union([from_str, from_none], self.location)
+            result["location"] = from_optional(from_str, self.location)
         if self.major_brand is not None:
-            result["major_brand"] = from_union([from_str, from_none], self.major_brand)
+            result["major_brand"] = from_optional(from_str, self.major_brand)
         if self.maxrate is not None:
-            result["maxrate"] = from_union([from_str, from_none], self.maxrate)
+            result["maxrate"] = from_optional(from_str, self.maxrate)
         if self.media_type is not None:
-            result["media_type"] = from_union([from_str, from_none], self.media_type)
+            result["media_type"] = from_optional(from_str, self.media_type)
         if self.minor_version is not None:
-            result["minor_version"] = from_union([from_str, from_none], self.minor_version)
+            result["minor_version"] = from_optional(from_str, self.minor_version)
         if self.modification_time is not None:
-            result["modification_time"] = from_union([lambda x: x.isoformat(), from_none], self.modification_time)
+            result["modification_time"] = from_optional(lambda x: x.isoformat(), self.modification_time)
         if self.movie_comment is not None:
-            result["movie/comment"] = from_union([from_str, from_none], self.movie_comment)
+            result["movie/comment"] = from_optional(from_str, self.movie_comment)
         if self.movie_encoder is not None:
-            result["movie/encoder"] = from_union([from_str, from_none], self.movie_encoder)
+            result["movie/encoder"] = from_optional(from_str, self.movie_encoder)
         if self.producer is not None:
-            result["producer"] = from_union([from_str, from_none], self.producer)
+            result["producer"] = from_optional(from_str, self.producer)
         if self.production_studio is not None:
-            result["production_studio"] = from_union([from_str, from_none], self.production_studio)
+            result["production_studio"] = from_optional(from_str, self.production_studio)
         if self.publisher is not None:
-            result["publisher"] = from_union([from_str, from_none], self.publisher)
+            result["publisher"] = from_optional(from_str, self.publisher)
         if self.purl is not None:
-            result["purl"] = from_union([from_str, from_none], self.purl)
+            result["purl"] = from_optional(from_str, self.purl)
         if self.released_by is not None:
-            result["released by"] = from_union([from_str, from_none], self.released_by)
+            result["released by"] = from_optional(from_str, self.released_by)
         if self.scene is not None:
-            result["scene"] = from_union([from_str, from_none], self.scene)
+            result["scene"] = from_optional(from_str, self.scene)
         if self.screenplay_by is not None:
-            result["screenplay_by"] = from_union([from_str, from_none], self.screenplay_by)
+            result["screenplay_by"] = from_optional(from_str, self.screenplay_by)
         if self.season_number is not None:
-            result["season_number"] = from_union([from_str, from_none], self.season_number)
+            result["season_number"] = from_optional(from_str, self.season_number)
         if self.show is not None:
-            result["show"] = from_union([from_str, from_none], self.show)
+            result["show"] = from_optional(from_str, self.show)
         if self.software is not None:
-            result["software"] = from_union([from_str, from_none], self.software)
+            result["software"] = from_optional(from_str, self.software)
         if self.synopsis is not None:
-            result["synopsis"] = from_union([from_str, from_none], self.synopsis)
+            result["synopsis"] = from_optional(from_str, self.synopsis)
         if self.te_is_reencode is not None:
-            result["te_is_reencode"] = from_union([from_str, from_none], self.te_is_reencode)
+            result["te_is_reencode"] = from_optional(from_str, self.te_is_reencode)
         if self.timecode is not None:
-            result["timecode"] = from_union([from_str, from_none], self.timecode)
+            result["timecode"] = from_optional(from_str, self.timecode)
         if self.title is not None:
-            result["title"] = from_union([from_str, from_none], self.title)
+            result["title"] = from_optional(from_str, self.title)
         if self.tmdb is not None:
-            result["tmdb"] = from_union([from_str, from_none], self.tmdb)
+            result["tmdb"] = from_optional(from_str, self.tmdb)
         if self.tvdb is not None:
-            result["tvdb"] = from_union([from_str, from_none], self.tvdb)
+            result["tvdb"] = from_optional(from_str, self.tvdb)
         if self.tvdb2 is not None:
-            result["tvdb2"] = from_union([from_str, from_none], self.tvdb2)
+            result["tvdb2"] = from_optional(from_str, self.tvdb2)
         if self.version is not None:
-            result["version"] = from_union([from_str, from_none], self.version)
+            result["version"] = from_optional(from_str, self.version)
         if self.version_eng is not None:
-            result["version-eng"] = from_union([from_str, from_none], self.version_eng)
+            result["version-eng"] = from_optional(from_str, self.version_eng)
         if self.writing_frontend is not None:
-            result["writing frontend"] = from_union([from_str, from_none], self.writing_frontend)
+            result["writing frontend"] = from_optional(from_str, self.writing_frontend)
         if self.written_by is not None:
-            result["written_by"] = from_union([from_str, from_none], self.written_by)
+            result["written_by"] = from_optional(from_str, self.written_by)
         return result
 
 
-@dataclass
+@dataclass(slots=True)
 class Format:
     bit_rate: str
     duration: str
@@ -441,8 +456,8 @@ class Format:
     @staticmethod
     def from_dict(obj: Any) -> "Format":
         assert isinstance(obj, dict)
-        bit_rate = from_union([from_str, from_none], obj.get("bit_rate"))
-        duration = from_union([from_str, from_none], obj.get("duration"))
+        bit_rate = from_optional(from_str, obj.get("bit_rate"))
+        duration = from_optional(from_str, obj.get("duration"))
         filename = from_str(obj.get("filename"))
         format_long_name = from_str(obj.get("format_long_name"))
         format_name = from_str(obj.get("format_name"))
@@ -450,8 +465,8 @@ class Format:
         nb_streams = from_int(obj.get("nb_streams"))
         probe_score = from_int(obj.get("probe_score"))
         size = from_str(obj.get("size"))
-        start_time = from_union([from_str, from_none], obj.get("start_time"))
-        tags = from_union([FormatTags.from_dict, from_none], obj.get("tags"))
+        start_time = from_optional(from_str, obj.get("start_time"))
+        tags = from_optional(FormatTags.from_dict, obj.get("tags"))
         return Format(
             bit_rate,
             duration,
@@ -480,13 +495,13 @@ class Format:
         result["probe_score"] = from_int(self.probe_score)
         result["size"] = from_str(self.size)
         if self.start_time is not None:
-            result["start_time"] = from_union([from_str, from_none], self.start_time)
+            result["start_time"] = from_optional(from_str, self.start_time)
         if self.tags is not None:
-            result["tags"] = from_union([lambda x: to_class(FormatTags, x), from_none], self.tags)
+            result["tags"] = from_optional(lambda x: to_class(FormatTags, x), self.tags)
         return result
 
 
-@dataclass
+@dataclass(slots=True)
 class Disposition:
     attached_pic: bool
     clean_effects: bool
@@ -522,12 +537,12 @@ class Disposition:
         original = from_bool(obj.get("original"))
         timed_thumbnails = from_bool(obj.get("timed_thumbnails"))
         visual_impaired = from_bool(obj.get("visual_impaired"))
-        captions = from_union([from_bool, from_none], obj.get("captions"))
-        dependent = from_union([from_bool, from_none], obj.get("dependent"))
-        descriptions = from_union([from_bool, from_none], obj.get("descriptions"))
-        metadata = from_union([from_bool, from_none], obj.get("metadata"))
-        non_diegetic = from_union([from_bool, from_none], obj.get("non_diegetic"))
-        still_image = from_union([from_bool, from_none], obj.get("still_image"))
+        captions = from_optional(from_bool, obj.get("captions"))
+        dependent = from_optional(from_bool, obj.get("dependent"))
+        descriptions = from_optional(from_bool, obj.get("descriptions"))
+        metadata = from_optional(from_bool, obj.get("metadata"))
+        non_diegetic = from_optional(from_bool, obj.get("non_diegetic"))
+        still_image = from_optional(from_bool, obj.get("still_image"))
         return Disposition(
             attached_pic,
             clean_effects,
@@ -564,21 +579,21 @@ class Disposition:
         result["timed_thumbnails"] = from_bool(self.timed_thumbnails)
         result["visual_impaired"] = from_bool(self.visual_impaired)
         if self.captions is not None:
-            result["captions"] = from_union([from_bool, from_none], self.captions)
+            result["captions"] = from_optional(from_bool, self.captions)
         if self.dependent is not None:
-            result["dependent"] = from_union([from_bool, from_none], self.dependent)
+            result["dependent"] = from_optional(from_bool, self.dependent)
         if self.descriptions is not None:
-            result["descriptions"] = from_union([from_bool, from_none], self.descriptions)
+            result["descriptions"] = from_optional(from_bool, self.descriptions)
         if self.metadata is not None:
-            result["metadata"] = from_union([from_bool, from_none], self.metadata)
+            result["metadata"] = from_optional(from_bool, self.metadata)
         if self.non_diegetic is not None:
-            result["non_diegetic"] = from_union([from_bool, from_none], self.non_diegetic)
+            result["non_diegetic"] = from_optional(from_bool, self.non_diegetic)
         if self.still_image is not None:
-            result["still_image"] = from_union([from_bool, from_none], self.still_image)
+            result["still_image"] = from_optional(from_bool, self.still_image)
         return result
 
 
-@dataclass
+@dataclass(slots=True)
 class SideDataList:
     side_data_type: str
     avg_bitrate: int | None = None
@@ -612,32 +627,32 @@ class SideDataList:
     def from_dict(obj: Any) -> "SideDataList":
         assert isinstance(obj, dict)
         side_data_type = from_str(obj.get("side_data_type"))
-        avg_bitrate = from_union([from_int, from_none], obj.get("avg_bitrate"))
-        blue_x = from_union([from_str, from_none], obj.get("blue_x"))
-        blue_y = from_union([from_str, from_none], obj.get("blue_y"))
-        buffer_size = from_union([from_int, from_none], obj.get("buffer_size"))
-        displaymatrix = from_union([from_str, from_none], obj.get("displaymatrix"))
-        green_x = from_union([from_str, from_none], obj.get("green_x"))
-        green_y = from_union([from_str, from_none], obj.get("green_y"))
-        inverted = from_union([from_int, from_none], obj.get("inverted"))
-        max_average = from_union([from_int, from_none], obj.get("max_average"))
-        max_bitrate = from_union([from_int, from_none], obj.get("max_bitrate"))
-        max_content = from_union([from_int, from_none], obj.get("max_content"))
-        max_luminance = from_union([from_str, from_none], obj.get("max_luminance"))
-        min_bitrate = from_union([from_int, from_none], obj.get("min_bitrate"))
-        min_luminance = from_union([from_str, from_none], obj.get("min_luminance"))
-        pitch = from_union([from_int, from_none], obj.get("pitch"))
-        projection = from_union([from_str, from_none], obj.get("projection"))
-        red_x = from_union([from_str, from_none], obj.get("red_x"))
-        red_y = from_union([from_str, from_none], obj.get("red_y"))
-        roll = from_union([from_int, from_none], obj.get("roll"))
-        rotation = from_union([from_int, from_none], obj.get("rotation"))
-        service_type = from_union([from_int, from_none], obj.get("service_type"))
-        type = from_union([from_str, from_none], obj.get("type"))
-        vbv_delay = from_union([from_int, from_none], obj.get("vbv_delay"))
-        white_point_x = from_union([from_str, from_none], obj.get("white_point_x"))
-        white_point_y = from_union([from_str, from_none], obj.get("white_point_y"))
-        yaw = from_union([from_int, from_none], obj.get("yaw"))
+        avg_bitrate = from_optional(from_int, obj.get("avg_bitrate"))
+        blue_x = from_optional(from_str, obj.get("blue_x"))
+        blue_y = from_optional(from_str, obj.get("blue_y"))
+        buffer_size = from_optional(from_int, obj.get("buffer_size"))
+        displaymatrix = from_optional(from_str, obj.get("displaymatrix"))
+        green_x = from_optional(from_str, obj.get("green_x"))
+        green_y = from_optional(from_str, obj.get("green_y"))
+        inverted = from_optional(from_int, obj.get("inverted"))
+        max_average = from_optional(from_int, obj.get("max_average"))
+        max_bitrate = from_optional(from_int, obj.get("max_bitrate"))
+        max_content = from_optional(from_int, obj.get("max_content"))
+        max_luminance = from_optional(from_str, obj.get("max_luminance"))
+        min_bitrate = from_optional(from_int, obj.get("min_bitrate"))
+        min_luminance = from_optional(from_str, obj.get("min_luminance"))
+        pitch = from_optional(from_int, obj.get("pitch"))
+        projection = from_optional(from_str, obj.get("projection"))
+        red_x = from_optional(from_str, obj.get("red_x"))
+        red_y = from_optional(from_str, obj.get("red_y"))
+        roll = from_optional(from_int, obj.get("roll"))
+        rotation = from_optional(from_int, obj.get("rotation"))
+        service_type = from_optional(from_int, obj.get("service_type"))
+        type = from_optional(from_str, obj.get("type"))
+        vbv_delay = from_optional(from_int, obj.get("vbv_delay"))
+        white_point_x = from_optional(from_str, obj.get("white_point_x"))
+        white_point_y = from_optional(from_str, obj.get("white_point_y"))
+        yaw = from_optional(from_int, obj.get("yaw"))
         return SideDataList(
             side_data_type,
             avg_bitrate,
@@ -672,61 +687,61 @@ class SideDataList:
         result: dict = {}
         result["side_data_type"] = from_str(self.side_data_type)
         if self.avg_bitrate is not None:
-            result["avg_bitrate"] = from_union([from_int, from_none], self.avg_bitrate)
+            result["avg_bitrate"] = from_optional(from_int, self.avg_bitrate)
         if self.blue_x is not None:
-            result["blue_x"] = from_union([from_str, from_none], self.blue_x)
+            result["blue_x"] = from_optional(from_str, self.blue_x)
         if self.blue_y is not None:
-            result["blue_y"] = from_union([from_str, from_none], self.blue_y)
+            result["blue_y"] = from_optional(from_str, self.blue_y)
         if self.buffer_size is not None:
-            result["buffer_size"] = from_union([from_int, from_none], self.buffer_size)
+            result["buffer_size"] = from_optional(from_int, self.buffer_size)
         if self.displaymatrix is not None:
-            result["displaymatrix"] = from_union([from_str, from_none], self.displaymatrix)
+            result["displaymatrix"] = from_optional(from_str, self.displaymatrix)
         if self.green_x is not None:
-            result["green_x"] = from_union([from_str, from_none], self.green_x)
+            result["green_x"] = from_optional(from_str, self.green_x)
         if self.green_y is not None:
-            result["green_y"] = from_union([from_str, from_none], self.green_y)
+            result["green_y"] = from_optional(from_str, self.green_y)
         if self.inverted is not None:
-            result["inverted"] = from_union([from_int, from_none], self.inverted)
+            result["inverted"] = from_optional(from_int, self.inverted)
         if self.max_average is not None:
-            result["max_average"] = from_union([from_int, from_none], self.max_average)
+            result["max_average"] = from_optional(from_int, self.max_average)
         if self.max_bitrate is not None:
-            result["max_bitrate"] = from_union([from_int, from_none], self.max_bitrate)
+            result["max_bitrate"] = from_optional(from_int, self.max_bitrate)
         if self.max_content is not None:
-            result["max_content"] = from_union([from_int, from_none], self.max_content)
+            result["max_content"] = from_optional(from_int, self.max_content)
         if self.max_luminance is not None:
-            result["max_luminance"] = from_union([from_str, from_none], self.max_luminance)
+            result["max_luminance"] = from_optional(from_str, self.max_luminance)
         if self.min_bitrate is not None:
-            result["min_bitrate"] = from_union([from_int, from_none], self.min_bitrate)
+            result["min_bitrate"] = from_optional(from_int, self.min_bitrate)
         if self.min_luminance is not None:
-            result["min_luminance"] = from_union([from_str, from_none], self.min_luminance)
+            result["min_luminance"] = from_optional(from_str, self.min_luminance)
         if self.pitch is not None:
-            result["pitch"] = from_union([from_int, from_none], self.pitch)
+            result["pitch"] = from_optional(from_int, self.pitch)
         if self.projection is not None:
-            result["projection"] = from_union([from_str, from_none], self.projection)
+            result["projection"] = from_optional(from_str, self.projection)
         if self.red_x is not None:
-            result["red_x"] = from_union([from_str, from_none], self.red_x)
+            result["red_x"] = from_optional(from_str, self.red_x)
         if self.red_y is not None:
-            result["red_y"] = from_union([from_str, from_none], self.red_y)
+            result["red_y"] = from_optional(from_str, self.red_y)
         if self.roll is not None:
-            result["roll"] = from_union([from_int, from_none], self.roll)
+            result["roll"] = from_optional(from_int, self.roll)
         if self.rotation is not None:
-            result["rotation"] = from_union([from_int, from_none], self.rotation)
+            result["rotation"] = from_optional(from_int, self.rotation)
         if self.service_type is not None:
-            result["service_type"] = from_union([from_int, from_none], self.service_type)
+            result["service_type"] = from_optional(from_int, self.service_type)
         if self.type is not None:
-            result["type"] = from_union([from_str, from_none], self.type)
+            result["type"] = from_optional(from_str, self.type)
         if self.vbv_delay is not None:
-            result["vbv_delay"] = from_union([from_int, from_none], self.vbv_delay)
+            result["vbv_delay"] = from_optional(from_int, self.vbv_delay)
         if self.white_point_x is not None:
-            result["white_point_x"] = from_union([from_str, from_none], self.white_point_x)
+            result["white_point_x"] = from_optional(from_str, self.white_point_x)
         if self.white_point_y is not None:
-            result["white_point_y"] = from_union([from_str, from_none], self.white_point_y)
+            result["white_point_y"] = from_optional(from_str, self.white_point_y)
         if self.yaw is not None:
-            result["yaw"] = from_union([from_int, from_none], self.yaw)
+            result["yaw"] = from_optional(from_int, self.yaw)
         return result
 
 
-@dataclass
+@dataclass(slots=True)
 class StreamTags:
     statistics_tags: str | None = None
     statistics_tags_eng: str | None = None
@@ -761,35 +776,35 @@ class StreamTags:
     @staticmethod
     def from_dict(obj: Any) -> "StreamTags":
         assert isinstance(obj, dict)
-        statistics_tags = from_union([from_str, from_none], obj.get("_statistics_tags"))
-        statistics_tags_eng = from_union([from_str, from_none], obj.get("_statistics_tags-eng"))
-        statistics_writing_app = from_union([from_str, from_none], obj.get("_statistics_writing_app"))
-        statistics_writing_app_eng = from_union([from_str, from_none], obj.get("_statistics_writing_app-eng"))
-        statistics_writing_date_utc = from_union([from_str, from_none], obj.get("_statistics_writing_date_utc"))
-        statistics_writing_date_utc_eng = from_union([from_str, from_none], obj.get("_statistics_writing_date_utc-eng"))
-        alpha_mode = from_union([from_str, from_none], obj.get("alpha_mode"))
-        bps = from_union([from_str, from_none], obj.get("bps"))
-        bps_eng = from_union([from_str, from_none], obj.get("bps-eng"))
-        creation_time = from_union([from_datetime, from_none], obj.get("creation_time"))
-        duration = from_union([from_str, from_none], obj.get("duration"))
-        duration_eng = from_union([from_str, from_none], obj.get("duration-eng"))
-        encoder = from_union([from_str, from_none], obj.get("encoder"))
-        encoder_options = from_union([from_str, from_none], obj.get("encoder_options"))
-        filename = from_union([from_str, from_none], obj.get("filename"))
-        handler_name = from_union([from_str, from_none], obj.get("handler_name"))
-        language = from_union([from_str, from_none], obj.get("language"))
-        mimetype = from_union([from_str, from_none], obj.get("mimetype"))
-        number_of_bytes = from_union([from_str, from_none], obj.get("number_of_bytes"))
-        number_of_bytes_eng = from_union([from_str, from_none], obj.get("number_of_bytes-eng"))
-        number_of_frames = from_union([from_str, from_none], obj.get("number_of_frames"))
-        number_of_frames_eng = from_union([from_str, from_none], obj.get("number_of_frames-eng"))
-        source = from_union([from_str, from_none], obj.get("source"))
-        source_id = from_union([from_str, from_none], obj.get("source_id"))
-        source_id_eng = from_union([from_str, from_none], obj.get("source_id-eng"))
-        timecode = from_union([from_str, from_none], obj.get("timecode"))
-        title = from_union([from_str, from_none], obj.get("title"))
-        track = from_union([from_str, from_none], obj.get("track"))
-        vendor_id = from_union([from_str, from_none], obj.get("vendor_id"))
+        statistics_tags = from_optional(from_str, obj.get("_statistics_tags"))
+        statistics_tags_eng = from_optional(from_str, obj.get("_statistics_tags-eng"))
+        statistics_writing_app = from_optional(from_str, obj.get("_statistics_writing_app"))
+        statistics_writing_app_eng = from_optional(from_str, obj.get("_statistics_writing_app-eng"))
+        statistics_writing_date_utc = from_optional(from_str, obj.get("_statistics_writing_date_utc"))
+        statistics_writing_date_utc_eng = from_optional(from_str, obj.get("_statistics_writing_date_utc-eng"))
+        alpha_mode = from_optional(from_str, obj.get("alpha_mode"))
+        bps = from_optional(from_str, obj.get("bps"))
+        bps_eng = from_optional(from_str, obj.get("bps-eng"))
+        creation_time = from_optional(from_datetime, obj.get("creation_time"))
+        duration = from_optional(from_str, obj.get("duration"))
+        duration_eng = from_optional(from_str, obj.get("duration-eng"))
+        encoder = from_optional(from_str, obj.get("encoder"))
+        encoder_options = from_optional(from_str, obj.get("encoder_options"))
+        filename = from_optional(from_str, obj.get("filename"))
+        handler_name = from_optional(from_str, obj.get("handler_name"))
+        language = from_optional(from_str, obj.get("language"))
+        mimetype = from_optional(from_str, obj.get("mimetype"))
+        number_of_bytes = from_optional(from_str, obj.get("number_of_bytes"))
+        number_of_bytes_eng = from_optional(from_str, obj.get("number_of_bytes-eng"))
+        number_of_frames = from_optional(from_str, obj.get("number_of_frames"))
+        number_of_frames_eng = from_optional(from_str, obj.get("number_of_frames-eng"))
+        source = from_optional(from_str, obj.get("source"))
+        source_id = from_optional(from_str, obj.get("source_id"))
+        source_id_eng = from_optional(from_str, obj.get("source_id-eng"))
+        timecode = from_optional(from_str, obj.get("timecode"))
+        title = from_optional(from_str, obj.get("title"))
+        track = from_optional(from_str, obj.get("track"))
+        vendor_id = from_optional(from_str, obj.get("vendor_id"))
         return StreamTags(
             statistics_tags,
             statistics_tags_eng,
@@ -825,67 +840,67 @@ class StreamTags:
     def to_dict(self) -> dict:
         result: dict = {}
         if self.statistics_tags is not None:
-            result["_statistics_tags"] = from_union([from_str, from_none], self.statistics_tags)
+            result["_statistics_tags"] = from_optional(from_str, self.statistics_tags)
         if self.statistics_tags_eng is not None:
-            result["_statistics_tags-eng"] = from_union([from_str, from_none], self.statistics_tags_eng)
+            result["_statistics_tags-eng"] = from_optional(from_str, self.statistics_tags_eng)
         if self.statistics_writing_app is not None:
-            result["_statistics_writing_app"] = from_union([from_str, from_none], self.statistics_writing_app)
+            result["_statistics_writing_app"] = from_optional(from_str, self.statistics_writing_app)
         if self.statistics_writing_app_eng is not None:
-            result["_statistics_writing_app-eng"] = from_union([from_str, from_none], self.statistics_writing_app_eng)
+            result["_statistics_writing_app-eng"] = from_optional(from_str, self.statistics_writing_app_eng)
         if self.statistics_writing_date_utc is not None:
-            result["_statistics_writing_date_utc"] = from_union([from_str, from_none], self.statistics_writing_date_utc)
+            result["_statistics_writing_date_utc"] = from_optional(from_str, self.statistics_writing_date_utc)
         if self.statistics_writing_date_utc_eng is not None:
-            result["_statistics_writing_date_utc-eng"] = from_union([from_str, from_none], self.statistics_writing_date_utc_eng)
+            result["_statistics_writing_date_utc-eng"] = from_optional(from_str, self.statistics_writing_date_utc_eng)
         if self.alpha_mode is not None:
-            result["alpha_mode"] = from_union([from_str, from_none], self.alpha_mode)
+            result["alpha_mode"] = from_optional(from_str, self.alpha_mode)
         if self.bps is not None:
-            result["bps"] = from_union([from_str, from_none], self.bps)
+            result["bps"] = from_optional(from_str, self.bps)
         if self.bps_eng is not None:
-            result["bps-eng"] = from_union([from_str, from_none], self.bps_eng)
+            result["bps-eng"] = from_optional(from_str, self.bps_eng)
         if self.creation_time is not None:
-            result["creation_time"] = from_union([lambda x: x.isoformat(), from_none], self.creation_time)
+            result["creation_time"] = from_optional(lambda x: x.isoformat(), self.creation_time)
         if self.duration is not None:
-            result["duration"] = from_union([from_str, from_none], self.duration)
+            result["duration"] = from_optional(from_str, self.duration)
         if self.duration_eng is not None:
-            result["duration-eng"] = from_union([from_str, from_none], self.duration_eng)
+            result["duration-eng"] = from_optional(from_str, self.duration_eng)
         if self.encoder is not None:
-            result["encoder"] = from_union([from_str, from_none], self.encoder)
+            result["encoder"] = from_optional(from_str, self.encoder)
         if self.encoder_options is not None:
-            result["encoder_options"] = from_union([from_str, from_none], self.encoder_options)
+            result["encoder_options"] = from_optional(from_str, self.encoder_options)
         if self.filename is not None:
-            result["filename"] = from_union([from_str, from_none], self.filename)
+            result["filename"] = from_optional(from_str, self.filename)
         if self.handler_name is not None:
-            result["handler_name"] = from_union([from_str, from_none], self.handler_name)
+            result["handler_name"] = from_optional(from_str, self.handler_name)
         if self.language is not None:
-            result["language"] = from_union([from_str, from_none], self.language)
+            result["language"] = from_optional(from_str, self.language)
         if self.mimetype is not None:
-            result["mimetype"] = from_union([from_str, from_none], self.mimetype)
+            result["mimetype"] = from_optional(from_str, self.mimetype)
         if self.number_of_bytes is not None:
-            result["number_of_bytes"] = from_union([from_str, from_none], self.number_of_bytes)
+            result["number_of_bytes"] = from_optional(from_str, self.number_of_bytes)
         if self.number_of_bytes_eng is not None:
-            result["number_of_bytes-eng"] = from_union([from_str, from_none], self.number_of_bytes_eng)
+            result["number_of_bytes-eng"] = from_optional(from_str, self.number_of_bytes_eng)
         if self.number_of_frames is not None:
-            result["number_of_frames"] = from_union([from_str, from_none], self.number_of_frames)
+            result["number_of_frames"] = from_optional(from_str, self.number_of_frames)
         if self.number_of_frames_eng is not None:
-            result["number_of_frames-eng"] = from_union([from_str, from_none], self.number_of_frames_eng)
+            result["number_of_frames-eng"] = from_optional(from_str, self.number_of_frames_eng)
         if self.source is not None:
-            result["source"] = from_union([from_str, from_none], self.source)
+            result["source"] = from_optional(from_str, self.source)
         if self.source_id is not None:
-            result["source_id"] = from_union([from_str, from_none], self.source_id)
+            result["source_id"] = from_optional(from_str, self.source_id)
         if self.source_id_eng is not None:
-            result["source_id-eng"] = from_union([from_str, from_none], self.source_id_eng)
+            result["source_id-eng"] = from_optional(from_str, self.source_id_eng)
         if self.timecode is not None:
-            result["timecode"] = from_union([from_str, from_none], self.timecode)
+            result["timecode"] = from_optional(from_str, self.timecode)
         if self.title is not None:
-            result["title"] = from_union([from_str, from_none], self.title)
+            result["title"] = from_optional(from_str, self.title)
         if self.track is not None:
-            result["track"] = from_union([from_str, from_none], self.track)
+            result["track"] = from_optional(from_str, self.track)
         if self.vendor_id is not None:
-            result["vendor_id"] = from_union([from_str, from_none], self.vendor_id)
+            result["vendor_id"] = from_optional(from_str, self.vendor_id)
         return result
 
 
-@dataclass
+@dataclass(slots=True)
 class Stream:
     avg_frame_rate: str
     codec_tag: str
@@ -955,57 +970,54 @@ class Stream:
         index = from_int(obj.get("index"))
         r_frame_rate = from_str(obj.get("r_frame_rate"))
         time_base = from_str(obj.get("time_base"))
-        bit_rate = from_union([from_str, from_none], obj.get("bit_rate"))
-        bits_per_raw_sample = from_union([from_str, from_none], obj.get("bits_per_raw_sample"))
-        bits_per_sample = from_union([from_int, from_none], obj.get("bits_per_sample"))
-        channel_layout = from_union([from_str, from_none], obj.get("channel_layout"))
-        channels = from_union([from_int, from_none], obj.get("channels"))
-        chroma_location = from_union([from_str, from_none], obj.get("chroma_location"))
-        closed_captions = from_union([from_int, from_none], obj.get("closed_captions"))
-        codec_long_name = from_union([from_str, from_none], obj.get("codec_long_name"))
-        codec_name = from_union([from_str, from_none], obj.get("codec_name"))
-        coded_height = from_union([from_int, from_none], obj.get("coded_height"))
-        coded_width = from_union([from_int, from_none], obj.get("coded_width"))
-        color_primaries = from_union([from_str, from_none], obj.get("color_primaries"))
-        color_range = from_union([from_str, from_none], obj.get("color_range"))
-        color_space = from_union([from_str, from_none], obj.get("color_space"))
-        color_transfer = from_union([from_str, from_none], obj.get("color_transfer"))
-        display_aspect_ratio = from_union([from_str, from_none], obj.get("display_aspect_ratio"))
-        divx_packed = from_union([from_str, from_none], obj.get("divx_packed"))
-        dmix_mode = from_union([from_str, from_none], obj.get("dmix_mode"))
-        duration = from_union([from_str, from_none], obj.get("duration"))
-        duration_ts = from_union([from_int, from_none], obj.get("duration_ts"))
-        extradata_size = from_union([from_int, from_none], obj.get("extradata_size"))
-        field_order = from_union([from_str, from_none], obj.get("field_order"))
-        film_grain = from_union([from_int, from_none], obj.get("film_grain"))
-        has_b_frames = from_union([from_int, from_none], obj.get("has_b_frames"))
-        height = from_union([from_int, from_none], obj.get("height"))
-        id = from_union([from_str, from_none], obj.get("id"))
-        initial_padding = from_union([from_int, from_none], obj.get("initial_padding"))
-        is_avc = from_union([from_str, from_none], obj.get("is_avc"))
-        level = from_union([from_int, from_none], obj.get("level"))
-        loro_cmixlev = from_union([from_str, from_none], obj.get("loro_cmixlev"))
-        loro_surmixlev = from_union([from_str, from_none], obj.get("loro_surmixlev"))
-        ltrt_cmixlev = from_union([from_str, from_none], obj.get("ltrt_cmixlev"))
-        ltrt_surmixlev = from_union([from_str, from_none], obj.get("ltrt_surmixlev"))
-        missing_streams = from_union([from_str, from_none], obj.get("missing_streams"))
-        nal_length_size = from_union([from_str, from_none], obj.get("nal_length_size"))
-        nb_frames = from_union([from_str, from_none], obj.get("nb_frames"))
-        pix_fmt = from_union([from_str, from_none], obj.get("pix_fmt"))
-        profile = from_union([from_str, from_none], obj.get("profile"))
-        quarter_sample = from_union([from_str, from_none], obj.get("quarter_sample"))
-        refs = from_union([from_int, from_none], obj.get("refs"))
-        sample_aspect_ratio = from_union([from_str, from_none], obj.get("sample_aspect_ratio"))
-        sample_fmt = from_union([from_str, from_none], obj.get("sample_fmt"))
-        sample_rate = from_union([from_str, from_none], obj.get("sample_rate"))
-        side_data_list = from_union(
-            [lambda x: from_list(SideDataList.from_dict, x), from_none],
-            obj.get("side_data_list"),
-        )
-        start_pts = from_union([from_int, from_none], obj.get("start_pts"))
-        start_time = from_union([from_str, from_none], obj.get("start_time"))
-        tags = from_union([StreamTags.from_dict, from_none], obj.get("tags"))
-        width = from_union([from_int, from_none], obj.get("width"))
+        bit_rate = from_optional(from_str, obj.get("bit_rate"))
+        bits_per_raw_sample = from_optional(from_str, obj.get("bits_per_raw_sample"))
+        bits_per_sample = from_optional(from_int, obj.get("bits_per_sample"))
+        channel_layout = from_optional(from_str, obj.get("channel_layout"))
+        channels = from_optional(from_int, obj.get("channels"))
+        chroma_location = from_optional(from_str, obj.get("chroma_location"))
+        closed_captions = from_optional(from_int, obj.get("closed_captions"))
+        codec_long_name = from_optional(from_str, obj.get("codec_long_name"))
+        codec_name = from_optional(from_str, obj.get("codec_name"))
+        coded_height = from_optional(from_int, obj.get("coded_height"))
+        coded_width = from_optional(from_int, obj.get("coded_width"))
+        color_primaries = from_optional(from_str, obj.get("color_primaries"))
+        color_range = from_optional(from_str, obj.get("color_range"))
+        color_space = from_optional(from_str, obj.get("color_space"))
+        color_transfer = from_optional(from_str, obj.get("color_transfer"))
+        display_aspect_ratio = from_optional(from_str, obj.get("display_aspect_ratio"))
+        divx_packed = from_optional(from_str, obj.get("divx_packed"))
+        dmix_mode = from_optional(from_str, obj.get("dmix_mode"))
+        duration = from_optional(from_str, obj.get("duration"))
+        duration_ts = from_optional(from_int, obj.get("duration_ts"))
+        extradata_size = from_optional(from_int, obj.get("extradata_size"))
+        field_order = from_optional(from_str, obj.get("field_order"))
+        film_grain = from_optional(from_int, obj.get("film_grain"))
+        has_b_frames = from_optional(from_int, obj.get("has_b_frames"))
+        height = from_optional(from_int, obj.get("height"))
+        id = from_optional(from_str, obj.get("id"))
+        initial_padding = from_optional(from_int, obj.get("initial_padding"))
+        is_avc = from_optional(from_str, obj.get("is_avc"))
+        level = from_optional(from_int, obj.get("level"))
+        loro_cmixlev = from_optional(from_str, obj.get("loro_cmixlev"))
+        loro_surmixlev = from_optional(from_str, obj.get("loro_surmixlev"))
+        ltrt_cmixlev = from_optional(from_str, obj.get("ltrt_cmixlev"))
+        ltrt_surmixlev = from_optional(from_str, obj.get("ltrt_surmixlev"))
+        missing_streams = from_optional(from_str, obj.get("missing_streams"))
+        nal_length_size = from_optional(from_str, obj.get("nal_length_size"))
+        nb_frames = from_optional(from_str, obj.get("nb_frames"))
+        pix_fmt = from_optional(from_str, obj.get("pix_fmt"))
+        profile = from_optional(from_str, obj.get("profile"))
+        quarter_sample = from_optional(from_str, obj.get("quarter_sample"))
+        refs = from_optional(from_int, obj.get("refs"))
+        sample_aspect_ratio = from_optional(from_str, obj.get("sample_aspect_ratio"))
+        sample_fmt = from_optional(from_str, obj.get("sample_fmt"))
+        sample_rate = from_optional(from_str, obj.get("sample_rate"))
+        side_data_list = from_optional(lambda x: from_list(SideDataList.from_dict, x), obj.get("side_data_list"))
+        start_pts = from_optional(from_int, obj.get("start_pts"))
+        start_time = from_optional(from_str, obj.get("start_time"))
+        tags = from_optional(StreamTags.from_dict, obj.get("tags"))
+        width = from_optional(from_int, obj.get("width"))
         return Stream(
             avg_frame_rate,
             codec_tag,
@@ -1076,111 +1088,105 @@ class Stream:
         result["r_frame_rate"] = from_str(self.r_frame_rate)
         result["time_base"] = from_str(self.time_base)
         if self.bit_rate is not None:
-            result["bit_rate"] = from_union([from_str, from_none], self.bit_rate)
+            result["bit_rate"] = from_optional(from_str, self.bit_rate)
         if self.bits_per_raw_sample is not None:
-            result["bits_per_raw_sample"] = from_union([from_str, from_none], self.bits_per_raw_sample)
+            result["bits_per_raw_sample"] = from_optional(from_str, self.bits_per_raw_sample)
         if self.bits_per_sample is not None:
-            result["bits_per_sample"] = from_union([from_int, from_none], self.bits_per_sample)
+            result["bits_per_sample"] = from_optional(from_int, self.bits_per_sample)
         if self.channel_layout is not None:
-            result["channel_layout"] = from_union([from_str, from_none], self.channel_layout)
+            result["channel_layout"] = from_optional(from_str, self.channel_layout)
         if self.channels is not None:
-            result["channels"] = from_union([from_int, from_none], self.channels)
+            result["channels"] = from_optional(from_int, self.channels)
         if self.chroma_location is not None:
-            result["chroma_location"] = from_union([from_str, from_none], self.chroma_location)
+            result["chroma_location"] = from_optional(from_str, self.chroma_location)
         if self.closed_captions is not None:
-            result["closed_captions"] = from_union([from_int, from_none], self.closed_captions)
+            result["closed_captions"] = from_optional(from_int, self.closed_captions)
         if self.codec_long_name is not None:
-            result["codec_long_name"] = from_union([from_str, from_none], self.codec_long_name)
+            result["codec_long_name"] = from_optional(from_str, self.codec_long_name)
         if self.codec_name is not None:
-            result["codec_name"] = from_union([from_str, from_none], self.codec_name)
+            result["codec_name"] = from_optional(from_str, self.codec_name)
         if self.coded_height is not None:
-            result["coded_height"] = from_union([from_int, from_none], self.coded_height)
+            result["coded_height"] = from_optional(from_int, self.coded_height)
         if self.coded_width is not None:
-            result["coded_width"] = from_union([from_int, from_none], self.coded_width)
+            result["coded_width"] = from_optional(from_int, self.coded_width)
         if self.color_primaries is not None:
-            result["color_primaries"] = from_union([from_str, from_none], self.color_primaries)
+            result["color_primaries"] = from_optional(from_str, self.color_primaries)
         if self.color_range is not None:
-            result["color_range"] = from_union([from_str, from_none], self.color_range)
+            result["color_range"] = from_optional(from_str, self.color_range)
         if self.color_space is not None:
-            result["color_space"] = from_union([from_str, from_none], self.color_space)
+            result["color_space"] = from_optional(from_str, self.color_space)
         if self.color_transfer is not None:
-            result["color_transfer"] = from_union([from_str, from_none], self.color_transfer)
+            result["color_transfer"] = from_optional(from_str, self.color_transfer)
         if self.display_aspect_ratio is not None:
-            result["display_aspect_ratio"] = from_union([from_str, from_none], self.display_aspect_ratio)
+            result["display_aspect_ratio"] = from_optional(from_str, self.display_aspect_ratio)
         if self.divx_packed is not None:
-            result["divx_packed"] = from_union([from_str, from_none], self.divx_packed)
+            result["divx_packed"] = from_optional(from_str, self.divx_packed)
         if self.dmix_mode is not None:
-            result["dmix_mode"] = from_union([from_str, from_none], self.dmix_mode)
+            result["dmix_mode"] = from_optional(from_str, self.dmix_mode)
         if self.duration is not None:
-            result["duration"] = from_union([from_str, from_none], self.duration)
+            result["duration"] = from_optional(from_str, self.duration)
         if self.duration_ts is not None:
-            result["duration_ts"] = from_union([from_int, from_none], self.duration_ts)
+            result["duration_ts"] = from_optional(from_int, self.duration_ts)
         if self.extradata_size is not None:
-            result["extradata_size"] = from_union([from_int, from_none], self.extradata_size)
+            result["extradata_size"] = from_optional(from_int, self.extradata_size)
         if self.field_order is not None:
-            result["field_order"] = from_union([from_str, from_none], self.field_order)
+            result["field_order"] = from_optional(from_str, self.field_order)
         if self.film_grain is not None:
-            result["film_grain"] = from_union([from_int, from_none], self.film_grain)
+            result["film_grain"] = from_optional(from_int, self.film_grain)
         if self.has_b_frames is not None:
-            result["has_b_frames"] = from_union([from_int, from_none], self.has_b_frames)
+            result["has_b_frames"] = from_optional(from_int, self.has_b_frames)
         if self.height is not None:
-            result["height"] = from_union([from_int, from_none], self.height)
+            result["height"] = from_optional(from_int, self.height)
         if self.id is not None:
-            result["id"] = from_union([from_str, from_none], self.id)
+            result["id"] = from_optional(from_str, self.id)
         if self.initial_padding is not None:
-            result["initial_padding"] = from_union([from_int, from_none], self.initial_padding)
+            result["initial_padding"] = from_optional(from_int, self.initial_padding)
         if self.is_avc is not None:
-            result["is_avc"] = from_union([from_str, from_none], self.is_avc)
+            result["is_avc"] = from_optional(from_str, self.is_avc)
         if self.level is not None:
-            result["level"] = from_union([from_int, from_none], self.level)
+            result["level"] = from_optional(from_int, self.level)
         if self.loro_cmixlev is not None:
-            result["loro_cmixlev"] = from_union([from_str, from_none], self.loro_cmixlev)
+            result["loro_cmixlev"] = from_optional(from_str, self.loro_cmixlev)
         if self.loro_surmixlev is not None:
-            result["loro_surmixlev"] = from_union([from_str, from_none], self.loro_surmixlev)
+            result["loro_surmixlev"] = from_optional(from_str, self.loro_surmixlev)
         if self.ltrt_cmixlev is not None:
-            result["ltrt_cmixlev"] = from_union([from_str, from_none], self.ltrt_cmixlev)
+            result["ltrt_cmixlev"] = from_optional(from_str, self.ltrt_cmixlev)
         if self.ltrt_surmixlev is not None:
-            result["ltrt_surmixlev"] = from_union([from_str, from_none], self.ltrt_surmixlev)
+            result["ltrt_surmixlev"] = from_optional(from_str, self.ltrt_surmixlev)
         if self.missing_streams is not None:
-            result["missing_streams"] = from_union([from_str, from_none], self.missing_streams)
+            result["missing_streams"] = from_optional(from_str, self.missing_streams)
         if self.nal_length_size is not None:
-            result["nal_length_size"] = from_union([from_str, from_none], self.nal_length_size)
+            result["nal_length_size"] = from_optional(from_str, self.nal_length_size)
         if self.nb_frames is not None:
-            result["nb_frames"] = from_union([from_str, from_none], self.nb_frames)
+            result["nb_frames"] = from_optional(from_str, self.nb_frames)
         if self.pix_fmt is not None:
-            result["pix_fmt"] = from_union([from_str, from_none], self.pix_fmt)
+            result["pix_fmt"] = from_optional(from_str, self.pix_fmt)
         if self.profile is not None:
-            result["profile"] = from_union([from_str, from_none], self.profile)
+            result["profile"] = from_optional(from_str, self.profile)
         if self.quarter_sample is not None:
-            result["quarter_sample"] = from_union([from_str, from_none], self.quarter_sample)
+            result["quarter_sample"] = from_optional(from_str, self.quarter_sample)
         if self.refs is not None:
-            result["refs"] = from_union([from_int, from_none], self.refs)
+            result["refs"] = from_optional(from_int, self.refs)
         if self.sample_aspect_ratio is not None:
-            result["sample_aspect_ratio"] = from_union([from_str, from_none], self.sample_aspect_ratio)
+            result["sample_aspect_ratio"] = from_optional(from_str, self.sample_aspect_ratio)
         if self.sample_fmt is not None:
-            result["sample_fmt"] = from_union([from_str, from_none], self.sample_fmt)
+            result["sample_fmt"] = from_optional(from_str, self.sample_fmt)
         if self.sample_rate is not None:
-            result["sample_rate"] = from_union([from_str, from_none], self.sample_rate)
+            result["sample_rate"] = from_optional(from_str, self.sample_rate)
         if self.side_data_list is not None:
-            result["side_data_list"] = from_union(
-                [
-                    lambda x: from_list(lambda x: to_class(SideDataList, x), x),
-                    from_none,
-                ],
-                self.side_data_list,
-            )
+            result["side_data_list"] = from_optional(lambda x: from_list(lambda x: to_class(SideDataList, x), x), self.side_data_list)
         if self.start_pts is not None:
-            result["start_pts"] = from_union([from_int, from_none], self.start_pts)
+            result["start_pts"] = from_optional(from_int, self.start_pts)
         if self.start_time is not None:
-            result["start_time"] = from_union([from_str, from_none], self.start_time)
+            result["start_time"] = from_optional(from_str, self.start_time)
         if self.tags is not None:
-            result["tags"] = from_union([lambda x: to_class(StreamTags, x), from_none], self.tags)
+            result["tags"] = from_optional(lambda x: to_class(StreamTags, x), self.tags)
         if self.width is not None:
-            result["width"] = from_union([from_int, from_none], self.width)
+            result["width"] = from_optional(from_int, self.width)
         return result
 
 
-@dataclass
+@dataclass(slots=True)
 class Ffprobe:
     format: Format
     streams: list[Stream]
@@ -0,0 +1,251 @@
+"""
+encode_plan.py
+
+The complete description of one encode: which input streams end up in the output, what happens to each
+of them (copy or encoder with its options, disposition, stream metadata), global encoder parameters,
+global metadata and additional inputs.
+
+recode() derives an EncodePlan once from the probe result and its options, everything after that works on
+the plan: ffrecode(), ffrecode_chunked() and the in-place Matroska editor execute it, --dry-run prints it.
+Plans are immutable and hashable, serialize to JSON with to_dict()/from_dict() and can be compared with diff().
+"""
+
+import dataclasses
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any
+
+from recode.modules.datatypes import Ffprobe
+from recode.modules.ffmpeg_utils import list_to_dict, maplist
+
+# ffmpeg stream type specifiers by ffprobe codec type
+STREAM_TYPES = {"video": "v", "audio": "a", "subtitle": "s", "attachment": "t", "data": "d"}
+
+Options = tuple[tuple[str, str], ...]
+
+
+def options_from_dict(obj: Any) -> Options:
+    assert isinstance(obj, list)
+    return tuple((str(key), str(value)) for key, value in obj)
+
+
+@dataclass(frozen=True, slots=True)
+class StreamAction:
+    """
+    One output stream.
+
+    Args:
+        input (int): Index of the input file, 0 is the source, higher ones are EncodePlan.inputs.
+        index (int): Index of the stream in its input file.
+        stype (str): ffmpeg stream type, "v", "a", "s" or "t".
+        oindex (int): Index among the output streams of the same type.
+        codec (str | None): Encoder or "copy", None for streams that are copied implicitly (attachments).
+        options (tuple): Per-stream encoder options like (("b", "128k"),).
+        disposition (str | None): Dispositions joined by "+", "none" clears all of them.
+        metadata (tuple): Stream metadata like (("language", "deu"),).
+    """
+
+    input: int
+    index: int
+    stype: str
+    oindex: int
+    codec: str | None = None
+    options: Options = ()
+    disposition: str | None = None
+    metadata: Options = ()
+
+    @property
+    def spec(self) -> str:
+        return f"{self.stype}:{self.oindex}"
+
+    @property
+    def source(self) -> str:
+        return f"{self.input}:{self.index}"
+
+    @property
+    def encodes(self) -> bool:
+        return self.codec not in (None, "copy")
+
+    @staticmethod
+    def from_dict(obj: Any) -> "StreamAction":
+        assert isinstance(obj, dict)
+        return StreamAction(
+            input=obj["input"],
+            index=obj["index"],
+            stype=obj["stype"],
+            oindex=obj["oindex"],
+            codec=obj.get("codec"),
+            options=options_from_dict(obj.get("options", [])),
+            disposition=obj.get("disposition"),
+            metadata=options_from_dict(obj.get("metadata", [])),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "input": self.input,
+            "index": self.index,
+            "stype": self.stype,
+            "oindex": self.oindex,
+            "codec": self.codec,
+            "options": [list(option) for option in self.options],
+            "disposition": self.disposition,
+            "metadata": [list(item) for item in self.metadata],
+        }
+
+    def output_args(self) -> dict[str, str | list[str]]:
+        """The output options of the stream. Several metadata items repeat the -metadata option of the stream."""
+        args: dict[str, str | list[str]] = {}
+        if self.codec is not None:
+            args[f"c:{self.spec}"] = self.codec
+        for key, value in self.options:
+            args[f"{key}:{self.spec}"] = value
+        if self.disposition is not None:
+            args[f"disposition:{self.spec}"] = self.disposition
+        if self.metadata:
+            args[f"metadata:s:{self.spec}"] = [f"{key}={value}" for key, value in self.metadata]
+        return args
+
+
+@dataclass(frozen=True, slots=True)
+class EncodePlan:
+    """
+    Args:
+        streams (tuple): The output streams in output order.
+        encoder (tuple): Output options that apply to all streams, like (("crf", "23"), ("preset", "veryslow")).
+        metadata (tuple): Global metadata of the output.
+        inputs (tuple): Input files after the source, e.g. external subtitles.
+    """
+
+    streams: tuple[StreamAction, ...]
+    encoder: Options = ()
+    metadata: Options = ()
+    inputs: tuple[str, ...] = ()
+
+    @staticmethod
+    def from_args(
+        ffprobe: Ffprobe,
+        ffmpeg_mapping: list,
+        ffmpeg_recoding: list,
+        ffmpeg_dispositions: list,
+        ffmpeg_metadata: list,
+        additional_files: list,
+    ) -> "EncodePlan":
+        """
+        Builds a plan from the ffmpeg argument lists recode() assembles while walking the streams.
+        Options for a stream specifier that is not mapped are kept as global encoder options.
+        """
+        types = {stream.index: STREAM_TYPES.get(stream.codec_type or "", "d") for stream in ffprobe.streams}
+        counts: dict[str, int] = {}
+        fields: dict[str, dict[str, Any]] = {}
+        order = []
+        for item in maplist(ffmpeg_mapping):
+            file, index = (int(part) for part in item.split(":"))
+            # External inputs only ever contribute subtitle streams
+            stype = types.get(index, "d") if file == 0 else "s"
+            oindex = counts.get(stype, 0)
+            counts[stype] = oindex + 1
+            spec = f"{stype}:{oindex}"
+            fields[spec] = {"input": file, "index": index, "stype": stype, "oindex": oindex, "options": [], "metadata": []}
+            order.append(spec)
+        encoder = []
+        for key, value in list_to_dict(ffmpeg_recoding + ffmpeg_dispositions).items():
+            option, _, spec = key.partition(":")
+            if option == "metadata" and spec.startswith("s:") and spec[2:] in fields:
+                name, _, data = (value or "").partition("=")
+                fields[spec[2:]]["metadata"].append((name, data))
+            elif spec in fields and option == "c":
+                fields[spec]["codec"] = value
+            elif spec in fields and option == "disposition":
+                fields[spec]["disposition"] = value
+            elif spec in fields:
+                fields[spec]["options"].append((option, value))
+            else:
+                encoder.append((key, value))
+        metadata = []
+        for item in maplist(ffmpeg_metadata):
+            key, _, value = item.partition("=")
+            metadata.append((key, value))
+        streams = tuple(
+            StreamAction(**fields[spec] | {"options": tuple(fields[spec]["options"]), "metadata": tuple(fields[spec]["metadata"])})
+            for spec in order
+        )
+        return EncodePlan(streams=streams, encoder=tuple(encoder), metadata=tuple(metadata), inputs=tuple(additional_files))
+
+    @staticmethod
+    def from_dict(obj: Any) -> "EncodePlan":
+        assert isinstance(obj, dict)
+        return EncodePlan(
+            streams=tuple(StreamAction.from_dict(stream) for stream in obj["streams"]),
+            encoder=options_from_dict(obj.get("encoder", [])),
+            metadata=options_from_dict(obj.get("metadata", [])),
+            inputs=tuple(obj.get("inputs", [])),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "streams": [stream.to_dict() for stream in self.streams],
+            "encoder": [list(option) for option in self.encoder],
+            "metadata": [list(item) for item in self.metadata],
+            "inputs": list(self.inputs),
+        }
+
+    def to_json(self, indent: int | None = None) -> str:
+        return json.dumps(self.to_dict(), indent=indent, ensure_ascii=False)
+
+    def digest(self) -> str:
+        """Stable hash of the plan, usable as cache key across processes."""
+        return hashlib.sha1(json.dumps(self.to_dict(), sort_keys=True).encode()).hexdigest()
+
+    def output_args(self) -> dict[str, str | list[str]]:
+        """The output options of the ffmpeg command, without -map and the global -metadata."""
+        args: dict[str, str | list[str]] = dict(self.encoder)
+        for stream in self.streams:
+            args |= stream.output_args()
+        return args
+
+    def maps(self) -> list[str]:
+        return [stream.source for stream in self.streams]
+
+    def metadata_args(self) -> list[str]:
+        return [f"{key}={value}" for key, value in self.metadata]
+
+    def encoded(self, stype: str) -> list[StreamAction]:
+        """The streams of a type that are encoded, attached pictures excluded."""
+        return [s for s in self.streams if s.stype == stype and s.encodes and "attached_pic" not in (s.disposition or "")]
+
+    def copies_only(self) -> bool:
+        """True if the plan only remuxes: no encoder, no stream options and no additional inputs."""
+        return not self.inputs and not self.encoder and all(not s.encodes and not s.options for s in self.streams)
+
+    def replace_stream(self, stream: StreamAction, **changes) -> "EncodePlan":
+        streams = tuple(dataclasses.replace(s, **changes) if s == stream else s for s in self.streams)
+        return dataclasses.replace(self, streams=streams)
+
+    def replace_option(self, key: str, value: str) -> "EncodePlan":
+        """Returns the plan with a global encoder option set to `value`."""
+        encoder = tuple((k, value if k == key else v) for k, v in self.encoder)
+        if key not in dict(self.encoder):
+            encoder += ((key, value),)
+        return dataclasses.replace(self, encoder=encoder)
+
+    def diff(self, other: "EncodePlan") -> list[str]:
+        """
+        Describes how `other` differs from this plan, one line per changed stream or setting.
+        """
+        lines = []
+        mine = {stream.spec: stream for stream in self.streams}
+        theirs = {stream.spec: stream for stream in other.streams}
+        for spec in list(mine) + [spec for spec in theirs if spec not in mine]:
+            if spec not in theirs:
+                lines.append(f"- {spec} {mine[spec].to_dict()}")
+            elif spec not in mine:
+                lines.append(f"+ {spec} {theirs[spec].to_dict()}")
+            elif mine[spec] != theirs[spec]:
+                before, after = mine[spec].to_dict(), theirs[spec].to_dict()
+                changed = {key: (before[key], after[key]) for key in before if before[key] != after[key]}
+                lines.append(f"~ {spec} " + ", ".join(f"{key}: {old} -> {new}" for key, (old, new) in changed.items()))
+        for name in ("encoder", "metadata", "inputs"):
+            if getattr(self, name) != getattr(other, name):
+                lines.append(f"~ {name}: {list(getattr(self, name))} -> {list(getattr(other, name))}")
+        return lines
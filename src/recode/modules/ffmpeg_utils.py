@@ -1,13 +1,23 @@
 import datetime
 import json
 import os
+from typing import TYPE_CHECKING, Any
 
 from colorama import Fore as Color
 from colorama import Style
-from ffmpeg import FFmpeg, Progress, errors
+from ffmpeg import FFmpeg, errors
 
+from recode.modules.cache import SqliteCache, file_identity
 from recode.modules.datatypes import Ffprobe
-from recode.modules.logger import logger
+from recode.modules.logger import job_context, logger
+from recode.modules.progress import renderer
+
+if TYPE_CHECKING:
+    from recode.modules.encode_plan import EncodePlan
+
+PROBE_CACHE_SIZE = 256 * 1024 * 1024
+
+probe_cache: SqliteCache | None = None
 
 
 def list_to_dict(lst: list) -> dict:
@@ -39,42 +49,47 @@ def maplist(lst: list[str]) -> list[str]:
     return mapping
 
 
-def format_timedelta(td: datetime.timedelta) -> str:
-    total_seconds = int(td.total_seconds())
-    hours, remainder = divmod(total_seconds, 3600)
-    minutes, seconds = divmod(remainder, 60)
-    return f"{hours:02}:{minutes:02}:{seconds:02}"
+def lower_keys(pairs: list[tuple[str, Any]]) -> dict:
+    """
+    json.loads() object_pairs_hook that lowercases all keys while the document is decoded.
 
+    If several keys only differ in case, a key that was not lowercase to begin with wins, e.g. ffprobe's
+    "DURATION" tag replaces a "duration" tag of the same stream.
+    """
+    result = {}
+    renamed = set()
+    for key, value in pairs:
+        lower = key.lower()
+        if lower != key:
+            renamed.add(lower)
+            result[lower] = value
+        elif lower not in renamed:
+            result[lower] = value
+    return result
 
-def rename_keys_to_lower(iterable):
-    if isinstance(iterable, dict):
-        for key in list(iterable.keys()):
-            iterable[key.lower()] = iterable.pop(key)
-            if isinstance(iterable[key.lower()], dict) or isinstance(iterable[key.lower()], list):
-                iterable[key.lower()] = rename_keys_to_lower(iterable[key.lower()])
-    elif isinstance(iterable, list):
-        for item in iterable:
-            item = rename_keys_to_lower(item)
-    return iterable
+
+def decode_probe(data: str | bytes) -> Ffprobe:
+    """
+    Decodes ffprobe's JSON output.
+    """
+    return Ffprobe.from_dict(json.loads(data, object_pairs_hook=lower_keys))
 
 
-def human_readable_size(size_bytes):
+def enable_probe_cache(enabled: bool = True):
     """
-    Convert a file size in bytes to a human-readable string with autoscaled units.
+    Enables or disables the persistent cache of probe() results.
     """
-    if size_bytes == 0:
-        return "0B"
-    units = ["B", "KB", "MB", "GB", "TB", "PB"]
-    i = 0
-    while size_bytes >= 1024 and i < len(units) - 1:
-        size_bytes /= 1024.0
-        i += 1
-    return f"{size_bytes:.2f}{units[i]}"
+    global probe_cache
+    if enabled and probe_cache is None:
+        probe_cache = SqliteCache("probe.sqlite3", max_bytes=PROBE_CACHE_SIZE)
+    elif not enabled:
+        probe_cache = None
 
 
 def probe(file_path: str) -> Ffprobe:
     """
     Probes a media file and returns its metadata.
+    If the probe cache is enabled, results are reused as long as the file is unchanged.
 
     Args:
         file_path (str): The path to the media file.
@@ -82,98 +97,99 @@ def probe(file_path: str) -> Ffprobe:
     Returns:
         dict: A dictionary containing the metadata of the media file.
     """
+    key = None
+    if probe_cache is not None:
+        key = file_identity(file_path)
+        cached = probe_cache.get(key)
+        if cached is not None:
+            logger.info("Probe cache hit", extra={"file": file_path})
+            return decode_probe(cached)
     logger.info("Probing media file", extra={"file": file_path})
     ffprobe = FFmpeg(executable="ffprobe").input(
         file_path, print_format="json", show_streams=None, show_format=None, strict="-2", v="error"
     )
-    return Ffprobe.from_dict(rename_keys_to_lower(json.loads(ffprobe.execute())))
-
-
-def ffrecode(
-    input_file: str,
-    output_file: str,
-    ffmpeg_mapping: list,
-    ffmpeg_recoding: list,
-    ffmpeg_dispositions: list,
-    ffmpeg_metadata: list,
-    additional_files: list | None = None,
-    dump_command: bool = False,
-) -> bool:
+    result = ffprobe.execute()
+    if key is not None:
+        probe_cache.set(key, result)  # type: ignore
+    return decode_probe(result)
+
+
+def ffrecode(input_file: str, output_file: str, plan: "EncodePlan", dump_command: bool = False, duration: float | None = None) -> bool:
     """
-    Re-encodes a media file using ffmpeg with the specified arguments.
+    Re-encodes a media file using ffmpeg according to an encode plan.
 
     Args:
         input_file (str): The path to the input media file.
         output_file (str): The path to the output media file.
-        ffmpeg_mapping (list): A list of ffmpeg mapping arguments.
-        ffmpeg_recoding (list): A list of ffmpeg recoding arguments.
-        ffmpeg_dispositions (list): A list of ffmpeg disposition arguments.
-        ffmpeg_metadata (list): A list of ffmpeg metadata arguments.
+        plan (EncodePlan): Streams, options and metadata of the output.
+        duration (float | None): Duration of the input in seconds, used for the ETA.
 
     Returns:
         completed (bool): True if the recoding was completed successfully, False otherwise.
     """
     logger.info("Starting FFmpeg recoding", extra={"input": input_file, "output": output_file})
-    global completed
     completed = False
-    ffmpeg_args = list_to_dict(ffmpeg_recoding + ffmpeg_dispositions)
-    mapping = maplist(ffmpeg_mapping)
-    metadata = maplist(ffmpeg_metadata)
+    label = job_context.get()
+    prefix = f"{Color.YELLOW}{label}{Style.RESET_ALL} " if label is not None else ""
     ffmpeg = (
         FFmpeg(executable="ffmpeg")
         .option("y")
         .option("hwaccel", "auto")
         .option("strict", "-2")
         .option("v", "error")
-        .option("stats")
+        .option("nostats")
+        .option("progress", "pipe:2")
         .input(input_file)
     )
-    if additional_files:
-        logger.info("Adding additional files", extra={"count": len(additional_files)})
-        for file in additional_files:
+    if plan.inputs:
+        logger.info("Adding additional files", extra={"count": len(plan.inputs)})
+        for file in plan.inputs:
             ffmpeg = ffmpeg.input(file)
-    ffmpeg = ffmpeg.output(output_file, ffmpeg_args, f="matroska", map=mapping, metadata=metadata)
+    ffmpeg = ffmpeg.output(output_file, plan.output_args(), f="matroska", map=plan.maps(), metadata=plan.metadata_args())
     logger.info("FFmpeg configured", extra={"output_format": "matroska"})
+    state = renderer.register(label or os.path.basename(input_file), duration)
+    messages: list[str] = []
 
     @ffmpeg.on("start")
     def on_start(arguments: list[str]):
         logger.info("FFmpeg recoding started", extra={"cmd": " ".join(arguments)})
+        renderer.clear()
         if dump_command:
             print("'" + "' '".join(arguments) + "'")
-        print(f"Recoding started at {Color.GREEN}{timestart.isoformat()}{Style.RESET_ALL}")
-
-    @ffmpeg.on("progress")
-    def on_progress(progress: Progress):
-        logger.debug(
-            "FFmpeg progress",
-            extra={"frame": progress.frame, "fps": int(progress.fps), "time": format_timedelta(progress.time), "speed": progress.speed},
-        )
-        termwidth = os.get_terminal_size().columns
-        print("\r" + " " * termwidth, end="\r")
-        print(
-            f"frame={progress.frame} fps={int(progress.fps)} size={human_readable_size(progress.size)} time={format_timedelta(progress.time)} bitrate={human_readable_size(progress.bitrate)}/s speed={progress.speed}x",
-            end="\r",
-        )
+        print(f"{prefix}Recoding started at {Color.GREEN}{timestart.isoformat()}{Style.RESET_ALL}")
+
+    @ffmpeg.on("stderr")
+    def on_stderr(line: str):
+        if not state.feed(line) and line.strip():
+            logger.warning("FFmpeg message", extra={"line": line.strip()})
+            messages.append(line.strip())
 
     @ffmpeg.on("completed")
     def on_completed():
-        global completed
+        nonlocal completed
         timestop = datetime.datetime.now()
         logger.info("FFmpeg recoding completed", extra={"duration": str(timestop - timestart)})
-        print(f"\nRecoding finished at {Color.GREEN}{timestop.isoformat()}{Style.RESET_ALL}")
-        print(f"Recoding took {Color.GREEN}{timestop - timestart}{Style.RESET_ALL}")
+        renderer.unregister(state)
+        print(f"{prefix}Recoding finished at {Color.GREEN}{timestop.isoformat()}{Style.RESET_ALL}")
+        print(f"{prefix}Recoding took {Color.GREEN}{timestop - timestart}{Style.RESET_ALL}")
         completed = True
 
     @ffmpeg.on("terminated")
     def on_terminated():
         logger.error("FFmpeg process terminated")
-        print("terminated")
+        renderer.unregister(state)
+        print(f"{prefix}terminated")
 
     timestart = datetime.datetime.now()
 
     try:
         ffmpeg.execute()
     except errors.FFmpegError as e:
-        logger.error("FFmpeg error", extra={"error": str(e)})
-        print(f"\n{Color.RED}FFmpeg error:{Style.RESET_ALL} {e}")
+        # The exception carries the last stderr line, which may be progress output
+        error = messages[-1] if messages else str(e)
+        logger.error("FFmpeg error", extra={"error": error})
+        renderer.unregister(state)
+        print(f"{Color.RED}FFmpeg error:{Style.RESET_ALL} {error}")
+    finally:
+        renderer.unregister(state)
     return completed
@@ -0,0 +1,492 @@
+"""
+fingerprints.py
+
+Content fingerprints of a library, to find files that hold the same video.
+
+A fingerprint is the OpenSubtitles hash of a file together with its duration and stream layout from the
+probe: the number of video streams, their frame rate and the languages of the audio streams. Files with the
+same hash are copies of each other. Files with a different hash but the same duration and layout are twins,
+usually the same episode in two quality versions or a source and its encode, but episodes of a show often
+have the same length. So a twin only counts as the same content if its path names the same title as well:
+the same show and episode tag, or for films the same name and year. Only then it is reported as redundant
+or lets a job be skipped. The `.old` originals recode leaves behind when it replaces a file in place are
+fingerprinted as well.
+
+Fingerprints are kept in a SQLite index that is updated incrementally like the inventory. It is used to
+report duplicate groups with the space that removing them would free, and to skip jobs whose source already
+has a twin in the target codec somewhere in the library.
+"""
+
+import datetime
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import NamedTuple
+
+from colorama import Fore as Color
+from colorama import Style
+
+from recode.modules.cache import CACHE_DIR
+from recode.modules.ffmpeg_utils import probe
+from recode.modules.FileOperations import File
+from recode.modules.inventory import find_media
+from recode.modules.logger import logger
+from recode.modules.progress import format_timedelta, human_readable_size
+from recode.modules.throughput import frame_rate
+from recode.modules.video import CODECS
+
+FINGERPRINT_DB = os.path.join(CACHE_DIR, "fingerprints.db")
+LEFTOVER_SUFFIX = ".old"
+# Remuxes and encodes keep the timestamps, their durations differ by a few frames at most
+DURATION_TOLERANCE = 0.25
+FRAME_RATE_TOLERANCE = 0.01
+# Results of File.get_hash() that are not a hash
+HASH_ERRORS = {"IOError", "SizeError"}
+# Verdicts of report_duplicates() whose files can be deleted
+RECLAIMABLE = {"duplicate", "leftover", "superseded"}
+VERDICT_COLORS = {"keep": Color.GREEN, "duplicate": Color.RED, "leftover": Color.RED, "superseded": Color.YELLOW, "twin": Color.BLUE}
+
+EPISODE_PATTERN = re.compile(r"[Ss](\d{1,4})\s?((?:[Ee]\d{1,4})+)")
+FILM_PATTERN = re.compile(r"^(.*?)[\s._(\[-]*((?:19|20)\d{2})(?![\dpi])")
+SEASON_DIR_PATTERN = re.compile(r"^(season|staffel|specials)\W*\d*$", re.IGNORECASE)
+YEAR_PATTERN = re.compile(r"\(?\b(19|20)\d{2}\b\)?")
+
+COLUMNS = "path, size, moviehash, duration, videos, frame_rate, languages, video_codec"
+
+
+class Fingerprint(NamedTuple):
+    path: str
+    size: int
+    moviehash: str
+    duration: float | None
+    videos: int
+    frame_rate: float | None
+    languages: str
+    video_codec: str | None
+
+    @property
+    def leftover(self) -> bool:
+        return self.path.endswith(LEFTOVER_SUFFIX)
+
+    @property
+    def identity(self) -> str | None:
+        return content_identity(self.path)
+
+
+def normalized_title(name: str) -> str:
+    return re.sub(r"[^0-9a-z]", "", name.lower())
+
+
+def content_identity(path: str) -> str | None:
+    """
+    Returns what a file name says about its content: the show and episode tag of an episode, e.g.
+    "showname s1e2", or the name and year of a film. The show name is taken from the directories if the
+    file name starts with the tag, years are left out of show names, release names often drop them.
+    None if the name says nothing.
+    """
+    if path.endswith(LEFTOVER_SUFFIX):
+        path = path[: -len(LEFTOVER_SUFFIX)]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    match = EPISODE_PATTERN.search(stem)
+    if match is None:
+        film = FILM_PATTERN.search(stem)
+        name = normalized_title(film[1]) + film[2] if film is not None and normalized_title(film[1]) else normalized_title(stem)
+        return name or None
+    episodes = "".join(f"e{int(episode)}" for episode in re.findall(r"\d+", match[2]))
+    show = normalized_title(YEAR_PATTERN.sub("", stem[: match.start()]))
+    directory = os.path.dirname(path)
+    while not show and os.path.basename(directory):
+        name = os.path.basename(directory)
+        if SEASON_DIR_PATTERN.match(name) is None:
+            show = normalized_title(YEAR_PATTERN.sub("", name))
+        directory = os.path.dirname(directory)
+    if not show:
+        return None
+    return f"{show} s{int(match[1])}{episodes}"
+
+
+def same_title(a: Fingerprint, b: Fingerprint) -> bool:
+    """
+    Returns True if two files are copies or their paths name the same show episode or film.
+    """
+    return a.moviehash == b.moviehash or (a.identity is not None and a.identity == b.identity)
+
+
+def compute_fingerprint(path: str) -> Fingerprint:
+    """
+    Hashes and probes a file.
+
+    Raises:
+        ValueError: If the file can't be hashed.
+    """
+    file = File(path)
+    moviehash = file.get_hash()
+    if moviehash in HASH_ERRORS:
+        raise ValueError(f"Cannot hash {path}: {moviehash}")
+    ffprobe = probe(path)
+    streams = ffprobe.streams or []
+    videos = [stream for stream in streams if stream.codec_type == "video" and not stream.disposition.attached_pic]
+    languages = {
+        stream.tags.language
+        for stream in streams
+        if stream.codec_type == "audio" and stream.tags is not None and stream.tags.language not in (None, "und")
+    }
+    try:
+        duration = float(ffprobe.format.duration) if ffprobe.format.duration is not None else None
+    except ValueError:
+        duration = None
+    return Fingerprint(
+        path=path,
+        size=int(file.size),
+        moviehash=moviehash,
+        duration=duration,
+        videos=len(videos),
+        frame_rate=(frame_rate(videos[0].avg_frame_rate) or frame_rate(videos[0].r_frame_rate)) if videos else None,
+        languages=",".join(sorted(languages)),
+        video_codec=videos[0].codec_name if videos else None,
+    )
+
+
+def same_content(a: Fingerprint, b: Fingerprint) -> bool:
+    """
+    Returns True if two files have the duration and layout of the same video. recode drops audio streams of
+    unwanted languages, so the audio languages of one file only have to be a subset of the other's. That
+    alone doesn't make them the same video, see same_title().
+    """
+    if a.duration is None or b.duration is None or abs(a.duration - b.duration) > DURATION_TOLERANCE:
+        return False
+    if a.videos == 0 or a.videos != b.videos:
+        return False
+    if a.frame_rate is not None and b.frame_rate is not None and abs(a.frame_rate - b.frame_rate) > FRAME_RATE_TOLERANCE:
+        return False
+    alang = set(a.languages.split(",")) - {""}
+    blang = set(b.languages.split(",")) - {""}
+    return alang <= blang or blang <= alang
+
+
+class FingerprintIndex:
+    """
+    Args:
+        path (str): Path of the database.
+    """
+
+    def __init__(self, path: str = FINGERPRINT_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, "
+                "moviehash TEXT, duration REAL, videos INTEGER, frame_rate REAL, languages TEXT, video_codec TEXT, "
+                "scanned REAL NOT NULL, error TEXT)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_moviehash ON fingerprints (moviehash)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_duration ON fingerprints (duration)")
+        logger.info("Opened fingerprint index", extra={"path": path})
+
+    def get(self, file: str) -> Fingerprint | None:
+        """
+        Returns the stored fingerprint of a file if the file did not change since.
+        """
+        try:
+            stat = os.stat(file)
+        except OSError:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT {COLUMNS} FROM fingerprints WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ? AND error IS NULL",
+                (file, stat.st_size, stat.st_mtime_ns, stat.st_ino),
+            ).fetchone()
+        return Fingerprint(*row) if row is not None else None
+
+    def known(self, root: str) -> dict[str, tuple[int, int]]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path, size, mtime_ns FROM fingerprints WHERE path >= ? AND path < ?", (root + os.sep, root + chr(ord(os.sep) + 1))
+            ).fetchall()
+        return {path: (size, mtime_ns) for path, size, mtime_ns in rows}
+
+    def store(self, file: str, stat: os.stat_result, fingerprint: Fingerprint | None, error: str | None = None):
+        values = fingerprint[2:] if fingerprint is not None else (None,) * 6
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO fingerprints (path, size, mtime_ns, inode, moviehash, duration, videos, frame_rate, languages, "
+                "video_codec, scanned, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (file, stat.st_size, stat.st_mtime_ns, stat.st_ino, *values, time.time(), error),
+            )
+
+    def remove(self, files: list[str]):
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM fingerprints WHERE path = ?", [(file,) for file in files])
+
+    def near(self, duration: float | None) -> list[Fingerprint]:
+        """
+        Returns all fingerprints whose duration is within the tolerance of `duration`.
+        """
+        if duration is None:
+            return []
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT {COLUMNS} FROM fingerprints WHERE duration BETWEEN ? AND ? AND error IS NULL",
+                (duration - DURATION_TOLERANCE, duration + DURATION_TOLERANCE),
+            ).fetchall()
+        return [Fingerprint(*row) for row in rows]
+
+    def entries(self, root: str) -> list[Fingerprint]:
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT {COLUMNS} FROM fingerprints WHERE path >= ? AND path < ? AND error IS NULL ORDER BY path",
+                (root + os.sep, root + chr(ord(os.sep) + 1)),
+            ).fetchall()
+        return [Fingerprint(*row) for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+fingerprint_index: FingerprintIndex | None = None
+
+
+def open_fingerprint_index(path: str = FINGERPRINT_DB):
+    global fingerprint_index
+    fingerprint_index = FingerprintIndex(path)
+
+
+def current_index() -> FingerprintIndex:
+    if fingerprint_index is None:
+        open_fingerprint_index()
+    return fingerprint_index  # type: ignore
+
+
+def fingerprint_file(path: str) -> tuple[Fingerprint | None, str | None]:
+    try:
+        return compute_fingerprint(path), None
+    except Exception as e:  # unreadable files, ffprobe errors and files that don't decode into the Ffprobe model
+        return None, str(e) or type(e).__name__
+
+
+def record_fingerprint(file: str):
+    """
+    Fingerprints a file recode just wrote, so later runs know its twins without a rescan.
+    """
+    if fingerprint_index is None:
+        return
+    file = os.path.realpath(file)
+    fingerprint, error = fingerprint_file(file)
+    try:
+        fingerprint_index.store(file, os.stat(file), fingerprint, error)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning("Could not record fingerprint", extra={"file": file, "error": str(e)})
+
+
+def scan_fingerprints(root: str, workers: int = 4) -> tuple[int, int, int]:
+    """
+    Brings the fingerprints of a directory tree up to date, including the `.old` leftovers.
+
+    Args:
+        root (str): Directory to scan.
+        workers (int): Number of files fingerprinted at the same time.
+
+    Returns:
+        tuple: (fingerprinted files, unchanged files, removed files)
+    """
+    root = os.path.realpath(root)
+    index = current_index()
+    logger.info("Fingerprinting library", extra={"root": root, "db": index.path, "workers": workers})
+    files = find_media(root, leftovers=True)
+    known = index.known(root)
+    removed = [path for path in known if path not in files]
+    index.remove(removed)
+    changed = [path for path, stat in files.items() if known.get(path) != (stat.st_size, stat.st_mtime_ns)]
+    logger.info("Fingerprint changes", extra={"files": len(files), "changed": len(changed), "removed": len(removed)})
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="recode-fingerprint") as pool:
+        futures = {pool.submit(fingerprint_file, path): path for path in changed}
+        for future in as_completed(futures):
+            path = futures[future]
+            fingerprint, error = future.result()
+            if error is not None:
+                logger.warning("Fingerprinting failed", extra={"file": path, "error": error})
+            index.store(path, files[path], fingerprint, error)
+            done += 1
+            print(f"Fingerprinted {Color.BLUE}{done}/{len(changed)}{Style.RESET_ALL} files", end="\r")
+    if changed:
+        print()
+    print(
+        f"Fingerprints of {Color.MAGENTA}{root}{Style.RESET_ALL}: {Color.GREEN}{len(changed)}{Style.RESET_ALL} fingerprinted, "
+        f"{Color.BLUE}{len(files) - len(changed)}{Style.RESET_ALL} unchanged, {Color.YELLOW}{len(removed)}{Style.RESET_ALL} removed"
+    )
+    return len(changed), len(files) - len(changed), len(removed)
+
+
+def group_fingerprints(entries: list[Fingerprint]) -> list[list[Fingerprint]]:
+    """
+    Groups files that are copies or twins of each other. Only groups of at least two files are returned.
+    """
+    parent = list(range(len(entries)))
+
+    def find(idx: int) -> int:
+        while parent[idx] != idx:
+            parent[idx] = parent[parent[idx]]
+            idx = parent[idx]
+        return idx
+
+    hashes: dict[str, int] = {}
+    for idx, entry in enumerate(entries):
+        if entry.moviehash in hashes:
+            parent[find(idx)] = find(hashes[entry.moviehash])
+        else:
+            hashes[entry.moviehash] = idx
+    # Twins have about the same duration, so only neighbours in duration order are compared
+    timed = sorted((idx for idx, entry in enumerate(entries) if entry.duration is not None), key=lambda idx: entries[idx].duration)  # type: ignore
+    for pos, idx in enumerate(timed):
+        for other in reversed(timed[:pos]):
+            if entries[idx].duration - entries[other].duration > DURATION_TOLERANCE:  # type: ignore
+                break
+            if same_content(entries[idx], entries[other]):
+                parent[find(idx)] = find(other)
+
+    groups: dict[int, list[Fingerprint]] = {}
+    for idx, entry in enumerate(entries):
+        groups.setdefault(find(idx), []).append(entry)
+    return sorted((group for group in groups.values() if len(group) > 1), key=lambda group: group[0].path)
+
+
+def judge_group(group: list[Fingerprint], target: str) -> list[tuple[Fingerprint, str]]:
+    """
+    Picks the file of a group to keep and tells why each other file is redundant: a byte copy of the kept
+    file ("duplicate"), a `.old` original ("leftover"), an unencoded version of an encoded file ("superseded")
+    or another version that has to be judged by hand ("twin"). Files are only redundant to a file of the same
+    title, files that only match in duration and layout are always twins.
+
+    Args:
+        group (list): Fingerprints of one group.
+        target (str): Codec name of the target codec, e.g. "hevc".
+    """
+
+    def rank(fingerprint: Fingerprint) -> tuple:
+        encoded = fingerprint.video_codec == target
+        # Prefer the smallest encoded file, otherwise the largest source
+        return fingerprint.leftover, not encoded, fingerprint.size if encoded else -fingerprint.size
+
+    titles: list[list[Fingerprint]] = []
+    for fingerprint in sorted(group, key=rank):
+        matching = [title for title in titles if any(same_title(fingerprint, other) for other in title)]
+        for title in matching[1:]:
+            matching[0].extend(title)
+            titles.remove(title)
+        if matching:
+            matching[0].append(fingerprint)
+        else:
+            titles.append([fingerprint])
+
+    verdicts = []
+    for number, title in enumerate(sorted(titles, key=lambda title: min(map(rank, title)))):
+        keep = min(title, key=rank)
+        verdicts.append((keep, "keep" if number == 0 else "twin"))
+        for fingerprint in sorted(title, key=rank):
+            if fingerprint is keep:
+                continue
+            if fingerprint.moviehash == keep.moviehash:
+                verdict = "duplicate"
+            elif fingerprint.leftover and not keep.leftover:
+                verdict = "leftover"
+            elif keep.video_codec == target and fingerprint.video_codec != target:
+                verdict = "superseded"
+            else:
+                verdict = "twin"
+            verdicts.append((fingerprint, verdict))
+    return verdicts
+
+
+def report_duplicates(root: str, codec: str = "av1") -> int:
+    """
+    Prints the duplicate groups below a directory and the space deleting the redundant files would free.
+
+    Args:
+        root (str): Directory to report on, fingerprinted by scan_fingerprints() before.
+        codec (str): Target codec, files already encoded to it are kept over their sources.
+
+    Returns:
+        int: Reclaimable bytes.
+    """
+    target = CODECS.get(codec, CODECS["av1"])["name"]
+    groups = group_fingerprints(current_index().entries(os.path.realpath(root)))
+    reclaimable = 0
+    for group in groups:
+        duration = next((fingerprint.duration for fingerprint in group if fingerprint.duration is not None), None)
+        length = format_timedelta(datetime.timedelta(seconds=duration)) if duration is not None else "?"
+        print(f"{Color.CYAN}{len(group)} versions{Style.RESET_ALL} of {Color.BLUE}{length}{Style.RESET_ALL}")
+        for fingerprint, verdict in judge_group(group, target):
+            if verdict in RECLAIMABLE:
+                reclaimable += fingerprint.size
+            print(
+                f"  {VERDICT_COLORS[verdict]}{verdict:<10}{Style.RESET_ALL} {Color.MAGENTA}{fingerprint.path}{Style.RESET_ALL} "
+                f"{fingerprint.video_codec or '?'} {Color.GREEN}{human_readable_size(fingerprint.size)}{Style.RESET_ALL}"
+            )
+    logger.info("Duplicate report", extra={"root": root, "groups": len(groups), "reclaimable": reclaimable})
+    print(
+        f"{Color.GREEN}{len(groups)}{Style.RESET_ALL} groups, {Color.GREEN}{human_readable_size(reclaimable)}{Style.RESET_ALL} reclaimable"
+    )
+    return reclaimable
+
+
+def encoded_twin(file: str, codec: str = "av1") -> Fingerprint | None:
+    """
+    Returns a twin of `file` with the same title in the library that is already encoded to the target codec,
+    None if the file itself is encoded or no such twin is known.
+    """
+    index = current_index()
+    file = os.path.realpath(file)
+    fingerprint = index.get(file)
+    if fingerprint is None:
+        stat = os.stat(file)
+        fingerprint = compute_fingerprint(file)
+        index.store(file, stat, fingerprint)
+    target = CODECS.get(codec, CODECS["av1"])["name"]
+    if fingerprint.video_codec == target:
+        return None
+    for other in index.near(fingerprint.duration):
+        if (
+            other.path != file
+            and not other.leftover
+            and other.video_codec == target
+            and same_content(fingerprint, other)
+            and same_title(fingerprint, other)
+            and os.path.exists(other.path)
+        ):
+            return other
+    return None
+
+
+def skip_encoded_twins(jobs: list[dict], workers: int = 4) -> list[dict]:
+    """
+    Drops the jobs whose source already has an encoded twin of the same title in the library, fingerprinting the sources
+    concurrently. Returns the remaining jobs in their order.
+    """
+
+    def check(job: dict) -> Fingerprint | None:
+        try:
+            return encoded_twin(job["file"], job.get("codec", "av1"))
+        except Exception as e:  # unreadable files fail later in their job, with proper error reporting
+            logger.warning("Could not check for encoded twin", extra={"file": job["file"], "error": str(e)})
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="recode-fingerprint") as pool:
+        twins = list(pool.map(check, jobs))
+    remaining = []
+    for job, twin in zip(jobs, twins, strict=True):
+        if twin is None:
+            remaining.append(job)
+            continue
+        logger.info("Skipping job with encoded twin", extra={"file": job["file"], "twin": twin.path})
+        print(f"{Color.BLUE}Already encoded as {Color.GREEN}{twin.path}{Style.RESET_ALL}: {Color.YELLOW}{job['file']}{Style.RESET_ALL}")
+    return remaining
@@ -0,0 +1,209 @@
+"""
+httpclient.py
+
+Pooled HTTP client for the metadata and subtitle APIs.
+
+Every upstream gets one ApiClient with its own keep-alive connection pool, a limit on concurrent
+requests, bounded exponential backoff with jitter for timeouts, connection errors and 429/5xx
+answers, and a circuit breaker that fails fast while the upstream is down.
+
+Only idempotent requests are retried freely. A POST may have been processed even if its answer never
+arrived (a login, a download that counts against the quota), so it is only retried if the connection
+could not be established or the upstream asked for it with a 429 and Retry-After.
+"""
+
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+
+from recode.modules.logger import logger
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+IDEMPOTENT = {"GET", "HEAD", "DELETE"}
+
+
+class CircuitOpenError(requests.RequestException):
+    pass
+
+
+def unsent(error: requests.RequestException) -> bool:
+    """
+    Returns True if a request failed before the connection was established, so nothing was sent.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # Refused connections and failed name resolution (NewConnectionError is a ConnectTimeoutError)
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, ConnectTimeoutError)
+
+
+def retryable(method: str, error: requests.RequestException | None = None, response: requests.Response | None = None) -> bool:
+    if method.upper() in IDEMPOTENT:
+        return True
+    if error is not None:
+        return unsent(error)
+    return response is not None and response.status_code == 429 and "Retry-After" in response.headers
+
+
+class ApiClient:
+    """
+    A requests.Session wrapper with retries and a circuit breaker.
+
+    Args:
+        name (str): Name of the upstream, used in log records.
+        concurrency (int): Maximum number of requests in flight at the same time.
+        max_retries (int): Retries after the first attempt before giving up.
+        backoff (float): Base delay in seconds, doubled on every retry.
+        max_backoff (float): Upper bound of a single delay in seconds.
+        failure_threshold (int): Consecutive failures that open the circuit.
+        reset_timeout (float): Seconds the circuit stays open before a trial request is let through.
+        timeout (float): Default timeout of a single request in seconds.
+        rate (float | None): Maximum number of requests started per second.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        concurrency: int = 4,
+        max_retries: int = 4,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+        failure_threshold: int = 5,
+        reset_timeout: float = 60,
+        timeout: float = 10,
+        rate: float | None = None,
+    ):
+        self.name = name
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.timeout = timeout
+        self.rate = rate
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial_in_flight = False
+        self.session = requests.Session()
+        self.set_concurrency(concurrency)
+
+    def set_concurrency(self, concurrency: int):
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def check_circuit(self) -> bool:
+        """
+        Raises CircuitOpenError while the circuit is open. Returns True if the request is the trial of a
+        half-open circuit.
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            if self.trial_in_flight or time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError(f"{self.name} is unavailable, not sending requests for now")
+            # Half-open: this request is the only trial, all others fail fast until it is answered
+            self.trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_flight:
+                logger.warning("Trial request failed, reopening circuit", extra={"upstream": self.name})
+                self.trial_in_flight = False
+                self.opened_at = time.monotonic()
+            elif self.failures >= self.failure_threshold and self.opened_at is None:
+                logger.warning("Opening circuit", extra={"upstream": self.name, "failures": self.failures})
+                self.opened_at = time.monotonic()
+
+    def throttle(self):
+        """Waits for the next free slot of the request rate."""
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + 1 / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def delay(self, attempt: int, response: requests.Response | None = None) -> float:
+        if response is not None and response.headers.get("Retry-After", "").isdigit():
+            return min(self.max_backoff, float(response.headers["Retry-After"]))
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a request, retrying transient failures. Requests with other methods than GET, HEAD and DELETE
+        are only retried if nothing was sent or the answer is a 429 with Retry-After.
+
+        Returns:
+            requests.Response: The final response. Responses with a retryable status are returned once retries are exhausted
+                or if the request must not be repeated.
+
+        Raises:
+            CircuitOpenError: If the upstream failed too often recently.
+            requests.RequestException: If the last attempt failed without a response.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            trial = self.check_circuit()
+            response = None
+            try:
+                self.throttle()
+                with self.semaphore:
+                    response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.record_failure()
+                if attempt >= self.max_retries or not retryable(method, error=e):
+                    raise
+                logger.warning("Request failed", extra={"upstream": self.name, "attempt": attempt, "error": str(e)})
+            except BaseException:
+                # A trial that ended without an answer must not block the circuit forever
+                if trial:
+                    self.record_failure()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUS:
+                    self.record_success()
+                    return response
+                self.record_failure()
+                if attempt >= self.max_retries or not retryable(method, response=response):
+                    return response
+                logger.warning("Request answered with retryable status", extra={"upstream": self.name, "status": response.status_code})
+            time.sleep(self.delay(attempt, response))
+            attempt += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+
+thetvdb = ApiClient("thetvdb")
+# OpenSubtitles allows 5 requests per second per client
+opensubtitles = ApiClient("opensubtitles", rate=4)
+
+
+def set_api_concurrency(concurrency: int):
+    for client in (thetvdb, opensubtitles):
+        client.set_concurrency(concurrency)
@@ -0,0 +1,260 @@
+"""
+inventory.py
+
+Library inventory: probes every media file below a directory and keeps one row per stream in a SQLite
+database, so a library can be queried ("all non-AV1 video over 10 Mbit/s") without recoding anything.
+
+Rescans are incremental: files whose size and modification time did not change are not probed again and
+files that disappeared from the scanned tree are dropped from the inventory.
+"""
+
+import dataclasses
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from colorama import Fore as Color
+from colorama import Style
+
+from recode.modules.api import VIDEO_CONTAINERS
+from recode.modules.cache import CACHE_DIR
+from recode.modules.datatypes import Disposition, Ffprobe, Stream
+from recode.modules.ffmpeg_utils import probe
+from recode.modules.logger import logger
+from recode.modules.progress import human_readable_size
+from recode.modules.tempfiles import TEMP_PREFIX
+
+INVENTORY_DB = os.path.join(CACHE_DIR, "inventory.db")
+EXTENSIONS = {ext.lower() for ext in VIDEO_CONTAINERS}
+DISPOSITIONS = [f.name for f in dataclasses.fields(Disposition)]
+# Files written to the database per transaction while scanning
+COMMIT_INTERVAL = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    scanned REAL NOT NULL,
+    format_name TEXT,
+    duration REAL,
+    bit_rate INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS streams (
+    path TEXT NOT NULL REFERENCES files (path) ON DELETE CASCADE,
+    stream INTEGER NOT NULL,
+    codec_type TEXT,
+    codec_name TEXT,
+    profile TEXT,
+    pix_fmt TEXT,
+    width INTEGER,
+    height INTEGER,
+    bit_rate INTEGER,
+    channels INTEGER,
+    channel_layout TEXT,
+    language TEXT,
+    title TEXT,
+    dispositions TEXT,
+    PRIMARY KEY (path, stream)
+);
+CREATE INDEX IF NOT EXISTS streams_codec ON streams (codec_type, codec_name);
+CREATE VIEW IF NOT EXISTS inventory AS
+    SELECT s.*, f.size, f.duration, f.format_name, f.bit_rate AS file_bit_rate
+    FROM streams s JOIN files f USING (path);
+"""
+
+COLUMNS = ["path", "stream", "codec_type", "codec_name", "pix_fmt", "width", "height", "bit_rate", "channels", "language", "size"]
+
+
+def connect(path: str = INVENTORY_DB, readonly: bool = False) -> sqlite3.Connection:
+    if readonly:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def to_int(value) -> int | None:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def stream_bit_rate(stream: Stream) -> int | None:
+    """
+    Returns the bit rate of a stream, falling back to the statistics tags mkvmerge writes.
+    """
+    if stream.bit_rate is not None:
+        return to_int(stream.bit_rate)
+    if stream.tags is not None:
+        return to_int(stream.tags.bps if stream.tags.bps is not None else stream.tags.bps_eng)
+    return None
+
+
+def stream_row(path: str, stream: Stream) -> tuple:
+    dispositions = ",".join(name for name in DISPOSITIONS if getattr(stream.disposition, name))
+    return (
+        path,
+        stream.index,
+        stream.codec_type,
+        stream.codec_name,
+        stream.profile,
+        stream.pix_fmt,
+        stream.width,
+        stream.height,
+        stream_bit_rate(stream),
+        stream.channels,
+        stream.channel_layout,
+        stream.tags.language if stream.tags is not None else None,
+        stream.tags.title if stream.tags is not None else None,
+        dispositions,
+    )
+
+
+def is_media(name: str, leftovers: bool = False) -> bool:
+    stem, ext = os.path.splitext(name)
+    if leftovers and ext == ".old":
+        ext = os.path.splitext(stem)[1]
+    return ext.lower() in EXTENSIONS
+
+
+def find_media(root: str, leftovers: bool = False) -> dict[str, os.stat_result]:
+    """
+    Returns the media files below a directory. With `leftovers`, the `.old` originals recode renamed are included.
+    """
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        # Work directories of chunked encodes hold split copies of their source
+        dirnames[:] = [name for name in dirnames if not name.startswith(TEMP_PREFIX)]
+        for name in filenames:
+            if is_media(name, leftovers):
+                path = os.path.join(dirpath, name)
+                try:
+                    files[path] = os.stat(path)
+                except OSError as e:
+                    logger.warning("Cannot stat file", extra={"file": path, "error": str(e)})
+    return files
+
+
+def probe_file(path: str) -> tuple[Ffprobe | None, str | None]:
+    try:
+        return probe(path), None
+    except Exception as e:  # ffprobe errors and files that don't decode into the Ffprobe model
+        return None, str(e) or type(e).__name__
+
+
+def store(conn: sqlite3.Connection, path: str, stat: os.stat_result, result: Ffprobe | None, error: str | None):
+    conn.execute("DELETE FROM streams WHERE path = ?", (path,))
+    fmt = result.format if result is not None else None
+    conn.execute(
+        "INSERT OR REPLACE INTO files (path, size, mtime_ns, scanned, format_name, duration, bit_rate, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            path,
+            stat.st_size,
+            stat.st_mtime_ns,
+            time.time(),
+            fmt.format_name if fmt is not None else None,
+            float(fmt.duration) if fmt is not None and fmt.duration is not None else None,
+            to_int(fmt.bit_rate) if fmt is not None else None,
+            error,
+        ),
+    )
+    if result is not None:
+        conn.executemany(
+            "INSERT INTO streams VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [stream_row(path, stream) for stream in result.streams]
+        )
+
+
+def scan_inventory(root: str, db: str = INVENTORY_DB, workers: int = 4) -> tuple[int, int, int]:
+    """
+    Brings the inventory of a directory tree up to date.
+
+    Args:
+        root (str): Directory to scan.
+        db (str): Path of the inventory database.
+        workers (int): Number of files probed at the same time.
+
+    Returns:
+        tuple: (probed files, unchanged files, removed files)
+    """
+    root = os.path.realpath(root)
+    logger.info("Scanning library", extra={"root": root, "db": db, "workers": workers})
+    files = find_media(root)
+    conn = connect(db)
+    known = {
+        path: (size, mtime_ns)
+        for path, size, mtime_ns in conn.execute(
+            "SELECT path, size, mtime_ns FROM files WHERE path >= ? AND path < ?", (root + os.sep, root + chr(ord(os.sep) + 1))
+        )
+    }
+    removed = [path for path in known if path not in files]
+    with conn:
+        conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+    changed = [path for path, stat in files.items() if known.get(path) != (stat.st_size, stat.st_mtime_ns)]
+    logger.info("Inventory changes", extra={"files": len(files), "changed": len(changed), "removed": len(removed)})
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="recode-inventory") as pool:
+        futures = {pool.submit(probe_file, path): path for path in changed}
+        for future in as_completed(futures):
+            path = futures[future]
+            result, error = future.result()
+            if error is not None:
+                logger.warning("Probing failed", extra={"file": path, "error": error})
+            store(conn, path, files[path], result, error)
+            done += 1
+            if done % COMMIT_INTERVAL == 0:
+                conn.commit()
+            print(f"Probed {Color.BLUE}{done}/{len(changed)}{Style.RESET_ALL} files", end="\r")
+    conn.commit()
+    conn.close()
+    if changed:
+        print()
+    print(
+        f"Inventory of {Color.MAGENTA}{root}{Style.RESET_ALL}: {Color.GREEN}{len(changed)}{Style.RESET_ALL} probed, "
+        f"{Color.BLUE}{len(files) - len(changed)}{Style.RESET_ALL} unchanged, {Color.YELLOW}{len(removed)}{Style.RESET_ALL} removed"
+    )
+    return len(changed), len(files) - len(changed), len(removed)
+
+
+def query_inventory(where: str, db: str = INVENTORY_DB) -> list[tuple]:
+    """
+    Prints all streams of the inventory matching an SQL condition on the `inventory` view, largest files first.
+
+    Example: codec_type = 'video' AND codec_name != 'av1' AND bit_rate > 10e6
+    """
+    if not os.path.exists(db):
+        logger.error("Inventory not found", extra={"db": db})
+        print(f"{Color.RED}Query failed:{Style.RESET_ALL} no inventory at {db}, scan a library with --type inventory -d DIR first")
+        return []
+    conn = None
+    try:
+        conn = connect(db, readonly=True)
+        rows = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM inventory WHERE {where} ORDER BY size DESC, path, stream").fetchall()
+    except sqlite3.Error as e:
+        logger.error("Inventory query failed", extra={"where": where, "error": str(e)})
+        print(f"{Color.RED}Query failed:{Style.RESET_ALL} {e}")
+        return []
+    finally:
+        if conn is not None:
+            conn.close()
+    sizes = {}
+    for path, stream, codec_type, codec_name, pix_fmt, width, height, bit_rate, channels, language, size in rows:
+        sizes[path] = size
+        details = f"{width}x{height} {pix_fmt}" if codec_type == "video" else f"{channels}ch" if codec_type == "audio" else ""
+        rate = f"{bit_rate / 1e6:.1f} Mbit/s" if bit_rate else "?"
+        print(
+            f"{Color.MAGENTA}{path}{Style.RESET_ALL}:{stream} {Color.BLUE}{codec_type}{Style.RESET_ALL} {codec_name} {details} "
+            f"{rate} {language or ''} {Color.GREEN}{human_readable_size(size)}{Style.RESET_ALL}"
+        )
+    print(
+        f"{Color.GREEN}{len(rows)}{Style.RESET_ALL} streams in {Color.GREEN}{len(sizes)}{Style.RESET_ALL} files, "
+        f"{Color.GREEN}{human_readable_size(sum(sizes.values()))}{Style.RESET_ALL} total"
+    )
+    return rows
@@ -10,8 +10,12 @@ Functions:
 - rotate_log_file(): Handles renaming the existing log file to a timestamp-based name.
 - setup_logger(): Configures the logging system, applies a JSON format, and returns a logger instance.
 - setup_consolelogger(): Configures the logging system to output logs in console format.
+
+Classes:
+- JobContextFilter: Tags every log record with the label of the job running in the current thread.
 """
 
+import contextvars
 import gzip
 import json
 import logging
@@ -32,6 +36,21 @@ LATEST_LOG_FILE = LOG_DIR / "latest.jsonl"
 if not os.path.exists(LOG_DIR):
     os.makedirs(LOG_DIR)
 
+job_context: contextvars.ContextVar[str | None] = contextvars.ContextVar("job_context", default=None)
+
+
+class JobContextFilter(logging.Filter):
+    """
+    Adds a 'job' attribute holding the label of the job currently running in this thread,
+    so log lines of concurrently running jobs can be told apart.
+    """
+
+    def filter(self, record):
+        job = job_context.get()
+        if job is not None:
+            record.job = job
+        return True
+
 
 def log_format(keys):
     """
@@ -120,6 +139,7 @@ def setup_logger(level=logging.INFO):
     log_handler.setFormatter(formatter)
 
     _logger.addHandler(log_handler)
+    _logger.addFilter(JobContextFilter())
     _logger.setLevel(level=level)
 
     return _logger
@@ -163,6 +183,7 @@ def setup_consolelogger(level=logging.INFO):
 
     _logger.addHandler(log_handler)
     _logger.addHandler(logging.StreamHandler())
+    _logger.addFilter(JobContextFilter())
     _logger.setLevel(level=level)
     return _logger
 
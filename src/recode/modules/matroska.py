@@ -0,0 +1,646 @@
+"""
+matroska.py
+
+In-place editing of Matroska headers for metadata-only changes.
+
+Dispositions, stream languages and global tags live in a few small level 1 elements (Info, Tracks and
+Tags) at known positions of the file. Instead of remuxing the whole file, those elements are decoded,
+changed and written back at the same position. An element may grow into the Voids around it, which it
+shares with its neighbours, or past the end of the file if it is the last element. If an element doesn't fit, nothing is
+written and the caller falls back to a regular remux.
+
+Clusters, Cues and the SeekHead are never moved, so no positions inside the file change.
+"""
+
+import os
+import struct
+import zlib
+from dataclasses import dataclass, field
+
+from recode.modules.datatypes import Ffprobe
+from recode.modules.encode_plan import EncodePlan
+from recode.modules.logger import logger
+
+EBML = 0x1A45DFA3
+DOCTYPE = 0x4282
+SEGMENT = 0x18538067
+SEEKHEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEKID = 0x53AB
+SEEKPOSITION = 0x53AC
+INFO = 0x1549A966
+TITLE = 0x7BA9
+TRACKS = 0x1654AE6B
+TRACKENTRY = 0xAE
+TRACKTYPE = 0x83
+LANGUAGE = 0x22B59C
+LANGUAGE_BCP47 = 0x22B59D
+FLAG_DEFAULT = 0x88
+TAGS = 0x1254C367
+TAG = 0x7373
+TARGETS = 0x63C0
+TARGET_UIDS = {0x63C5, 0x63C9, 0x63C4, 0x63C6}
+SIMPLETAG = 0x67C8
+TAGNAME = 0x45A3
+TAGSTRING = 0x4487
+CLUSTER = 0x1F43B675
+VOID = 0xEC
+CRC32 = 0xBF
+
+# Master elements below Info, Tracks and Tags that are decoded, everything else is kept as raw bytes
+MASTERS = {SEEK, TRACKENTRY, TAG, TARGETS, SIMPLETAG}
+
+# ffmpeg disposition -> TrackEntry flag, dispositions without a Matroska flag are not stored by a remux either
+DISPOSITION_FLAGS = {
+    "default": FLAG_DEFAULT,
+    "forced": 0x55AA,
+    "hearing_impaired": 0x55AB,
+    "visual_impaired": 0x55AC,
+    "descriptions": 0x55AD,
+    "original": 0x55AE,
+    "comment": 0x55AF,
+}
+TRACK_TYPES = {"v": 1, "a": 2, "s": 17}
+CODEC_TYPES = {"v": "video", "a": "audio", "s": "subtitle"}
+
+
+class MatroskaEditError(Exception):
+    pass
+
+
+@dataclass
+class Element:
+    id: int
+    data: bytes = b""
+    children: list["Element"] | None = None
+
+    def child(self, eid: int) -> "Element | None":
+        for child in self.children or []:
+            if child.id == eid:
+                return child
+        return None
+
+    def set_child(self, eid: int, data: bytes):
+        assert self.children is not None
+        child = self.child(eid)
+        if child is None:
+            self.children.append(Element(eid, data))
+        else:
+            child.data = data
+
+    def payload(self) -> bytes:
+        if self.children is None:
+            return self.data
+        if self.children and self.children[0].id == CRC32:
+            rest = b"".join(child.encode() for child in self.children[1:])
+            return Element(CRC32, struct.pack("<I", zlib.crc32(rest))).encode() + rest
+        return b"".join(child.encode() for child in self.children)
+
+    def encode(self, size_length: int | None = None) -> bytes:
+        payload = self.payload()
+        return encode_id(self.id) + encode_size(len(payload), size_length) + payload
+
+
+@dataclass
+class Slot:
+    """
+    A level 1 element in the file and the room it may use when it is rewritten: `room` bytes from its
+    offset (the element and the Voids behind it) and `before` bytes of Voids directly in front of it.
+    """
+
+    offset: int
+    length: int
+    room: int
+    before: int = 0
+    last: bool = False
+
+
+@dataclass
+class TrackEdit:
+    dispositions: list[str] | None = None
+    language: str | None = None
+
+
+@dataclass
+class HeaderEdits:
+    title: str | None = None
+    tags: dict[str, str] = field(default_factory=dict)
+    tracks: dict[tuple[str, int], TrackEdit] = field(default_factory=dict)
+
+
+def read_vint(buf: bytes, pos: int, keep_marker: bool = False) -> tuple[int | None, int]:
+    """
+    Reads an EBML variable length integer.
+
+    Returns:
+        tuple: (value, length in bytes), value is None for the reserved "unknown size".
+    """
+    first = buf[pos]
+    if first == 0:
+        raise MatroskaEditError(f"invalid variable length integer at {pos}")
+    length = 8 - first.bit_length() + 1
+    value = int.from_bytes(buf[pos : pos + length], "big")
+    if keep_marker:
+        return value, length
+    value &= (1 << (7 * length)) - 1
+    if value == (1 << (7 * length)) - 1:
+        return None, length
+    return value, length
+
+
+def encode_id(eid: int) -> bytes:
+    return eid.to_bytes((eid.bit_length() + 7) // 8, "big")
+
+
+def encode_size(size: int, length: int | None = None) -> bytes:
+    if length is None:
+        length = 1
+        while size >= (1 << (7 * length)) - 1:
+            length += 1
+    if length > 8 or size >= (1 << (7 * length)) - 1:
+        raise MatroskaEditError(f"size {size} does not fit into {length} bytes")
+    return ((1 << (7 * length)) | size).to_bytes(length, "big")
+
+
+def encode_uint(value: int) -> bytes:
+    return value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big")
+
+
+def decode_uint(element: Element | None, default: int = 0) -> int:
+    return int.from_bytes(element.data, "big") if element is not None and element.data else default
+
+
+def void(length: int) -> bytes:
+    """
+    Returns the header of a Void element that is `length` bytes long in total. The payload is not
+    written, whatever is left in the file there is ignored by every reader.
+    """
+    for size_length in range(1, 9):
+        size = length - 1 - size_length
+        if 0 <= size < (1 << (7 * size_length)) - 1:
+            return encode_id(VOID) + encode_size(size, size_length)
+    raise MatroskaEditError(f"cannot build a Void element of {length} bytes")
+
+
+def parse_children(data: bytes) -> list[Element]:
+    children = []
+    pos = 0
+    while pos < len(data):
+        eid, idlength = read_vint(data, pos, keep_marker=True)
+        size, sizelength = read_vint(data, pos + idlength)
+        if size is None:
+            raise MatroskaEditError("unknown size element inside a header element")
+        start = pos + idlength + sizelength
+        payload = data[start : start + size]
+        if eid in MASTERS:
+            children.append(Element(eid, children=parse_children(payload)))  # type: ignore
+        else:
+            children.append(Element(eid, payload))  # type: ignore
+        pos = start + size
+    return children
+
+
+def read_header(f, offset: int) -> tuple[int, int | None, int]:
+    """
+    Reads the element header at `offset`.
+
+    Returns:
+        tuple: (element id, payload size, header length)
+    """
+    f.seek(offset)
+    buf = f.read(12)
+    if len(buf) < 2:
+        raise MatroskaEditError(f"truncated element at {offset}")
+    eid, idlength = read_vint(buf, 0, keep_marker=True)
+    size, sizelength = read_vint(buf, idlength)
+    return eid, size, idlength + sizelength  # type: ignore
+
+
+def read_element(f, offset: int) -> Element:
+    eid, size, headerlength = read_header(f, offset)
+    if size is None:
+        raise MatroskaEditError(f"element {eid:#x} at {offset} has an unknown size")
+    f.seek(offset + headerlength)
+    return Element(eid, children=parse_children(f.read(size)))
+
+
+class MatroskaFile:
+    """
+    The level 1 layout of a Matroska file: where Info, Tracks and Tags are and how much room they have.
+    """
+
+    def __init__(self, f, filesize: int):
+        self.f = f
+        self.filesize = filesize
+        eid, size, headerlength = read_header(f, 0)
+        if eid != EBML or size is None:
+            raise MatroskaEditError("not an EBML file")
+        f.seek(headerlength)
+        doctype = Element(EBML, children=parse_children(f.read(size))).child(DOCTYPE)
+        if doctype is None or doctype.data.rstrip(b"\0") not in (b"matroska", b"webm"):
+            raise MatroskaEditError("not a Matroska file")
+        self.segment_offset = headerlength + size
+        eid, size, headerlength = read_header(f, self.segment_offset)
+        if eid != SEGMENT:
+            raise MatroskaEditError("no segment after the EBML header")
+        self.segment_size = size
+        self.segment_size_offset = self.segment_offset + len(encode_id(SEGMENT))
+        self.segment_size_length = headerlength - len(encode_id(SEGMENT))
+        self.data_start = self.segment_offset + headerlength
+        self.data_end = self.data_start + size if size is not None else filesize
+        self.positions: dict[int, int] = {}
+        self.voids: list[tuple[int, int]] = []
+        self.scan()
+
+    def scan(self):
+        """
+        Walks the level 1 elements in front of the first Cluster and reads the SeekHead for the rest.
+        """
+        offset = self.data_start
+        while offset < self.data_end:
+            eid, size, headerlength = read_header(self.f, offset)
+            if eid == CLUSTER or size is None:
+                break
+            if eid == VOID:
+                self.voids.append((offset, headerlength + size))
+            elif eid not in self.positions:
+                self.positions[eid] = offset
+            if eid == SEEKHEAD:
+                for seek in read_element(self.f, offset).children or []:
+                    seekid = seek.child(SEEKID)
+                    if seek.id == SEEK and seekid is not None:
+                        target = int.from_bytes(seekid.data, "big")
+                        self.positions.setdefault(target, self.data_start + decode_uint(seek.child(SEEKPOSITION)))
+            offset += headerlength + size
+        self.header_end = min(offset, self.data_end)
+
+    def slot(self, eid: int) -> Slot | None:
+        offset = self.positions.get(eid)
+        if offset is None:
+            return None
+        found, size, headerlength = read_header(self.f, offset)
+        if found != eid or size is None:
+            raise MatroskaEditError(f"SeekHead entry for {eid:#x} does not point at the element")
+        length = headerlength + size
+        end = offset + length
+        while end < self.data_end:
+            found, size, headerlength = read_header(self.f, end)
+            if found != VOID or size is None:
+                break
+            end += headerlength + size
+        start = offset
+        ends = {voidoffset + voidlength: voidoffset for voidoffset, voidlength in self.voids}
+        while start in ends:
+            start = ends[start]
+        return Slot(offset, length, end - offset, offset - start, last=end >= self.data_end and self.data_end >= self.filesize)
+
+    def free_void(self, length: int, taken: list[Slot]) -> Slot | None:
+        """
+        Returns a Void in front of the first Cluster that can take a new element of `length` bytes and
+        is not part of the room of another rewritten element.
+        """
+        for offset, voidlength in self.voids:
+            if any(slot.offset - slot.before <= offset < slot.offset + slot.room for slot in taken):
+                continue
+            if voidlength == length or voidlength >= length + 2:
+                return Slot(offset, 0, voidlength)
+        return None
+
+
+def merge_ranges(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        elif start < end:
+            merged.append((start, end))
+    return merged
+
+
+def take_range(free: list[tuple[int, int]], start: int, end: int) -> list[tuple[int, int]]:
+    remaining = []
+    for free_start, free_end in free:
+        if free_start < start:
+            remaining.append((free_start, min(free_end, start)))
+        if free_end > end:
+            remaining.append((max(free_start, end), free_end))
+    return [(free_start, free_end) for free_start, free_end in remaining if free_start < free_end]
+
+
+def encodings(element: Element) -> list[bytes]:
+    """
+    Returns the element encoded as small as possible and with a one byte longer size field. A gap of one
+    byte can't hold a Void, the longer encoding closes it instead.
+    """
+    data = element.encode()
+    sizelength = len(data) - len(element.payload()) - len(encode_id(element.id))
+    return [data, element.encode(sizelength + 1)] if sizelength < 8 else [data]
+
+
+def fit(element: Element, slot: Slot, free: list[tuple[int, int]]) -> tuple[int, bytes, int]:
+    """
+    Places an element in the free bytes of its slot: the Voids around it and its old bytes, minus what
+    earlier placements took. The element stays where it is if possible, otherwise it takes the first free
+    bytes of its slot, which may start where an earlier rewrite ended. The last element may also grow past
+    the end of the file. Gaps left around the element have to hold a Void, so they can't be one byte long.
+
+    Returns:
+        tuple: (offset, element bytes, growth of the file)
+    """
+    first, last = slot.offset - slot.before, slot.offset + slot.room
+    for data in encodings(element):
+        for free_start, free_end in free:
+            starts = [slot.offset] if free_start <= slot.offset < free_end else []
+            starts.append(max(free_start, first))
+            starts.append(max(free_start, first) + 2)
+            for start in starts:
+                end = start + len(data)
+                if start < first or start - free_start == 1:
+                    continue
+                if end <= min(free_end, last) and free_end - end != 1:
+                    return start, data, 0
+                if slot.last and free_end >= last and start < free_end < end:
+                    return start, data, end - free_end
+    available = sum(min(free_end, last) - max(free_start, first) for free_start, free_end in free if free_start < last and free_end > first)
+    raise MatroskaEditError(
+        f"element {element.id:#x} needs {len(element.encode())} bytes, only {available} available without overlapping other edits"
+    )
+
+
+def plan_layout(writes: list[tuple[Slot, Element]]) -> tuple[list[tuple[int, bytes]], list[tuple[int, bytes]], int, list[tuple[int, int]]]:
+    """
+    Places the rewritten elements in the rooms of their slots. The rooms of neighbouring elements overlap,
+    the Voids behind one element are the Voids in front of the next, so every placement only takes the bytes
+    it writes. The bytes left over get new Void headers.
+
+    Returns:
+        tuple: (element writes, Void writes, growth of the file, byte ranges that are rewritten)
+    """
+    free = merge_ranges([(slot.offset - slot.before, slot.offset + slot.room) for slot, _ in writes])
+    spans = list(free)
+    placed = []
+    growth = 0
+    for slot, element in writes:
+        offset, data, grow = fit(element, slot, free)
+        free = take_range(free, offset, offset + len(data))
+        placed.append((offset, data))
+        growth += grow
+    if growth:
+        spans = merge_ranges(spans + [(offset, offset + len(data)) for offset, data in placed])
+    return placed, [(start, void(end - start)) for start, end in free], growth, spans
+
+
+def element_length(data: bytes) -> int:
+    """
+    Returns the length of the element that starts with `data`, header included.
+    """
+    _, idlength = read_vint(data, 0, keep_marker=True)
+    size, sizelength = read_vint(data, idlength)
+    if size is None:
+        raise MatroskaEditError("element of unknown size")
+    return idlength + sizelength + size
+
+
+def check_layout(spans: list[tuple[int, int]], chunks: list[tuple[int, bytes]]):
+    """
+    Walks the rewritten byte ranges through the planned elements and Void headers: every range has to be
+    covered exactly, without a gap and without two writes overlapping, before anything is written.
+    """
+    ordered = sorted(chunks)
+    for (offset, data), (following, _) in zip(ordered, ordered[1:], strict=False):
+        if offset + element_length(data) > following:
+            raise MatroskaEditError(f"edits at {offset} and {following} would overlap")
+    starts = dict(chunks)
+    reached = set()
+    for start, end in spans:
+        pos = start
+        while pos < end:
+            if pos not in starts:
+                raise MatroskaEditError(f"nothing would be written at {pos}")
+            reached.add(pos)
+            pos += element_length(starts[pos])
+        if pos != end:
+            raise MatroskaEditError(f"element at the end of {start}-{end} would overrun it")
+    if reached != set(starts):
+        raise MatroskaEditError("edits would be written outside of the rewritten elements")
+
+
+def patch_seekhead(mkv: "MatroskaFile", moved: dict[int, int]) -> tuple[int, bytes] | None:
+    """
+    Points the SeekHead entries of moved elements at their new offsets, keeping the SeekHead's size.
+    """
+    offset = mkv.positions.get(SEEKHEAD)
+    if offset is None:
+        return None
+    _, size, headerlength = read_header(mkv.f, offset)
+    seekhead = read_element(mkv.f, offset)
+    for seek in seekhead.children or []:
+        seekid = seek.child(SEEKID)
+        position = seek.child(SEEKPOSITION)
+        if seek.id != SEEK or seekid is None or position is None:
+            continue
+        target = moved.get(int.from_bytes(seekid.data, "big"))
+        if target is not None:
+            try:
+                position.data = (target - mkv.data_start).to_bytes(len(position.data), "big")
+            except OverflowError as e:
+                raise MatroskaEditError("new position does not fit into the SeekHead entry") from e
+    data = seekhead.encode(headerlength - len(encode_id(SEEKHEAD)))
+    if len(data) != headerlength + size:  # type: ignore
+        raise MatroskaEditError("SeekHead changed its size")
+    return offset, data
+
+
+def parse_edits(plan: EncodePlan) -> HeaderEdits:
+    """
+    Turns the dispositions, stream languages and global metadata of an encode plan into header edits.
+    """
+    edits = HeaderEdits()
+    for stream in plan.streams:
+        for name, lang in stream.metadata:
+            if name != "language":
+                raise MatroskaEditError(f"unsupported stream metadata {name}")
+            edits.tracks.setdefault((stream.stype, stream.oindex), TrackEdit()).language = lang
+        if stream.disposition is not None:
+            types = [] if stream.disposition == "none" else stream.disposition.split("+")
+            edits.tracks.setdefault((stream.stype, stream.oindex), TrackEdit()).dispositions = types
+    for key, value in plan.metadata:
+        if key == "title":
+            edits.title = value
+        else:
+            edits.tags[key] = value
+    return edits
+
+
+def can_edit_in_place(ffprobe: Ffprobe, plan: EncodePlan) -> bool:
+    """
+    Checks whether a remux with this plan would only change header metadata: every stream of a
+    Matroska source is kept and copied, nothing else is added or converted.
+    """
+    if not plan.copies_only() or "matroska" not in (ffprobe.format.format_name or ""):
+        return False
+    return sorted(plan.maps()) == sorted(f"0:{stream.index}" for stream in ffprobe.streams)
+
+
+def apply_track_edits(tracks: Element, edits: HeaderEdits, ffprobe: Ffprobe):
+    entries: dict[str, list[Element]] = {stype: [] for stype in TRACK_TYPES}
+    for entry in tracks.children or []:
+        if entry.id != TRACKENTRY:
+            continue
+        for stype, tracktype in TRACK_TYPES.items():
+            if decode_uint(entry.child(TRACKTYPE)) == tracktype:
+                entries[stype].append(entry)
+    for stype, codec_type in CODEC_TYPES.items():
+        streams = [s for s in ffprobe.streams if s.codec_type == codec_type and not s.disposition.attached_pic]
+        if len(streams) != len(entries[stype]):
+            raise MatroskaEditError(f"{len(entries[stype])} {codec_type} tracks but ffprobe reports {len(streams)} streams")
+    for (stype, index), edit in edits.tracks.items():
+        if stype not in entries or index >= len(entries[stype]):
+            raise MatroskaEditError(f"no track for stream {stype}:{index}")
+        entry = entries[stype][index]
+        if edit.language is not None:
+            entry.set_child(LANGUAGE, edit.language.encode("ascii"))
+            # The BCP47 language takes precedence over the legacy one, a remux drops it as well
+            entry.children = [child for child in entry.children or [] if child.id != LANGUAGE_BCP47]
+        if edit.dispositions is not None:
+            for disposition, flag in DISPOSITION_FLAGS.items():
+                if disposition in edit.dispositions:
+                    entry.set_child(flag, encode_uint(1))
+                elif flag == FLAG_DEFAULT or entry.child(flag) is not None:
+                    # FlagDefault defaults to 1, so it has to be written explicitly
+                    entry.set_child(flag, encode_uint(0))
+
+
+def global_tag(tags: Element) -> Element | None:
+    for tag in tags.children or []:
+        if tag.id != TAG:
+            continue
+        targets = tag.child(TARGETS)
+        if targets is None or not any(child.id in TARGET_UIDS for child in targets.children or []):
+            return tag
+    return None
+
+
+def apply_tag_edits(tags: Element, edits: HeaderEdits) -> bool:
+    """
+    Sets the global tags like a remux would. The title lives in the Info element, an existing TITLE tag
+    is only updated so it doesn't shadow the new title.
+
+    Returns:
+        bool: True if the Tags element changed.
+    """
+    assert tags.children is not None
+    tag = global_tag(tags)
+    simpletags = {}
+    for simpletag in tag.children or [] if tag is not None else []:
+        name = simpletag.child(TAGNAME) if simpletag.id == SIMPLETAG else None
+        if name is not None:
+            simpletags.setdefault(name.data.decode("utf-8", "replace").upper(), simpletag)
+    values = dict(edits.tags)
+    if edits.title is not None:
+        values["title"] = edits.title
+    changed = False
+    for key, value in values.items():
+        simpletag = simpletags.get(key.upper())
+        if simpletag is not None:
+            simpletag.set_child(TAGSTRING, value.encode("utf-8"))
+            changed = True
+        elif key != "title":
+            if tag is None:
+                tag = Element(TAG, children=[Element(TARGETS, children=[])])
+                tags.children.append(tag)
+            tag.children.append(  # type: ignore
+                Element(SIMPLETAG, children=[Element(TAGNAME, key.upper().encode("utf-8")), Element(TAGSTRING, value.encode("utf-8"))])
+            )
+            changed = True
+    return changed
+
+
+def plan_header_edit(f, ffprobe: Ffprobe, plan: EncodePlan) -> tuple[list[tuple[int, bytes]], int, int]:
+    """
+    Decodes and changes the header elements and places them, without writing anything.
+
+    Returns:
+        tuple: (writes as offset and bytes, growth of the file, number of rewritten elements)
+
+    Raises:
+        MatroskaEditError: If the file can't be edited in place.
+    """
+    edits = parse_edits(plan)
+    mkv = MatroskaFile(f, os.fstat(f.fileno()).st_size)
+    writes: list[tuple[Slot, Element]] = []
+    if edits.title is not None:
+        slot = mkv.slot(INFO)
+        if slot is None:
+            raise MatroskaEditError("no Info element")
+        info = read_element(f, slot.offset)
+        info.set_child(TITLE, edits.title.encode("utf-8"))
+        writes.append((slot, info))
+    if edits.tracks:
+        slot = mkv.slot(TRACKS)
+        if slot is None:
+            raise MatroskaEditError("no Tracks element")
+        tracks = read_element(f, slot.offset)
+        apply_track_edits(tracks, edits, ffprobe)
+        writes.append((slot, tracks))
+    if edits.tags or edits.title is not None:
+        slot = mkv.slot(TAGS)
+        tags = read_element(f, slot.offset) if slot is not None else Element(TAGS, children=[])
+        if apply_tag_edits(tags, edits):
+            if slot is None:
+                slot = mkv.free_void(len(tags.encode()), [slot for slot, _ in writes])
+                if slot is None:
+                    raise MatroskaEditError("no Tags element and no Void to put one")
+            writes.append((slot, tags))
+
+    placed, voids, growth, spans = plan_layout(writes)
+    check_layout(spans, placed + voids)
+    chunks = placed + voids
+    moved = {element.id: offset for (slot, element), (offset, _) in zip(writes, placed, strict=True) if offset != slot.offset}
+    seekhead = patch_seekhead(mkv, moved) if moved else None
+    if seekhead is not None:
+        chunks.append(seekhead)
+    if growth and mkv.segment_size is not None:
+        chunks.append((mkv.segment_size_offset, encode_size(mkv.segment_size + growth, mkv.segment_size_length)))
+    return chunks, growth, len(writes)
+
+
+def edit_in_place(file_path: str, ffprobe: Ffprobe, plan: EncodePlan) -> bool:
+    """
+    Applies dispositions, stream languages and global metadata to a Matroska file in place.
+
+    Args:
+        file_path (str): The Matroska file to change.
+        ffprobe (Ffprobe): The probe result of the file.
+        plan (EncodePlan): The encode plan, which only copies streams.
+
+    Returns:
+        bool: True if the file was changed, False if it was left untouched and has to be remuxed.
+
+    Raises:
+        OSError: If writing the header failed. The header may be half written then, so the file must not
+            be remuxed as if nothing happened.
+    """
+    try:
+        f = open(file_path, "r+b")
+    except OSError as e:
+        logger.info("In-place header edit not possible", extra={"file": file_path, "reason": str(e)})
+        return False
+    with f:
+        # Everything is encoded before the first byte is written, so a failure here leaves the file untouched
+        try:
+            chunks, growth, elements = plan_header_edit(f, ffprobe, plan)
+        except (MatroskaEditError, OSError, IndexError, ValueError) as e:
+            logger.info("In-place header edit not possible", extra={"file": file_path, "reason": str(e)})
+            return False
+        try:
+            for offset, data in chunks:
+                f.seek(offset)
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        except OSError as e:
+            logger.error("In-place header edit failed, the header may be damaged", extra={"file": file_path, "error": str(e)})
+            raise
+    logger.info("Edited Matroska header in place", extra={"file": file_path, "elements": elements, "growth": growth})
+    return True
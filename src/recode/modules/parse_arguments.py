@@ -17,6 +17,18 @@ def resource_path(*parts: str) -> Path:
     return base.joinpath(*parts)
 
 
+def parse_size(value: str) -> int:
+    """Parses a byte size like "500M" or "2T"."""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    value = value.strip().upper().removesuffix("B")
+    try:
+        if value and value[-1] in units:
+            return int(float(value[:-1]) * units[value[-1]])
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {value!r}") from None
+
+
 def parse_args() -> argparse.Namespace:
     languages = json.loads(resource_path("languages.json").read_text())
     parser = argparse.ArgumentParser(description="Recode media to common format", formatter_class=RichHelpFormatter)
@@ -37,12 +49,18 @@ def parse_args() -> argparse.Namespace:
         "-t",
         "--type",
         help="Type of content",
-        choices=["film", "series", "rename", "seriesdir", "changeSeasonType"],
-        required=True,
+        choices=["film", "series", "rename", "seriesdir", "changeSeasonType", "inventory", "duplicates"],
+        required=False,
         dest="contentype",
         metavar="TYPE",
     )
     parser.add_argument("-a", "--no-api", help="Disable Metadata and Subtitle APIs", default=False, action="store_true", dest="apis")
+    parser.add_argument(
+        "--logout",
+        help="Log out of OpenSubtitles when done instead of keeping the stored login for later runs",
+        action="store_true",
+        dest="logout",
+    )
     parser.add_argument("-s", "--subtitle", help="Directory containing Subtitles", required=False, default="", dest="subdir", metavar="DIR")
     parser.add_argument(
         "-c", "--codec", help="Select codec", required=False, choices=["h264", "h265", "av1"], dest="codec", metavar="CODEC", default="av1"
@@ -94,5 +112,138 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--metadata-only", help="Only change metadata, copy streams", required=False, action="store_true", dest="onlymetadata"
     )
+    parser.add_argument(
+        "--progress",
+        help="Progress output: a status line on a terminal, a dashboard of all jobs, JSON lines for headless runs, or none (auto picks tty or none)",
+        choices=["auto", "tty", "dashboard", "json", "none"],
+        default="auto",
+        dest="progress",
+        metavar="MODE",
+    )
+    parser.add_argument("--crop", help="Detect black bars and crop them off recoded video streams", action="store_true", dest="crop")
+    parser.add_argument(
+        "--target-quality",
+        help="Search the CRF whose sample encodes reach this score (VMAF 0-100 or SSIM 0-1) instead of a fixed CRF 23",
+        type=float,
+        default=None,
+        dest="targetquality",
+        metavar="SCORE",
+    )
+    parser.add_argument(
+        "--quality-metric", help="Metric for --target-quality", choices=["vmaf", "ssim"], default="vmaf", dest="qualitymetric"
+    )
+    parser.add_argument(
+        "--dry-run", help="Print the encode plan of every file as JSON instead of recoding", action="store_true", dest="dryrun"
+    )
     parser.add_argument("--dump-command", help="Dump ffmpeg command", required=False, action="store_true", dest="dumpcommand")
+    parser.add_argument("-j", "--jobs", help="Number of files to recode in parallel", type=int, default=1, dest="jobs", metavar="N")
+    parser.add_argument(
+        "--order",
+        help="Order of the jobs: longest predicted encode first, or as planned",
+        choices=["longest", "plan"],
+        default="longest",
+        dest="order",
+    )
+    parser.add_argument(
+        "--chunked",
+        help="Split the recoded video stream at keyframes and encode N segments in parallel",
+        type=int,
+        default=0,
+        dest="chunkworkers",
+        metavar="N",
+    )
+    parser.add_argument(
+        "--chunk-length",
+        help="Minimum length of a segment in seconds for --chunked",
+        type=int,
+        default=120,
+        dest="chunklength",
+        metavar="SECONDS",
+    )
+    parser.add_argument(
+        "--scratch",
+        help="Directory for temporary encode files (defaults to the output directory)",
+        required=False,
+        default=None,
+        dest="scratch",
+        metavar="DIR",
+    )
+    parser.add_argument(
+        "--stage",
+        help="Copy the sources of upcoming jobs to a local directory and encode from there",
+        required=False,
+        default=None,
+        dest="stagedir",
+        metavar="DIR",
+    )
+    parser.add_argument(
+        "--stage-ahead", help="Number of sources staged ahead of the running jobs", type=int, default=2, dest="stageahead", metavar="N"
+    )
+    parser.add_argument(
+        "--stage-budget",
+        help="Maximum size of the staging directory, e.g. 200G",
+        type=parse_size,
+        default="100G",
+        dest="stagebudget",
+        metavar="SIZE",
+    )
+    parser.add_argument(
+        "--rescan", help="Check files again that were already recoded or found compliant", action="store_true", dest="rescan"
+    )
+    parser.add_argument(
+        "--no-probe-cache", help="Always run ffprobe instead of reusing cached results", action="store_true", dest="noprobecache"
+    )
+    parser.add_argument(
+        "--no-crop-cache", help="Always run crop detection instead of reusing cached results", action="store_true", dest="nocropcache"
+    )
+    parser.add_argument(
+        "--no-tvdb-cache", help="Always query theTVDB instead of reusing cached responses", action="store_true", dest="notvdbcache"
+    )
+    parser.add_argument(
+        "--no-subtitle-cache",
+        help="Always search and download subtitles instead of reusing cached ones",
+        action="store_true",
+        dest="nosubtitlecache",
+    )
+    parser.add_argument(
+        "--api-concurrency", help="Maximum number of concurrent requests per API", type=int, default=4, dest="apiconcurrency", metavar="N"
+    )
+    parser.add_argument(
+        "--skip-twins",
+        help="Skip files whose episode or film already exists in the target codec elsewhere in the fingerprinted library, see --type duplicates",
+        action="store_true",
+        dest="skiptwins",
+    )
+    parser.add_argument(
+        "--inventory-db",
+        help="Inventory database used by --type inventory",
+        required=False,
+        default=None,
+        dest="inventorydb",
+        metavar="FILE",
+    )
+    parser.add_argument(
+        "--where",
+        help="With --type inventory, list the streams matching an SQL condition, e.g. \"codec_type = 'video' AND bit_rate > 10e6\"",
+        required=False,
+        default=None,
+        dest="where",
+        metavar="EXPR",
+    )
+    parser.add_argument(
+        "--save-plan",
+        help="Resolve all files, write the resulting plan to FILE and exit without recoding",
+        required=False,
+        default=None,
+        dest="saveplan",
+        metavar="FILE",
+    )
+    parser.add_argument(
+        "--load-plan",
+        help="Recode the jobs of a plan written by --save-plan",
+        required=False,
+        default=None,
+        dest="loadplan",
+        metavar="FILE",
+    )
     return parser.parse_args()
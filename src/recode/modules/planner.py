@@ -0,0 +1,150 @@
+"""
+planner.py
+
+Resolves a whole input tree into a list of fully specified recode jobs before any encoding starts.
+
+Everything that may ask the user something (series and movie lookups, season type selection) happens
+while planning. The resulting Plan is JSON-serializable and can be executed unattended, either right
+away or later from a saved plan file.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any
+
+from recode.modules.api import APITokens, get_episode, get_movie_name, get_series_from_tvdb
+from recode.modules.logger import logger
+from recode.modules.processed import is_processed
+
+PLAN_VERSION = 1
+
+
+@dataclass
+class Job:
+    file: str
+    path: str
+    metadata: dict[str, Any] | None = None
+
+    @staticmethod
+    def from_dict(obj: Any) -> "Job":
+        assert isinstance(obj, dict)
+        return Job(file=obj["file"], path=obj["path"], metadata=obj.get("metadata"))
+
+    def to_dict(self) -> dict:
+        return {"file": self.file, "path": self.path, "metadata": self.metadata}
+
+
+@dataclass
+class Plan:
+    options: dict[str, Any]
+    jobs: list[Job] = field(default_factory=list)
+
+    @staticmethod
+    def from_dict(obj: Any) -> "Plan":
+        assert isinstance(obj, dict)
+        if obj.get("version") != PLAN_VERSION:
+            raise ValueError(f"Unsupported plan version {obj.get('version')}")
+        return Plan(options=obj["options"], jobs=[Job.from_dict(job) for job in obj["jobs"]])
+
+    def to_dict(self) -> dict:
+        return {"version": PLAN_VERSION, "options": self.options, "jobs": [job.to_dict() for job in self.jobs]}
+
+    def save(self, path: str):
+        logger.info("Saving plan", extra={"path": path, "jobs": len(self.jobs)})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+
+    @staticmethod
+    def load(path: str) -> "Plan":
+        logger.info("Loading plan", extra={"path": path})
+        with open(path, encoding="utf-8") as f:
+            return Plan.from_dict(json.load(f))
+
+    def recode_kwargs(self, apitokens: APITokens) -> list[dict]:
+        """
+        Returns one keyword argument dict for recode() per job.
+        """
+        return [job.to_dict() | self.options | {"apitokens": apitokens} for job in self.jobs]
+
+
+def resolve_film(
+    file: str, token: str | None, lang: str, stype: str = "single", searchstring: str | None = None, output: str = ""
+) -> tuple[str | None, dict[str, Any] | None]:
+    """
+    Looks up a film and returns its output path and metadata. May prompt the user.
+
+    Args:
+        file (str): The path to the film.
+        token (str | None): TheTVDB API token.
+        lang (str): Language the information is retrieved in.
+        stype (str): "single" asks the user to pick between multiple matches, "multi" takes the first.
+        searchstring (str | None): Manual search string.
+        output (str): Output folder, defaults to the folder containing the film.
+
+    Returns:
+        tuple: The output path and the metadata, or (None, None) if the file is not a video.
+    """
+    output_file, metadata = get_movie_name(os.path.basename(file), token, lang=lang, stype=stype, searchstring=searchstring)
+    if output_file is None:
+        return None, None
+    output_dir = output if output != "" else os.path.dirname(os.path.realpath(file))
+    return os.path.join(output_dir, output_file), metadata
+
+
+def plan_film(
+    file: str,
+    token: str | None,
+    infolang: str,
+    output: str = "",
+    stype: str = "single",
+    searchstring: str | None = None,
+    settings: str | None = None,
+) -> Job | None:
+    if settings is not None and output == "" and is_processed(file, settings):
+        logger.info("Skipping processed film", extra={"file": file})
+        return None
+    logger.info("Planning film", extra={"file": file})
+    path, metadata = resolve_film(file, token, infolang, stype=stype, searchstring=searchstring, output=output)
+    if path is None:
+        logger.warning("Could not determine output filename", extra={"file": file})
+        return None
+    return Job(file=os.path.realpath(file), path=path, metadata=metadata)
+
+
+def plan_series(
+    folder: str, token: str | None, infolang: str, output: str = "", searchstring: str | None = None, settings: str | None = None
+) -> list[Job]:
+    logger.info("Planning series", extra={"folder": folder})
+    jobs: list[Job] = []
+    series = os.path.basename(folder)
+    parentfolder = output if output != "" else os.path.realpath(folder).removesuffix(f"/{series}")
+    logger.info("Series info", extra={"series": series, "parent_folder": parentfolder})
+    files = []
+    for dire in sorted(os.listdir(folder)):
+        if os.path.isdir(os.path.join(folder, dire)):
+            files.extend(
+                (os.path.join(os.path.realpath(folder), dire, file), file) for file in sorted(os.listdir(os.path.join(folder, dire)))
+            )
+        else:
+            files.append((os.path.join(os.path.realpath(folder), dire), dire))
+    if settings is not None and output == "":
+        pending = [(file, name) for file, name in files if not is_processed(file, settings)]
+        logger.info("Skipping processed episodes", extra={"series": series, "skipped": len(files) - len(pending)})
+        files = pending
+    if not files:
+        return jobs
+    seriesobj, seriesname, year = get_series_from_tvdb(series, token, lang=infolang, searchstring=searchstring)
+    if seriesobj is None:
+        logger.error("Failed to retrieve series info", extra={"series": series})
+        return jobs
+    if year != "":
+        series = f"{seriesname} ({year})"
+    else:
+        series = seriesname
+    for file, name in files:
+        season, episode, metadata = get_episode(series, name, seriesobj)
+        if episode is not None and season is not None:
+            logger.info("Planned episode", extra={"file": file, "episode": episode})
+            jobs.append(Job(file=file, path=os.path.join(parentfolder, series, season, episode), metadata=metadata))
+    return jobs
@@ -0,0 +1,111 @@
+"""
+processed.py
+
+Persistent store of files that recode produced or found compliant.
+
+Every entry is keyed by the path of the file and remembers its size, mtime and inode together with a hash
+of the settings it was checked against. As long as none of these changed, the file is skipped before it is
+probed or looked up in any API, so a sweep over an already converted library only costs one stat() per file.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from recode.modules.cache import CACHE_DIR
+from recode.modules.logger import logger
+
+PROCESSED_DB = os.path.join(CACHE_DIR, "processed.db")
+# Options that decide whether a file is compliant, a change of any of them invalidates all entries
+SETTINGS = [
+    "codec",
+    "bit",
+    "lang",
+    "infolang",
+    "sublang",
+    "subselector",
+    "omit_cover",
+    "copy",
+    "copy_streams",
+    "crop",
+    "target_quality",
+    "quality_metric",
+]
+
+
+def settings_hash(options: dict) -> str:
+    data = json.dumps({key: options.get(key) for key in SETTINGS}, sort_keys=True)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+class ProcessedStore:
+    """
+    Args:
+        path (str): Path of the database.
+        rescan (bool): Ignore the stored entries, every file is checked again and recorded anew.
+    """
+
+    def __init__(self, path: str = PROCESSED_DB, rescan: bool = False):
+        self.path = path
+        self.rescan = rescan
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS processed ("
+                "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, "
+                "settings TEXT NOT NULL, status TEXT NOT NULL, recorded REAL NOT NULL)"
+            )
+        logger.info("Opened processed file store", extra={"path": path, "rescan": rescan})
+
+    def is_processed(self, file: str, settings: str) -> bool:
+        if self.rescan:
+            return False
+        file = os.path.realpath(file)
+        try:
+            stat = os.stat(file)
+        except OSError:
+            return False
+        with self.lock:
+            row = self.conn.execute("SELECT size, mtime_ns, inode, settings FROM processed WHERE path = ?", (file,)).fetchone()
+        return row == (stat.st_size, stat.st_mtime_ns, stat.st_ino, settings)
+
+    def record(self, file: str, settings: str, status: str):
+        file = os.path.realpath(file)
+        stat = os.stat(file)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO processed (path, size, mtime_ns, inode, settings, status, recorded) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file, stat.st_size, stat.st_mtime_ns, stat.st_ino, settings, status, time.time()),
+            )
+        logger.info("Recorded processed file", extra={"file": file, "status": status})
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+processed_store: ProcessedStore | None = None
+
+
+def open_processed_store(path: str = PROCESSED_DB, rescan: bool = False):
+    global processed_store
+    processed_store = ProcessedStore(path, rescan=rescan)
+
+
+def is_processed(file: str, settings: str) -> bool:
+    return processed_store is not None and processed_store.is_processed(file, settings)
+
+
+def record_processed(file: str, settings: str, status: str):
+    if processed_store is None:
+        return
+    try:
+        processed_store.record(file, settings, status)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning("Could not record processed file", extra={"file": file, "error": str(e)})
@@ -0,0 +1,460 @@
+"""
+progress.py
+
+Progress reporting of running ffmpeg processes.
+
+ffmpeg is started with `-progress pipe:2`, which writes blocks of key=value lines to stderr. Every block
+updates the JobProgress of its job. Rendering is decoupled from these updates: one renderer thread redraws
+all running jobs at a fixed rate, either as a single status line on a terminal or as JSON lines for
+headless runs. Without a terminal and without JSON output nothing is drawn at all.
+
+The dashboard mode shows every job of a batch, not only the ones that encode: its stage (probe, plan,
+stage, tune, encode, move), the encode progress, the number of queued and finished jobs and the throughput in
+source gigabytes per hour. Console output of the jobs is written above the dashboard. Without a terminal
+the dashboard is printed as plain lines every DASHBOARD_INTERVAL seconds.
+"""
+
+import datetime
+import functools
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from collections.abc import Callable
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from colorama import Fore as Color
+from colorama import Style
+
+from recode.modules.logger import job_context, logger
+from recode.modules.scheduler import console_lock
+
+# Seconds between two redraws of the status line and between two JSON lines of a job
+RENDER_INTERVAL = 0.5
+JSON_INTERVAL = 5.0
+# Seconds between two plain dashboard prints without a terminal
+DASHBOARD_INTERVAL = 30.0
+PROGRESS_MODES = ["auto", "tty", "dashboard", "json", "none"]
+FAILED_STATUSES = {"failed", "error"}
+STAGE_COLORS = {
+    "probe": Color.CYAN,
+    "plan": Color.CYAN,
+    "stage": Color.MAGENTA,
+    "tune": Color.YELLOW,
+    "encode": Color.GREEN,
+    "move": Color.BLUE,
+}
+
+
+def human_readable_size(size_bytes):
+    """
+    Convert a file size in bytes to a human-readable string with autoscaled units.
+    """
+    if size_bytes == 0:
+        return "0B"
+    units = ["B", "KB", "MB", "GB", "TB", "PB"]
+    i = 0
+    while size_bytes >= 1024 and i < len(units) - 1:
+        size_bytes /= 1024.0
+        i += 1
+    return f"{size_bytes:.2f}{units[i]}"
+
+
+def format_timedelta(td: datetime.timedelta) -> str:
+    total_seconds = int(td.total_seconds())
+    hours, remainder = divmod(total_seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+
+def to_float(value: str) -> float | None:
+    try:
+        return float(value.removesuffix("x").removesuffix("kbits/s"))
+    except ValueError:
+        return None
+
+
+@dataclass(eq=False)
+class JobProgress:
+    label: str
+    duration: float | None = None
+    source: str | None = None
+    source_size: int = 0
+    stage: str = "encode"
+    # Set while ffmpeg runs, jobs begun with begin_job() stay registered between their encodes
+    encoding: bool = False
+    tracked: bool = False
+    frame: int = 0
+    fps: float = 0.0
+    out_time: float = 0.0
+    size: int = 0
+    bitrate: float | None = None
+    speed: float | None = None
+    finished: bool = False
+    started: float = field(default_factory=time.monotonic)
+    emitted: float = 0.0
+    # key=value pairs of the block ffmpeg is currently writing
+    pending: dict[str, str] = field(default_factory=dict)
+
+    def feed(self, line: str) -> bool:
+        """
+        Consumes one line of ffmpeg's -progress output. Returns False for lines that are not part of it.
+        """
+        key, sep, value = line.strip().partition("=")
+        if not sep or not key.replace("_", "").isalnum():
+            return False
+        if key != "progress":
+            self.pending[key] = value
+            return True
+        values, self.pending = self.pending, {}
+        if values.get("frame", "").isdigit():
+            self.frame = int(values["frame"])
+        self.fps = to_float(values.get("fps", "")) or 0.0
+        if values.get("out_time_us", "").isdigit():
+            self.out_time = int(values["out_time_us"]) / 1e6
+        if values.get("total_size", "").isdigit():
+            self.size = int(values["total_size"])
+        self.bitrate = to_float(values.get("bitrate", ""))
+        self.speed = to_float(values.get("speed", ""))
+        self.finished = value == "end"
+        logger.debug("FFmpeg progress", extra=self.to_dict())
+        return True
+
+    def start_encode(self, duration: float | None):
+        self.duration = duration
+        self.frame, self.fps, self.out_time, self.size = 0, 0.0, 0.0, 0
+        self.bitrate = self.speed = None
+        self.finished = False
+        self.pending = {}
+        self.stage = "encode"
+        self.encoding = True
+
+    def source_done(self) -> float:
+        """Bytes of the source that are encoded, estimated from the encode progress."""
+        percent = self.percent()
+        return self.source_size * percent / 100 if percent is not None else 0.0
+
+    def percent(self) -> float | None:
+        if not self.duration:
+            return None
+        return min(100.0, self.out_time / self.duration * 100)
+
+    def eta(self) -> float | None:
+        if not self.duration or not self.speed:
+            return None
+        return max(0.0, (self.duration - self.out_time) / self.speed)
+
+    def projected_size(self) -> int | None:
+        if not self.duration or self.out_time <= 0:
+            return None
+        return int(self.size * self.duration / self.out_time)
+
+    def to_dict(self) -> dict:
+        eta = self.eta()
+        return {
+            "job": self.label,
+            "frame": self.frame,
+            "fps": self.fps,
+            "time": round(self.out_time, 3),
+            "size": self.size,
+            "speed": self.speed,
+            "percent": self.percent(),
+            "eta": round(eta, 1) if eta is not None else None,
+            "projected_size": self.projected_size(),
+            "elapsed": round(time.monotonic() - self.started, 3),
+        }
+
+    def line(self, color: bool = True) -> str:
+        yellow, reset = (Color.YELLOW, Style.RESET_ALL) if color else ("", "")
+        return " ".join([f"{yellow}{self.label}{reset}"] + self.metrics(color))
+
+    def row(self, width: int, color: bool = True) -> str:
+        """One dashboard row: label padded to `width`, stage and the encode progress once ffmpeg runs."""
+        yellow, stage_color, reset = (Color.YELLOW, STAGE_COLORS.get(self.stage, ""), Style.RESET_ALL) if color else ("", "", "")
+        parts = [f"{yellow}{self.label[:width].ljust(width)}{reset}", f"{stage_color}{self.stage.ljust(6)}{reset}"]
+        if self.encoding:
+            parts += self.metrics(color)
+        return " ".join(parts)
+
+    def metrics(self, color: bool = True) -> list[str]:
+        green, blue, reset = (Color.GREEN, Color.BLUE, Style.RESET_ALL) if color else ("", "", "")
+        percent = self.percent()
+        eta = self.eta()
+        projected = self.projected_size()
+        parts = []
+        if percent is not None:
+            parts.append(f"{green}{percent:5.1f}%{reset}")
+        parts.append(f"fps={int(self.fps)}")
+        parts.append(f"speed={self.speed:.2f}x" if self.speed is not None else "speed=?")
+        parts.append(f"time={format_timedelta(datetime.timedelta(seconds=self.out_time))}")
+        if eta is not None:
+            parts.append(f"eta={blue}{format_timedelta(datetime.timedelta(seconds=eta))}{reset}")
+        if projected is not None:
+            parts.append(f"size~{human_readable_size(projected)}")
+        return parts
+
+
+class DashboardStream:
+    """
+    Stands in for sys.stdout while the dashboard is shown on a terminal. Everything the jobs print removes
+    the dashboard first, so the output ends up above it and the next redraw appends the dashboard again.
+    """
+
+    def __init__(self, stream, renderer: "ProgressRenderer"):
+        self.stream = stream
+        self.renderer = renderer
+
+    def write(self, text: str) -> int:
+        with console_lock:
+            self.renderer.erase()
+            return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name: str):
+        return getattr(self.stream, name)
+
+
+class ProgressRenderer:
+    """
+    Draws the progress of all running jobs from a single thread.
+
+    Args:
+        mode (str): "tty" for a status line, "dashboard" for a view of the whole batch, "json" for JSON lines
+            on stdout, "none" to only track progress.
+    """
+
+    def __init__(self, mode: str = "auto"):
+        self.mode = "none"
+        self.live = False
+        self.stream = sys.stdout
+        self.jobs: list[JobProgress] = []
+        self.lock = threading.Lock()
+        self.drawn = False
+        # Number of lines of the dashboard currently on the terminal
+        self.block = 0
+        self.thread: threading.Thread | None = None
+        self.total = 0
+        self.started = 0
+        self.done = 0
+        self.failed = 0
+        self.done_bytes = 0
+        self.batch_started: float | None = None
+        self.logged = 0.0
+        self.set_mode(mode)
+
+    def set_mode(self, mode: str):
+        if mode == "auto":
+            mode = "tty" if sys.stdout.isatty() else "none"
+        self.mode = mode
+        self.live = mode == "dashboard" and sys.stdout.isatty()
+        if self.live and not isinstance(sys.stdout, DashboardStream):
+            self.stream = sys.stdout
+            sys.stdout = DashboardStream(sys.stdout, self)
+
+    def start_thread(self):
+        """Starts the render thread, must be called with the lock held."""
+        if self.mode != "none" and self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="recode-progress", daemon=True)
+            self.thread.start()
+
+    def expect(self, count: int):
+        """Announces `count` more jobs, they are shown as queued until they begin."""
+        with self.lock:
+            self.total += count
+            if self.batch_started is None:
+                self.batch_started = time.monotonic()
+
+    def begin_job(self, label: str, source: str | None = None) -> JobProgress:
+        """Registers a job for its whole run and makes it the current job of the calling thread."""
+        try:
+            size = os.path.getsize(source) if source is not None else 0
+        except OSError:
+            size = 0
+        job = JobProgress(label=label, source=source, source_size=size, stage="probe", tracked=True)
+        with self.lock:
+            self.jobs.append(job)
+            self.started += 1
+            if self.batch_started is None:
+                self.batch_started = time.monotonic()
+            self.start_thread()
+        current_job.set(job)
+        return job
+
+    def end_job(self, job: JobProgress, status: str):
+        current_job.set(None)
+        with self.lock:
+            if job in self.jobs:
+                self.jobs.remove(job)
+            self.done += 1
+            self.failed += status in FAILED_STATUSES
+            self.done_bytes += job.source_size
+
+    def register(self, label: str, duration: float | None = None) -> JobProgress:
+        """Registers an encode. Within a job begun with begin_job() the encode updates that job."""
+        job = current_job.get()
+        if job is None:
+            job = JobProgress(label=label)
+            with self.lock:
+                self.jobs.append(job)
+        job.start_encode(duration)
+        with self.lock:
+            self.start_thread()
+        return job
+
+    def unregister(self, job: JobProgress):
+        with self.lock:
+            if not job.encoding or job not in self.jobs:
+                return
+            job.encoding = False
+            if not job.tracked:
+                self.jobs.remove(job)
+        if self.mode == "json":
+            self.emit(job)
+        self.clear()
+
+    def erase(self):
+        """Removes the dashboard from the terminal, must be called with the console lock held."""
+        if self.block:
+            self.stream.write(f"\x1b[{self.block}A\r\x1b[J")
+            self.block = 0
+
+    def clear(self):
+        """Removes the status line, so regular console output starts on an empty line."""
+        with console_lock:
+            if self.drawn:
+                print("\r\x1b[K", end="", flush=True)
+                self.drawn = False
+            self.erase()
+
+    def emit(self, job: JobProgress):
+        job.emitted = time.monotonic()
+        with console_lock:
+            print(json.dumps(job.to_dict()), flush=True)
+
+    def draw(self, jobs: list[JobProgress]):
+        width = shutil.get_terminal_size().columns
+        text = "  ".join(job.line(color=False) for job in jobs)
+        # A wrapped line can't be overwritten anymore, cut it to the terminal width
+        text = text[: width - 1] if len(text) >= width else "  ".join(job.line() for job in jobs)
+        with console_lock:
+            print("\r\x1b[K" + text, end="", flush=True)
+            self.drawn = True
+
+    def throughput(self, jobs: list[JobProgress]) -> float:
+        """Source gigabytes per hour since the first job began, running encodes count with their progress."""
+        if self.batch_started is None:
+            return 0.0
+        elapsed = time.monotonic() - self.batch_started
+        done = self.done_bytes + sum(job.source_done() for job in jobs)
+        return done / 1024**3 / (elapsed / 3600) if elapsed > 0 else 0.0
+
+    def summary(self, jobs: list[JobProgress], color: bool = True) -> str:
+        red, green, blue, reset = (Color.RED, Color.GREEN, Color.BLUE, Style.RESET_ALL) if color else ("", "", "", "")
+        queued = max(0, self.total - self.started)
+        elapsed = time.monotonic() - self.batch_started if self.batch_started is not None else 0.0
+        failed = f", {red}{self.failed} failed{reset}" if self.failed else ""
+        return (
+            f"{red}Jobs{reset}: {green}{len(jobs)} running{reset}, {queued} queued, {self.done} done{failed}"
+            f"  {blue}{self.throughput(jobs):.1f} GB/h{reset}"
+            f"  elapsed {format_timedelta(datetime.timedelta(seconds=elapsed))}"
+        )
+
+    def dashboard(self, jobs: list[JobProgress], color: bool = True) -> list[str]:
+        width = max((len(job.label) for job in jobs), default=0)
+        width = min(width, max(16, shutil.get_terminal_size().columns // 3))
+        return [self.summary(jobs, color)] + [job.row(width, color) for job in jobs]
+
+    def draw_dashboard(self, jobs: list[JobProgress]):
+        columns = shutil.get_terminal_size().columns
+        plain = self.dashboard(jobs, color=False)
+        # Wrapped lines would break moving the cursor back up, cut them to the terminal width
+        lines = [text[: columns - 1] if len(text) >= columns else line for text, line in zip(plain, self.dashboard(jobs), strict=True)]
+        with console_lock:
+            self.erase()
+            self.stream.write("".join(line + "\n" for line in lines))
+            self.stream.flush()
+            self.block = len(lines)
+
+    def log_dashboard(self, jobs: list[JobProgress]):
+        self.logged = time.monotonic()
+        logger.info(
+            "Dashboard",
+            extra={
+                "running": len(jobs),
+                "queued": max(0, self.total - self.started),
+                "done": self.done,
+                "failed": self.failed,
+                "gb_per_hour": round(self.throughput(jobs), 2),
+            },
+        )
+        with console_lock:
+            for line in self.dashboard(jobs, color=False):
+                print(line, flush=True)
+
+    def run(self):
+        while True:
+            time.sleep(RENDER_INTERVAL)
+            with self.lock:
+                jobs = list(self.jobs)
+                waiting = self.started < self.total
+            if self.mode == "dashboard":
+                if not jobs and not waiting:
+                    with console_lock:
+                        self.erase()
+                elif self.live:
+                    self.draw_dashboard(jobs)
+                elif time.monotonic() - self.logged >= DASHBOARD_INTERVAL:
+                    self.log_dashboard(jobs)
+                continue
+            jobs = [job for job in jobs if job.encoding]
+            if not jobs:
+                continue
+            if self.mode == "json":
+                for job in jobs:
+                    if time.monotonic() - job.emitted >= JSON_INTERVAL:
+                        self.emit(job)
+            elif self.mode == "tty":
+                self.draw(jobs)
+
+
+current_job: ContextVar[JobProgress | None] = ContextVar("current_job", default=None)
+renderer = ProgressRenderer("auto")
+
+
+def set_progress_mode(mode: str):
+    renderer.set_mode(mode)
+
+
+def expect_jobs(count: int):
+    renderer.expect(count)
+
+
+def set_stage(stage: str):
+    """Sets the stage of the current job shown on the dashboard."""
+    job = current_job.get()
+    if job is not None:
+        job.stage = stage
+        logger.debug("Job stage", extra={"stage": stage})
+
+
+def tracked(func: Callable[..., str | None]) -> Callable[..., str | None]:
+    """
+    Wraps a job function so the dashboard shows the job from its start to its end.
+    """
+
+    @functools.wraps(func)
+    def run(**kwargs) -> str | None:
+        job = renderer.begin_job(job_context.get() or os.path.basename(kwargs["file"]), kwargs["file"])
+        status = "error"
+        try:
+            status = func(**kwargs) or "done"
+            return status
+        finally:
+            renderer.end_job(job, status)
+
+    return run
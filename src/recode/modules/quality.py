@@ -0,0 +1,250 @@
+"""
+quality.py
+
+Target quality search: finds the highest CRF (or the hardware encoders' constant quality value) whose
+encode still reaches a requested VMAF or SSIM score.
+
+A few short slices of the video stream are encoded with the settings of the encode plan at a candidate
+value and compared against the source with libvmaf or ssim. The score of a candidate is the mean over
+the slices, and a binary search over the value range of the encoder finds the highest value that reaches
+the target. Sample scores and search results are cached per source file and encoder settings, so a rerun
+or a second search with a different target reuses every sample that was already scored.
+"""
+
+import hashlib
+import json
+import re
+import tempfile
+
+from ffmpeg import FFmpeg, errors
+
+from recode.modules.cache import SqliteCache, file_identity
+from recode.modules.chunked import segment_args
+from recode.modules.datatypes import Ffprobe
+from recode.modules.encode_plan import EncodePlan, StreamAction
+from recode.modules.logger import logger
+from recode.modules.tempfiles import discard, temp_output
+
+QUALITY_CACHE_SIZE = 16 * 1024 * 1024
+METRICS = ["vmaf", "ssim"]
+# Global encoder options that set the quality, by encoder family
+QUALITY_OPTIONS = ["crf", "cq", "qvbr_quality_level"]
+# Searched value range, lower values mean higher quality
+QUALITY_RANGE = (14, 40)
+QUALITY_RANGES = {"libsvtav1": (18, 55)}
+# Number of slices and seconds encoded per slice
+SAMPLES = 3
+SAMPLE_SECONDS = 5
+SCORE_PATTERNS = {
+    "vmaf": re.compile(r"VMAF score: ([\d.]+)"),
+    "ssim": re.compile(r"SSIM .*All:([\d.]+)"),
+}
+
+quality_cache: SqliteCache | None = None
+
+
+def enable_quality_cache(enabled: bool = True):
+    """
+    Enables or disables the persistent cache of sample scores and search results.
+    """
+    global quality_cache
+    if enabled and quality_cache is None:
+        quality_cache = SqliteCache("quality.sqlite3", max_bytes=QUALITY_CACHE_SIZE)
+    elif not enabled:
+        quality_cache = None
+
+
+def settings_digest(args: dict) -> str:
+    return hashlib.sha1(json.dumps(args, sort_keys=True).encode()).hexdigest()
+
+
+def sample_starts(duration: float) -> list[float]:
+    if duration <= SAMPLE_SECONDS * SAMPLES:
+        return [0.0]
+    return [duration * (idx + 1) / (SAMPLES + 1) for idx in range(SAMPLES)]
+
+
+def encode_sample(file_path: str, index: int, start: float, args: dict, sample: str) -> bool:
+    ffmpeg = (
+        FFmpeg(executable="ffmpeg")
+        .option("y")
+        .option("v", "error")
+        .input(file_path, ss=f"{start:.3f}", t=SAMPLE_SECONDS)
+        .output(sample, args, f="matroska", map=f"0:{index}", an=None, sn=None)
+    )
+    try:
+        ffmpeg.execute()
+    except errors.FFmpegError as e:
+        logger.warning("Sample encode failed", extra={"file": file_path, "start": start, "error": str(e)})
+        return False
+    return True
+
+
+def score_sample(file_path: str, index: int, start: float, sample: str, metric: str, reference_filter: str | None) -> float | None:
+    """
+    Compares an encoded slice against the same slice of the source. The source gets the filters of the
+    encoded stream (e.g. a crop), so both have the same geometry.
+    """
+    reference = f"{reference_filter}," if reference_filter else ""
+    compare = "libvmaf" if metric == "vmaf" else "ssim"
+    graph = (
+        "[0:v]format=yuv420p,setpts=PTS-STARTPTS[distorted];"
+        f"[1:{index}]{reference}format=yuv420p,setpts=PTS-STARTPTS[reference];"
+        f"[distorted][reference]{compare}"
+    )
+    scores: list[float] = []
+    ffmpeg = (
+        FFmpeg(executable="ffmpeg")
+        .option("hide_banner")
+        .option("nostats")
+        .input(sample)
+        .input(file_path, ss=f"{start:.3f}", t=SAMPLE_SECONDS)
+        .output("-", {"lavfi": graph}, f="null")
+    )
+
+    @ffmpeg.on("stderr")
+    def on_stderr(line: str):
+        match = SCORE_PATTERNS[metric].search(line)
+        if match is not None:
+            scores.append(float(match.group(1)))
+
+    try:
+        ffmpeg.execute()
+    except errors.FFmpegError as e:
+        logger.warning("Sample scoring failed", extra={"file": file_path, "start": start, "error": str(e)})
+        return None
+    return scores[-1] if scores else None
+
+
+class QualitySearch:
+    """
+    Searches the quality value of one encoded video stream.
+
+    Args:
+        file_path (str): The path to the source file.
+        ffprobe (Ffprobe): Probe result of the source, for its duration.
+        plan (EncodePlan): The encode plan, its encoder options are used for the samples.
+        stream (StreamAction): The encoded video stream of the plan.
+        option (str): The encoder option that sets the quality, one of QUALITY_OPTIONS.
+        metric (str): "vmaf" or "ssim".
+        scratch (str | None): Directory for the sample files, defaults to the system temp dir.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        ffprobe: Ffprobe,
+        plan: EncodePlan,
+        stream: StreamAction,
+        option: str,
+        metric: str = "vmaf",
+        scratch: str | None = None,
+    ):
+        self.file_path = file_path
+        self.plan = plan
+        self.stream = stream
+        self.option = option
+        self.metric = metric
+        self.scratch = scratch
+        self.identity = f"{file_identity(file_path)}:{stream.index}:{metric}"
+        self.args = segment_args(plan, stream)
+        self.reference_filter = dict(stream.options).get("filter")
+        try:
+            duration = float(ffprobe.format.duration or 0)
+        except ValueError:
+            duration = 0.0
+        self.starts = sample_starts(duration)
+        self.scores: dict[int, float | None] = {}
+
+    def cached(self, key: str) -> float | None:
+        if quality_cache is None:
+            return None
+        value = quality_cache.get(key)
+        return float(value) if value is not None else None
+
+    def store(self, key: str, value: float):
+        if quality_cache is not None:
+            quality_cache.set(key, str(value).encode())
+
+    def score(self, value: int) -> float | None:
+        """
+        Returns the mean score of all slices encoded at `value`, None if a slice could not be scored.
+        """
+        if value in self.scores:
+            return self.scores[value]
+        args = self.args | {self.option: str(value)}
+        digest = settings_digest(args)
+        total = 0.0
+        for start in self.starts:
+            key = f"sample:{self.identity}:{digest}:{start:.3f}"
+            score = self.cached(key)
+            if score is None:
+                sample = temp_output(self.file_path, self.scratch or tempfile.gettempdir())
+                try:
+                    if encode_sample(self.file_path, self.stream.index, start, args, sample):
+                        score = score_sample(self.file_path, self.stream.index, start, sample, self.metric, self.reference_filter)
+                finally:
+                    discard(sample)
+                if score is None:
+                    self.scores[value] = None
+                    return None
+                self.store(key, score)
+            total += score
+        self.scores[value] = total / len(self.starts)
+        logger.info("Scored quality value", extra={"option": self.option, "value": value, "score": self.scores[value]})
+        return self.scores[value]
+
+    def search(self, target: float) -> int | None:
+        """
+        Binary searches the highest value whose score reaches `target`. Returns the lowest value of the
+        range if none does, None if samples could not be scored.
+        """
+        key = f"search:{self.identity}:{settings_digest({k: v for k, v in self.args.items() if k != self.option})}:{target}"
+        cached = self.cached(key)
+        if cached is not None:
+            logger.info("Quality search cache hit", extra={"file": self.file_path, "value": int(cached)})
+            return int(cached)
+        low, high = QUALITY_RANGES.get(self.stream.codec or "", QUALITY_RANGE)
+        best = low
+        while low <= high:
+            value = (low + high) // 2
+            score = self.score(value)
+            if score is None:
+                return None
+            if score >= target:
+                best, low = value, value + 1
+            else:
+                high = value - 1
+        self.store(key, best)
+        return best
+
+
+def quality_option(plan: EncodePlan) -> str | None:
+    options = dict(plan.encoder)
+    return next((option for option in QUALITY_OPTIONS if option in options), None)
+
+
+def tune_quality(
+    file_path: str,
+    ffprobe: Ffprobe,
+    plan: EncodePlan,
+    stream: StreamAction,
+    target: float,
+    metric: str = "vmaf",
+    scratch: str | None = None,
+) -> EncodePlan:
+    """
+    Returns the plan with the quality value that reaches `target`, or the unchanged plan if the search
+    is not possible.
+    """
+    option = quality_option(plan)
+    if option is None:
+        logger.warning("Encoder has no quality option, keeping the plan", extra={"encoder": stream.codec})
+        return plan
+    search = QualitySearch(file_path, ffprobe, plan, stream, option, metric, scratch)
+    value = search.search(target)
+    if value is None:
+        logger.warning("Quality search failed, keeping the plan", extra={"file": file_path, "option": option})
+        return plan
+    logger.info("Quality search finished", extra={"file": file_path, "option": option, "value": value, "target": target})
+    return plan.replace_option(option, str(value))
@@ -0,0 +1,109 @@
+"""
+scheduler.py
+
+Runs independent recode jobs through a bounded worker pool.
+
+Every job runs in its own worker thread (the heavy lifting happens in the ffmpeg child process), gets its
+own log context via `job_context` and reports a status string. Results are always returned in submission
+order, regardless of the order in which the jobs finish.
+"""
+
+import datetime
+import os
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from colorama import Fore as Color
+from colorama import Style
+
+from recode.modules.logger import job_context, logger
+
+# Serializes multi-line console output of concurrently running jobs
+console_lock = threading.RLock()
+
+STATUS_COLORS = {
+    "done": Color.GREEN,
+    "moved": Color.GREEN,
+    "unchanged": Color.BLUE,
+    "skipped": Color.YELLOW,
+    "planned": Color.BLUE,
+    "failed": Color.RED,
+    "error": Color.RED,
+}
+
+
+@dataclass
+class JobResult:
+    index: int
+    label: str
+    status: str
+    start: datetime.datetime
+    stop: datetime.datetime
+
+
+def run_job(index: int, label: str, func: Callable[..., str | None], kwargs: dict) -> JobResult:
+    """
+    Runs a single job with its label set as log context.
+
+    Args:
+        index (int): Position of the job in the batch.
+        label (str): Label used for log records and console output of this job.
+        func (Callable): The job function, called with kwargs. Its return value is used as status.
+        kwargs (dict): Keyword arguments for func.
+
+    Returns:
+        JobResult: The outcome of the job.
+    """
+    token = job_context.set(label)
+    start = datetime.datetime.now()
+    try:
+        logger.info("Job started", extra={"index": index})
+        status = func(**kwargs) or "done"
+    except Exception as e:
+        logger.exception("Job failed", extra={"index": index, "error": str(e)})
+        with console_lock:
+            print(f"{Color.RED}Error in job {label}:{Style.RESET_ALL} {e}")
+        status = "error"
+    finally:
+        stop = datetime.datetime.now()
+        logger.info("Job finished", extra={"index": index, "duration": str(stop - start)})
+        job_context.reset(token)
+    return JobResult(index=index, label=label, status=status, start=start, stop=stop)
+
+
+def run_jobs(func: Callable[..., str | None], jobs: list[dict], workers: int = 1) -> list[JobResult]:
+    """
+    Runs func once per entry of jobs using at most `workers` concurrent jobs.
+
+    Args:
+        func (Callable): The job function, e.g. recode.
+        jobs (list): A list of keyword argument dicts, one per job. Each needs a "file" key used as label.
+        workers (int): Maximum number of jobs running at the same time.
+
+    Returns:
+        list: A list of JobResult in the same order as jobs.
+    """
+    labels = [os.path.basename(job["file"]) for job in jobs]
+    logger.info("Scheduling jobs", extra={"count": len(jobs), "workers": workers})
+    if workers <= 1 or len(jobs) <= 1:
+        return [run_job(idx, labels[idx], func, job) for idx, job in enumerate(jobs)]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recode-job") as pool:
+        futures = [pool.submit(run_job, idx, labels[idx], func, job) for idx, job in enumerate(jobs)]
+        return [future.result() for future in futures]
+
+
+def print_summary(results: list[JobResult]):
+    if len(results) == 0:
+        return
+    label_max_len = max([len(result.label) for result in results])
+    with console_lock:
+        print(f"{Color.LIGHTBLACK_EX}|------------------------------------------------------------------{Style.RESET_ALL}")
+        print(f"{Color.RED}Summary{Style.RESET_ALL}:")
+        for result in results:
+            color = STATUS_COLORS.get(result.status, Color.WHITE)
+            duration = str(result.stop - result.start).split(".")[0]
+            print(
+                f"{Color.BLUE}{result.index + 1:>3}{Style.RESET_ALL} {Color.YELLOW}{result.label.ljust(label_max_len)}{Style.RESET_ALL} {color}{result.status.ljust(9)}{Style.RESET_ALL} {duration}"
+            )
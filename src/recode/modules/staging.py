@@ -0,0 +1,266 @@
+"""
+staging.py
+
+Local staging of source files that live on slow network storage.
+
+A background thread copies the sources of the next jobs to a local scratch directory while the current
+job encodes, so ffmpeg reads from the local copy instead of stalling on network latency. The staging
+directory has a byte budget: copies of running and upcoming jobs are pinned, everything else (copies
+kept from failed jobs or left over from an earlier run) is evicted least recently used first. A copy is
+deleted as soon as its job has published its output.
+
+Copies are named after the path, size and mtime of their source, so a changed source is never read from
+a stale copy and a rerun after a failure reuses the copies that are still there.
+"""
+
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+
+from recode.modules.FileOperations import copy_file
+from recode.modules.logger import logger
+from recode.modules.progress import human_readable_size
+from recode.modules.tempfiles import TEMP_PATTERN, discard, recover_orphans, temp_output
+
+# Statuses after which a staged copy is kept for a rerun
+KEEP_STATUSES = {"failed", "error"}
+
+
+def stage_name(file: str) -> str:
+    stat = os.stat(file)
+    digest = hashlib.sha1(f"{file}\0{stat.st_size}\0{stat.st_mtime_ns}".encode()).hexdigest()[:20]
+    return digest + os.path.splitext(file)[1]
+
+
+class Stager:
+    """
+    Prefetches the sources of a batch of jobs into a local directory.
+
+    Args:
+        files (list): Source files in the order their jobs are submitted.
+        directory (str): Local staging directory.
+        budget (int): Maximum number of bytes kept in the staging directory.
+        ahead (int): Number of files staged ahead of the jobs that have started.
+    """
+
+    def __init__(self, files: list[str], directory: str, budget: int, ahead: int = 2):
+        self.files = [os.path.realpath(file) for file in files]
+        self.directory = os.path.realpath(directory)
+        self.budget = budget
+        self.ahead = max(1, ahead)
+        self.cond = threading.Condition()
+        # Staged copies by file name, least recently used first, with their size
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self.staged: dict[str, str] = {}
+        self.pinned: set[str] = set()
+        self.started: set[str] = set()
+        self.copying: str | None = None
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name="recode-stager", daemon=True)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        recover_orphans(self.directory)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if TEMP_PATTERN.match(name) or not os.path.isfile(path):
+                continue
+            self.entries[name] = os.path.getsize(path)
+        for name in sorted(self.entries, key=lambda name: os.path.getmtime(os.path.join(self.directory, name))):
+            self.entries.move_to_end(name)
+        logger.info(
+            "Staging started",
+            extra={
+                "directory": self.directory,
+                "budget": self.budget,
+                "ahead": self.ahead,
+                "files": len(self.files),
+                "cached": len(self.entries),
+            },
+        )
+        self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+
+    def used(self) -> int:
+        return sum(self.entries.values())
+
+    def evict(self, size: int) -> bool:
+        """
+        Evicts unpinned copies, least recently used first, until `size` more bytes fit the budget.
+        Must be called with the lock held.
+        """
+        for name in list(self.entries):
+            if self.used() + size <= self.budget:
+                break
+            if name in self.pinned:
+                continue
+            discard(os.path.join(self.directory, name))
+            logger.info("Evicted staged file", extra={"staged": name, "size": self.entries.pop(name)})
+        return self.used() + size <= self.budget
+
+    def run(self):
+        for index, file in enumerate(self.files):
+            with self.cond:
+                # Stay at most `ahead` files in front of the jobs that are running
+                self.cond.wait_for(lambda index=index: self.stopped or index < len(self.started) + self.ahead)
+                if self.stopped:
+                    return
+                if file in self.started:
+                    continue
+                try:
+                    name = stage_name(file)
+                except OSError as e:
+                    logger.warning("Cannot stage file", extra={"file": file, "error": str(e)})
+                    continue
+                size = os.path.getsize(file)
+                if size > self.budget:
+                    logger.info("File exceeds the staging budget", extra={"file": file, "size": size, "budget": self.budget})
+                    continue
+                self.pinned.add(name)
+                if name in self.entries:
+                    self.entries.move_to_end(name)
+                    self.staged[file] = name
+                    logger.info("Reusing staged file", extra={"file": file, "staged": name})
+                    continue
+                # Wait for running jobs to release their copies if the pinned ones fill the budget
+                self.cond.wait_for(lambda file=file, size=size: self.stopped or file in self.started or self.evict(size))
+                if self.stopped or file in self.started:
+                    self.pinned.discard(name)
+                    continue
+                self.copying = file
+            self.copy(file, name, size)
+
+    def copy(self, file: str, name: str, size: int):
+        path = os.path.join(self.directory, name)
+        tmpfile = None
+        staged = False
+        start = time.perf_counter()
+        try:
+            tmpfile = temp_output(path)
+            method = copy_file(file, tmpfile)
+            os.replace(tmpfile, path)
+            os.utime(path)
+            staged = True
+            seconds = time.perf_counter() - start
+            logger.info(
+                "Staged file",
+                extra={
+                    "file": file,
+                    "staged": name,
+                    "method": method,
+                    "size": size,
+                    "seconds": round(seconds, 3),
+                    "throughput": human_readable_size(size / seconds if seconds > 0 else 0) + "/s",
+                },
+            )
+        except OSError as e:
+            logger.warning("Staging failed", extra={"file": file, "error": str(e)})
+            if tmpfile is not None:
+                discard(tmpfile)
+        finally:
+            with self.cond:
+                if staged:
+                    self.entries[name] = size
+                    self.staged[file] = name
+                else:
+                    self.pinned.discard(name)
+                self.copying = None
+                self.cond.notify_all()
+
+    def begin(self, file: str):
+        file = os.path.realpath(file)
+        with self.cond:
+            self.started.add(file)
+            if file not in self.staged and self.copying != file:
+                # Jobs that start before the stager reached them can still use a copy from an earlier run
+                try:
+                    name = stage_name(file)
+                except OSError:
+                    name = None
+                if name in self.entries:
+                    self.pinned.add(name)
+                    self.staged[file] = name
+            self.cond.notify_all()
+
+    def source(self, file: str) -> str:
+        """
+        Returns the path ffmpeg should read `file` from: the staged copy if there is one, waiting for a copy
+        that is in progress, otherwise the file itself.
+        """
+        file = os.path.realpath(file)
+        with self.cond:
+            self.cond.wait_for(lambda: self.copying != file)
+            name = self.staged.get(file)
+            if name is None:
+                return file
+            self.entries.move_to_end(name)
+        logger.info("Reading staged copy", extra={"file": file, "staged": name})
+        return os.path.join(self.directory, name)
+
+    def release(self, file: str, keep: bool = False):
+        """
+        Unpins the copy of a finished job. The copy is deleted unless `keep` is set, kept copies are evicted
+        when the space is needed.
+        """
+        file = os.path.realpath(file)
+        with self.cond:
+            name = self.staged.pop(file, None)
+            if name is None:
+                return
+            self.pinned.discard(name)
+            if not keep:
+                discard(os.path.join(self.directory, name))
+                self.entries.pop(name, None)
+                logger.info("Removed staged file", extra={"file": file, "staged": name})
+            self.cond.notify_all()
+
+
+stager: Stager | None = None
+
+
+def start_staging(files: list[str], directory: str, budget: int, ahead: int = 2):
+    global stager
+    stager = Stager(files, directory, budget, ahead)
+    stager.start()
+
+
+def stop_staging():
+    global stager
+    if stager is not None:
+        stager.stop()
+        stager = None
+
+
+def staged_source(file: str) -> str:
+    if stager is None:
+        return os.path.realpath(file)
+    return stager.source(file)
+
+
+def staged(func: Callable[..., str | None]) -> Callable[..., str | None]:
+    """
+    Wraps a job function so the stager knows when a job starts and releases its copy when it ends.
+    """
+
+    @functools.wraps(func)
+    def run(**kwargs) -> str | None:
+        current = stager
+        if current is None:
+            return func(**kwargs)
+        current.begin(kwargs["file"])
+        status = "error"
+        try:
+            status = func(**kwargs) or "done"
+            return status
+        finally:
+            current.release(kwargs["file"], keep=status in KEEP_STATUSES)
+
+    return run
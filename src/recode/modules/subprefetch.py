@@ -0,0 +1,107 @@
+"""
+subprefetch.py
+
+Concurrent prefetch of OpenSubtitles subtitles for series runs.
+
+recode() falls back to OpenSubtitles for episodes without a usable subtitle stream. Instead of four
+sequential requests inside the job, the episodes of a batch that will need external subtitles are found
+from their (cached) probe results before the batch starts, and their subtitles are fetched by a small pool
+in job order, within the request rate and the download quota of the OpenSubtitles client, into the
+subtitle cache. recode() waits for the prefetch of its file, which is usually finished long before the
+episode is encoded, and then takes the subtitle from the cache.
+"""
+
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from recode.modules import api
+from recode.modules.api import OpenSubtitlesToken, fetch_subtitle, get_subtitles_from_ost
+from recode.modules.ffmpeg_utils import probe
+from recode.modules.logger import logger
+from recode.modules.subs import accepts_language
+
+
+def needs_subtitles(job: dict) -> bool:
+    """
+    Returns True if recode() would fetch external subtitles for a job: a series episode without a subtitle
+    stream it keeps and without a subtitle directory.
+    """
+    if job.get("subdir") or not (job.get("metadata") or {}).get("show"):
+        return False
+    token = job.get("apitokens", {}).get("opensub") or {}
+    if token.get("token") is None:
+        return False
+    ffprobe = probe(os.path.realpath(job["file"]))
+    return not any(
+        stream.codec_type == "subtitle" and stream.codec_name is not None and accepts_language(stream, job["sublang"])
+        for stream in ffprobe.streams or []
+    )
+
+
+class SubtitlePrefetcher:
+    """
+    Args:
+        workers (int): Number of episodes handled at the same time.
+    """
+
+    def __init__(self, workers: int = 4):
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="recode-subs")
+        self.futures: dict[str, Future] = {}
+
+    def submit(self, jobs: list[dict]):
+        for job in jobs:
+            self.futures[os.path.realpath(job["file"])] = self.pool.submit(self.prefetch, job)
+        logger.info("Prefetching subtitles", extra={"jobs": len(jobs)})
+
+    def prefetch(self, job: dict) -> tuple[bool, bool]:
+        """Returns whether the job needs a subtitle and whether one was found."""
+        try:
+            if not needs_subtitles(job):
+                return False, False
+            return True, fetch_subtitle(job["apitokens"]["opensub"], job["metadata"], job["sublang"], job["file"]) is not None
+        except Exception as e:  # the job fetches inline again and reports the error there
+            logger.warning("Subtitle prefetch failed", extra={"file": job["file"], "error": str(e)})
+            raise
+
+    def result(self, file: str) -> Future | None:
+        return self.futures.get(os.path.realpath(file))
+
+    def stop(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+prefetcher: SubtitlePrefetcher | None = None
+
+
+def start_subtitle_prefetch(jobs: list[dict], workers: int = 4):
+    global prefetcher
+    jobs = [job for job in jobs if (job.get("metadata") or {}).get("show") and not job.get("subdir")]
+    # Prefetched subtitles are handed over through the cache
+    if not jobs or api.subtitle_cache is None:
+        return
+    prefetcher = SubtitlePrefetcher(workers)
+    prefetcher.submit(jobs)
+
+
+def stop_subtitle_prefetch():
+    global prefetcher
+    if prefetcher is not None:
+        prefetcher.stop()
+        prefetcher = None
+
+
+def prefetched_subtitles(token: OpenSubtitlesToken, metadata: dict, lang: str, file: str) -> str | None:
+    """
+    Returns a temp file with the subtitle of `file`, taken from the cache after its prefetch finished or
+    fetched inline if it was not prefetched.
+    """
+    future = prefetcher.result(file) if prefetcher is not None else None
+    if future is not None and not future.cancelled():
+        try:
+            needed, found = future.result()
+        except Exception:
+            needed, found = False, False
+        # Episodes the prefetch did not handle are fetched inline
+        if needed and not found:
+            return None
+    return get_subtitles_from_ost(token=token, metadata=metadata, lang=lang, file=file)
@@ -9,6 +9,12 @@ from recode.modules.logger import logger
 SUBTITLE_PRIORITY = {"forced": 4, "full": 3, "none": 1}
 
 
+def accepts_language(stream: Stream, lang: str) -> bool:
+    """Returns True if a subtitle stream in this language is kept in the output."""
+    language = stream.tags.language if stream.tags is not None else None
+    return language in ["eng", "ger", "deu", "und", None, lang]
+
+
 def subtitles(
     stream: Stream,
     ffmpeg_mapping: list,
@@ -29,7 +35,7 @@ def subtitles(
     )
     if stream.tags is None:
         stream.tags = StreamTags.from_dict({"title": None})
-    if stream.tags.language in ["eng", "ger", "deu", "und", None, lang]:
+    if accepts_language(stream, lang):
         if stream.codec_name in ["subrip", "hdmv_pgs_subtitle", "ass", "dvd_subtitle"]:
             ffmpeg_mapping.extend(["-map", f"{file}:{stream.index}"])
             ffmpeg_recoding.extend([f"-c:s:{sindex}", "copy"])
@@ -0,0 +1,181 @@
+"""
+tempfiles.py
+
+Scratch files for encodes and atomic publishing of finished outputs.
+
+Encodes are written to a hidden `.recode-<host>-<pid>-<random>.part` file next to their destination, so the
+finished file only has to be renamed, or below a configurable scratch root. A published file appears
+under its final name in one atomic step, readers never see a half written output.
+
+Temp files of a process on this host that is no longer running are leftovers of a crash and are removed
+by recover_orphans(), once per directory and run. Output directories are often shared, the temp files of
+other hosts are left alone since their processes can't be checked from here.
+
+move_file() is the move engine for outputs and library reorganisation: a rename where possible, otherwise
+a reflink clone or in-kernel copy into a temp file at the destination that is then renamed into place.
+"""
+
+import errno
+import os
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+from colorama import Fore as Color
+from colorama import Style
+
+from recode.modules.FileOperations import copy_file
+from recode.modules.logger import logger
+from recode.modules.progress import human_readable_size
+
+TEMP_PREFIX = ".recode-"
+# Not a media extension, so temp files never show up as input files of a scan
+TEMP_SUFFIX = ".part"
+# The host name can't contain "-", it separates the host from the pid
+HOST = re.sub(r"[^A-Za-z0-9_.]", "_", socket.gethostname()) or "localhost"
+TEMP_PATTERN = re.compile(r"^\.recode-(?:(?P<host>[^-]+)-)?(?P<pid>\d+)-.*\.part$")
+# Temp files of older versions have no host, they are only removed once nothing wrote to them for this long
+LEGACY_ORPHAN_AGE = 24 * 3600
+
+swept: set[str] = set()
+swept_lock = threading.Lock()
+
+
+def temp_output(output_file: str, scratch: str | None = None) -> str:
+    """
+    Creates an empty temp file for an encode, next to `output_file` unless a scratch root is given.
+
+    Returns:
+        str: The path of the temp file. No file descriptor is left open.
+    """
+    directory = scratch or os.path.dirname(os.path.realpath(output_file))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmpfile = tempfile.mkstemp(prefix=f"{TEMP_PREFIX}{HOST}-{os.getpid()}-", suffix=TEMP_SUFFIX, dir=directory)
+    os.close(fd)
+    logger.info("Created temporary file", extra={"tmpfile": tmpfile})
+    return tmpfile
+
+
+def move_file(src: str, dst: str) -> str:
+    """
+    Moves a file, replacing `dst` atomically. Tries a rename first; across filesystems, bind mounts or
+    subvolumes the data is copied next to `dst` by copy_file() (reflink, copy_file_range, buffered copy)
+    and renamed into place, the source is only removed after the size of the copy has been verified.
+
+    Returns:
+        str: The method that moved the file ("rename", "reflink", "copy_file_range" or "buffered").
+    """
+    try:
+        os.replace(src, dst)
+        logger.info("Renamed file", extra={"from": src, "to": dst})
+        return "rename"
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    if os.path.isdir(src):
+        shutil.move(src, dst)
+        return "shutil"
+
+    size = os.path.getsize(src)
+    start = time.perf_counter()
+    staged = temp_output(dst)
+    try:
+        method = copy_file(src, staged)
+        os.replace(staged, dst)
+    except BaseException:
+        discard(staged)
+        raise
+    os.remove(src)
+    seconds = time.perf_counter() - start
+    throughput = size / seconds if seconds > 0 else 0
+    logger.info(
+        "Moved file across filesystems",
+        extra={"from": src, "to": dst, "method": method, "size": size, "seconds": round(seconds, 3), "throughput": int(throughput)},
+    )
+    print(
+        f"{Color.LIGHTBLACK_EX}Moved {human_readable_size(size)} with {method} in {seconds:.1f}s "
+        f"({human_readable_size(throughput)}/s){Style.RESET_ALL}"
+    )
+    return method
+
+
+def publish(tmpfile: str, output_file: str, mode: int = 0o644):
+    """
+    Moves a finished temp file to its destination in one atomic rename. A temp file on another filesystem
+    is first copied next to the destination by move_file(), so the final step is still a rename.
+    """
+    os.chmod(tmpfile, mode)
+    move_file(tmpfile, output_file)
+    logger.info("Published output", extra={"output": output_file})
+
+
+def discard(tmpfile: str):
+    try:
+        os.remove(tmpfile)
+    except FileNotFoundError:
+        pass
+
+
+def process_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        # os.kill(pid, 0) is not a liveness check on Windows, keep the file
+        return True
+    return True
+
+
+def orphaned(directory: str, name: str) -> bool:
+    match = TEMP_PATTERN.match(name)
+    if match is None:
+        return False
+    host = match.group("host")
+    if host is None:
+        try:
+            age = time.time() - os.path.getmtime(os.path.join(directory, name))
+        except OSError:
+            return False
+        return age > LEGACY_ORPHAN_AGE and not process_alive(int(match.group("pid")))
+    return host == HOST and not process_alive(int(match.group("pid")))
+
+
+def recover_orphans(directory: str) -> int:
+    """
+    Removes temp files in a directory that were left behind by recode processes of this host that are not
+    running anymore. Every directory is only swept once per run.
+
+    Returns:
+        int: The number of removed files.
+    """
+    directory = os.path.realpath(directory)
+    with swept_lock:
+        if directory in swept:
+            return 0
+        swept.add(directory)
+    removed = 0
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return 0
+    for name in names:
+        if not orphaned(directory, name):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError as e:
+            logger.warning("Could not remove orphaned temp file", extra={"file": path, "error": str(e)})
+            continue
+        logger.info("Removed orphaned temp file", extra={"file": path, "size": size})
+        removed += 1
+    return removed
@@ -0,0 +1,230 @@
+"""
+throughput.py
+
+Learned encode speed, used to predict how long jobs take.
+
+After every encode recode records the frames per second it achieved, keyed by the target codec, the encoder,
+the resolution class, the source codec and the bit depth. The rate of a key is a moving average, so it
+follows hardware or encoder setting changes within a few runs. Before a batch starts every job is probed
+(the probe cache makes recode reuse these results), its duration is predicted from the learned rate and its
+frame count, the batch is ordered longest job first so short jobs fill the gaps at the end, and the time
+the whole batch takes on the available workers is estimated.
+"""
+
+import heapq
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from recode.modules.cache import CACHE_DIR
+from recode.modules.datatypes import Ffprobe, Stream
+from recode.modules.ffmpeg_utils import probe
+from recode.modules.logger import logger
+from recode.modules.video import video_encoder
+
+THROUGHPUT_DB = os.path.join(CACHE_DIR, "throughput.db")
+# Weight of a new run in the moving average of its key
+ALPHA = 0.3
+# Upper bounds of the resolution classes by frame height
+RESOLUTIONS = [(480, "480p"), (576, "576p"), (720, "720p"), (1080, "1080p"), (1440, "1440p"), (2160, "2160p")]
+
+
+class EncodeKey(NamedTuple):
+    codec: str
+    encoder: str
+    resolution: str
+    source_codec: str
+    bit: int
+
+
+def resolution_class(stream: Stream) -> str:
+    height = stream.height or stream.coded_height or 0
+    # Letterboxed widescreen video is classed by its width, 1920x800 is still 1080p
+    if stream.width:
+        height = max(height, stream.width * 9 // 16)
+    for limit, name in RESOLUTIONS:
+        if height <= limit:
+            return name
+    return "4320p"
+
+
+def frame_rate(rate: str | None) -> float | None:
+    num, _, den = (rate or "").partition("/")
+    try:
+        value = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return value if value > 0 else None
+
+
+def video_frames(ffprobe: Ffprobe, stream: Stream) -> int | None:
+    """
+    Returns the number of frames of a video stream, from the container if it tells, otherwise from the duration.
+    """
+    for count in (stream.nb_frames, stream.tags.number_of_frames if stream.tags is not None else None):
+        if count is not None and count.isdigit() and int(count) > 0:
+            return int(count)
+    fps = frame_rate(stream.avg_frame_rate) or frame_rate(stream.r_frame_rate)
+    duration = stream.duration or ffprobe.format.duration
+    try:
+        return int(float(duration) * fps) if duration is not None and fps is not None else None
+    except ValueError:
+        return None
+
+
+class ThroughputModel:
+    """
+    Args:
+        path (str): Path of the database.
+    """
+
+    def __init__(self, path: str = THROUGHPUT_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS throughput ("
+                "codec TEXT NOT NULL, encoder TEXT NOT NULL, resolution TEXT NOT NULL, source_codec TEXT NOT NULL, "
+                "bit INTEGER NOT NULL, fps REAL NOT NULL, runs INTEGER NOT NULL, updated REAL NOT NULL, "
+                "PRIMARY KEY (codec, encoder, resolution, source_codec, bit))"
+            )
+
+    def record(self, key: EncodeKey, frames: int, seconds: float):
+        if frames <= 0 or seconds <= 0:
+            return
+        fps = frames / seconds
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT fps, runs FROM throughput WHERE codec = ? AND encoder = ? AND resolution = ? AND source_codec = ? AND bit = ?",
+                key,
+            ).fetchone()
+            if row is not None:
+                fps = row[0] * (1 - ALPHA) + fps * ALPHA
+            self.conn.execute(
+                "INSERT OR REPLACE INTO throughput (codec, encoder, resolution, source_codec, bit, fps, runs, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, fps, (row[1] if row is not None else 0) + 1, time.time()),
+            )
+        logger.info("Recorded encode throughput", extra={"key": key._asdict(), "frames": frames, "seconds": round(seconds, 3), "fps": fps})
+
+    def fps(self, key: EncodeKey) -> float | None:
+        """
+        Returns the learned rate of a key. Keys that were never encoded fall back to the average over all
+        source codecs encoded with the same target, encoder, resolution and bit depth.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT fps FROM throughput WHERE codec = ? AND encoder = ? AND resolution = ? AND source_codec = ? AND bit = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                row = self.conn.execute(
+                    "SELECT AVG(fps) FROM throughput WHERE codec = ? AND encoder = ? AND resolution = ? AND bit = ?",
+                    (key.codec, key.encoder, key.resolution, key.bit),
+                ).fetchone()
+        return row[0] if row is not None else None
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+throughput_model: ThroughputModel | None = None
+
+
+def open_throughput_model(path: str = THROUGHPUT_DB):
+    global throughput_model
+    throughput_model = ThroughputModel(path)
+
+
+def encode_key(stream: Stream, encoder: str, codec: str, bit: int) -> EncodeKey:
+    return EncodeKey(codec, encoder, resolution_class(stream), stream.codec_name or "unknown", bit)
+
+
+def record_encode(ffprobe: Ffprobe, index: int, encoder: str, codec: str, bit: int, seconds: float):
+    """
+    Records the rate of a finished encode of the video stream `index` of the source.
+    """
+    if throughput_model is None or ffprobe.streams is None:
+        return
+    stream = next((stream for stream in ffprobe.streams if stream.index == index), None)
+    frames = video_frames(ffprobe, stream) if stream is not None else None
+    if stream is None or frames is None:
+        return
+    try:
+        throughput_model.record(encode_key(stream, encoder, codec, bit), frames, seconds)
+    except sqlite3.Error as e:
+        logger.warning("Could not record encode throughput", extra={"error": str(e)})
+
+
+def predict_job(file: str, hwacc: str | None, codec: str, bit: int, copy: bool) -> float | None:
+    """
+    Returns the predicted encode time of a file in seconds, 0 if no video stream is recoded and None if the
+    rate of one of its encodes is unknown.
+    """
+    if throughput_model is None:
+        return None
+    ffprobe = probe(os.path.realpath(file))
+    seconds = 0.0
+    for stream in ffprobe.streams or []:
+        if stream.codec_type != "video":
+            continue
+        encoder = video_encoder(stream, hwacc, codec, bit, copy)
+        if encoder is None:
+            continue
+        fps = throughput_model.fps(encode_key(stream, encoder, codec, bit))
+        frames = video_frames(ffprobe, stream)
+        if fps is None or frames is None:
+            return None
+        seconds += frames / fps
+    return seconds
+
+
+def predict_jobs(jobs: list[dict], hwacc: str | None, workers: int = 4) -> list[float | None]:
+    """
+    Predicts the encode time of every job, probing the files concurrently.
+    """
+
+    def predict(job: dict) -> float | None:
+        try:
+            return predict_job(job["file"], hwacc, job.get("codec", "h265"), int(job.get("bit", 10)), bool(job.get("copy")))
+        except Exception as e:  # unreadable files fail later in their job, with proper error reporting
+            logger.warning("Could not predict job", extra={"file": job["file"], "error": str(e)})
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="recode-predict") as pool:
+        return list(pool.map(predict, jobs))
+
+
+def longest_first(jobs: list[dict], predictions: list[float | None]) -> tuple[list[dict], list[float | None]]:
+    """
+    Orders jobs by predicted duration, longest first. Jobs without a prediction are estimated from their
+    size at the average seconds per byte of the predicted jobs, or go first if nothing is predicted.
+    """
+    sizes = [os.path.getsize(job["file"]) if os.path.exists(job["file"]) else 0 for job in jobs]
+    known = [(seconds, size) for seconds, size in zip(predictions, sizes, strict=True) if seconds and size]
+    rate = sum(seconds for seconds, _ in known) / sum(size for _, size in known) if known else None
+    keys = [
+        seconds if seconds is not None else size * rate if rate is not None else float("inf")
+        for seconds, size in zip(predictions, sizes, strict=True)
+    ]
+    order = sorted(range(len(jobs)), key=lambda idx: keys[idx], reverse=True)
+    return [jobs[idx] for idx in order], [predictions[idx] for idx in order]
+
+
+def batch_duration(predictions: list[float | None], workers: int = 1) -> float:
+    """
+    Simulates the worker pool: every job starts on the worker that becomes free first. Returns the time
+    until the last predicted job finishes, jobs without a prediction are left out.
+    """
+    free = [0.0] * max(1, workers)
+    for seconds in predictions:
+        if seconds is not None:
+            heapq.heappush(free, heapq.heappop(free) + seconds)
+    return max(free)
@@ -0,0 +1,201 @@
+"""
+tokens.py
+
+Persistent API login tokens.
+
+theTVDB and OpenSubtitles hand out tokens that are valid for a month and a day. Instead of logging in on
+every run, tokens are kept next to the config file together with their expiry and a hash of the credentials
+they belong to. Concurrent recode processes share the file under an exclusive flock, so only the first of
+them logs in and the others reuse its token. A token is only refreshed once it is about to expire or an API
+rejects it with 401; the rejected token is remembered, so every later request of the run uses the new one.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+from recode.modules.logger import logger
+
+# Tokens are not used in their last minutes, a long run would otherwise start with an expiring token
+TOKEN_MARGIN = 600
+# Validity assumed for tokens without an exp claim
+TOKEN_TTLS = {"thetvdb": 28 * 24 * 3600, "opensubtitles": 23 * 3600}
+DEFAULT_TOKEN_TTL = 3600
+
+# A login returns the token and its expiry as a unix time, or (None, None) if it failed
+Login = Callable[[], tuple[str | None, float | None]]
+
+
+def token_path(config: str) -> str:
+    return f"{config}-tokens.json"
+
+
+def credentials_key(*credentials: str | None) -> str:
+    return hashlib.sha1("\0".join(credential or "" for credential in credentials).encode()).hexdigest()
+
+
+def token_expiry(token: str, service: str) -> float:
+    """
+    Returns the expiry of a JWT from its exp claim, or the usual validity of the service's tokens.
+    """
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return time.time() + TOKEN_TTLS.get(service, DEFAULT_TOKEN_TTL)
+
+
+class TokenStore:
+    """
+    Args:
+        path (str): Path of the token file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """
+        Holds the store exclusively, across threads and, where flock exists, across processes.
+        """
+        with self.lock, open(f"{self.path}.lock", "a") as lockfile:
+            try:
+                import fcntl
+            except ImportError:
+                fcntl = None
+            if fcntl is not None:
+                fcntl.flock(lockfile, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+    def read(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable token file", extra={"path": self.path, "error": str(e)})
+            return {}
+
+    def write(self, data: dict):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmpfile = tempfile.mkstemp(dir=directory, prefix=".tokens-")
+        try:
+            # mkstemp creates the file readable by the owner only
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmpfile, self.path)
+        except BaseException:
+            os.unlink(tmpfile)
+            raise
+
+    def token(self, service: str, key: str, login: Login, stale: str | None = None) -> str | None:
+        """
+        Returns the stored token of a service, logging in if there is none, it belongs to other credentials,
+        it expires soon or it is `stale`.
+        """
+        with self.locked():
+            data = self.read()
+            entry = data.get(service)
+            if (
+                entry is not None
+                and entry.get("key") == key
+                and entry.get("expires", 0) > time.time() + TOKEN_MARGIN
+                and entry.get("token") != stale
+            ):
+                logger.info("Reusing stored API token", extra={"service": service, "expires": entry["expires"]})
+                return entry["token"]
+            token, expires = login()
+            if token is None:
+                return None
+            data[service] = {"token": token, "expires": expires or token_expiry(token, service), "key": key}
+            try:
+                self.write(data)
+            except OSError as e:
+                logger.warning("Could not store API token", extra={"path": self.path, "error": str(e)})
+            logger.info("Stored API token", extra={"service": service, "expires": data[service]["expires"]})
+            return token
+
+    def drop(self, service: str):
+        with self.locked():
+            data = self.read()
+            if data.pop(service, None) is not None:
+                self.write(data)
+
+
+token_store: TokenStore | None = None
+logins: dict[str, tuple[str, Login]] = {}
+renewals: dict[str, str] = {}
+renewals_lock = threading.Lock()
+
+
+def open_token_store(config: str):
+    global token_store
+    token_store = TokenStore(token_path(config))
+
+
+def cached_token(service: str, key: str, login: Login) -> str | None:
+    """
+    Returns a valid token of a service, from the token store if possible. The login is remembered for
+    refresh_token().
+
+    Args:
+        service (str): Name of the API.
+        key (str): Hash of the credentials, see credentials_key().
+        login (Callable): Logs in and returns the token and its expiry.
+    """
+    logins[service] = (key, login)
+    if token_store is None:
+        return login()[0]
+    return token_store.token(service, key, login)
+
+
+def renewed(token: str | None) -> str | None:
+    """
+    Returns the token that replaced `token` after a 401, or `token` itself.
+    """
+    with renewals_lock:
+        while token in renewals:
+            token = renewals[token]
+    return token
+
+
+def refresh_token(service: str, stale: str) -> str | None:
+    """
+    Replaces a token an API rejected. Another thread or process may have refreshed it already, then its
+    token is used without logging in again.
+    """
+    if service not in logins:
+        return None
+    with renewals_lock:
+        if stale in renewals:
+            return renewals[stale]
+    key, login = logins[service]
+    logger.info("API token rejected, refreshing", extra={"service": service})
+    token = token_store.token(service, key, login, stale=stale) if token_store is not None else login()[0]
+    if token is not None and token != stale:
+        with renewals_lock:
+            renewals[stale] = token
+    return token
+
+
+def forget_token(service: str):
+    if token_store is None:
+        return
+    try:
+        token_store.drop(service)
+    except OSError as e:
+        logger.warning("Could not remove stored API token", extra={"service": service, "error": str(e)})
@@ -4,6 +4,28 @@ from colorama import Style
 from recode.modules.datatypes import Dispositions, Stream, StreamTags
 from recode.modules.logger import logger
 
+CODECS = {
+    "av1": {"name": "av1", "swenc": "libsvtav1", "amdenc": "av1_amf", "nvdenc": "av1_nvenc"},
+    "h265": {"name": "hevc", "swenc": "libx265", "amdenc": "hevc_amf", "nvdenc": "hevc_nvenc"},
+    "h264": {"name": "h264", "swenc": "libx264", "amdenc": "h264_amf", "nvdenc": "h264_nvenc"},
+}
+
+
+def video_encoder(stream: Stream, hwacc: str | None, codec="av1", bit=10, copy=False) -> str | None:
+    """
+    Returns the encoder a video stream is recoded with, or None if the stream is copied.
+    """
+    codecd = CODECS.get(codec, CODECS["av1"])
+    if copy or stream.disposition.attached_pic:
+        return None
+    if stream.codec_name == codecd["name"] and not (bit == 8 and stream.pix_fmt != "yuv420p"):
+        return None
+    if hwacc == "AMF":
+        return codecd["amdenc"]
+    if hwacc == "CUDA":
+        return codecd["nvdenc"]
+    return codecd["swenc"]
+
 
 def video(
     stream: Stream,
@@ -22,28 +44,14 @@ def video(
         "Processing video stream",
         extra={"index": stream.index, "codec": stream.codec_name, "pix_fmt": stream.pix_fmt, "bit_depth": bit, "target_codec": codec},
     )
-    codecd = {"name": "av1", "swenc": "libsvtav1", "amdenc": "av1_amf", "nvdenc": "av1_nvenc"}
-    if codec == "av1":
-        codecd = {"name": "av1", "swenc": "libsvtav1", "amdenc": "av1_amf", "nvdenc": "av1_nvenc"}
-    elif codec == "h265":
-        codecd = {"name": "hevc", "swenc": "libx265", "amdenc": "hevc_amf", "nvdenc": "hevc_nvenc"}
-    elif codec == "h264":
-        codecd = {"name": "h264", "swenc": "libx264", "amdenc": "h264_amf", "nvdenc": "h264_nvenc"}
+    codecd = CODECS.get(codec, CODECS["av1"])
     if stream.tags is None:
         stream.tags = StreamTags(title=None)
-    if (
-        not copy
-        and (stream.codec_name != codecd["name"] or (bit == 8 and stream.pix_fmt != "yuv420p"))
-        and not stream.disposition.attached_pic
-    ):
+    encoder = video_encoder(stream, hwacc, codec, bit, copy)
+    if encoder is not None:
         logger.info("Setting up video recoding", extra={"hwaccel": hwacc, "target_codec": codecd["name"]})
         ffmpeg_mapping.extend(["-map", f"0:{stream.index}"])
-        if hwacc == "AMF":
-            ffmpeg_recoding.extend([f"-c:v:{vindex}", codecd["amdenc"]])
-        elif hwacc == "CUDA":
-            ffmpeg_recoding.extend([f"-c:v:{vindex}", codecd["nvdenc"]])
-        else:
-            ffmpeg_recoding.extend([f"-c:v:{vindex}", codecd["swenc"]])
+        ffmpeg_recoding.extend([f"-c:v:{vindex}", encoder])
         vrecoding = True
         printlines.append(
             f"Converting {Color.GREEN}video{Style.RESET_ALL} stream {Color.BLUE}0:{stream.index}{Style.RESET_ALL} titled {Color.CYAN}{stream.tags.title}{Style.RESET_ALL} to codec {Color.RED}{codecd['name']} {Color.YELLOW}{stream.pix_fmt}{Style.RESET_ALL} with index {Color.BLUE}v:{vindex}{Style.RESET_ALL} in output file"